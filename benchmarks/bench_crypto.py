@@ -0,0 +1,90 @@
+"""
+Per-request crypto cost of the birdreport client, before and after caching.
+
+Usage: python -m benchmarks.bench_crypto [--number 2000]
+"""
+
+import argparse
+import base64
+import json
+import re
+import timeit
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad, unpad
+
+from src import public_key_file
+from src.birdreport.birdreport import AES_IV, AES_KEY, decrypt
+from src.utils.long_rsa import LongRSAKey
+
+LT1_REGEX = r".{1,117}"
+
+
+def legacy_rsa_encrypt(key: LongRSAKey, message: str) -> str:
+    max_length = (key.rsa_key.n.bit_length() + 7 >> 3) - 11
+    ct_1 = b""
+    if len(message) > max_length:
+        lt = re.findall(LT1_REGEX, message)
+        for i in lt:
+            i = i.encode("utf-8")
+            t1 = key.cipher.encrypt(i)
+            ct_1 += t1
+        return base64.b64encode(ct_1).decode("utf-8")
+    return base64.b64encode(key.cipher.encrypt(message.encode("utf-8"))).decode("utf-8")
+
+
+def legacy_decrypt(text: str) -> str:
+    cipher = AES.new(AES_KEY, AES.MODE_CBC, iv=AES_IV)
+    decrypted = cipher.decrypt(base64.b64decode(text))
+    return unpad(decrypted, AES.block_size).decode("utf-8")
+
+
+def aes_encrypt(message: str) -> str:
+    cipher = AES.new(AES_KEY, AES.MODE_CBC, iv=AES_IV)
+    return base64.b64encode(
+        cipher.encrypt(pad(message.encode("utf-8"), AES.block_size))
+    ).decode("utf-8")
+
+
+def report(name: str, before, after, number: int) -> None:
+    before_cost = timeit.timeit(before, number=number) / number * 1e6
+    after_cost = timeit.timeit(after, number=number) / number * 1e6
+    print(
+        f"{name:<28}{before_cost:>12.1f}us{after_cost:>12.1f}us"
+        f"{before_cost / after_cost:>10.2f}x"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    key = LongRSAKey(public_key_file)
+
+    print(f"{'':<28}{'before':>14}{'after':>14}{'speedup':>10}")
+    for name, message in [
+        ("rsa: short query", json.dumps({"id": "1142574"})),
+        ("rsa: 3 block query", json.dumps({"keywords": "a" * 300})),
+    ]:
+        report(
+            name,
+            lambda: legacy_rsa_encrypt(key, message),
+            lambda: key.encrypt(message),
+            args.number // 10,
+        )
+
+    for name, size in [
+        ("aes: small response", 1),
+        ("aes: 10 reports", 10),
+        ("aes: 200 reports", 200),
+    ]:
+        response = aes_encrypt(
+            json.dumps([{"id": i, "point_name": "上海科技大学"} for i in range(size)])
+        )
+        report(
+            name,
+            lambda: legacy_decrypt(response),
+            lambda: decrypt(response),
+            args.number,
+        )
@@ -0,0 +1,68 @@
+"""
+Import time of the entry modules, from `python -X importtime`, and which of
+the heavy optional dependencies each one pulls in.
+
+Usage: python -m benchmarks.bench_import [--repeat 5] [module ...]
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODULES = ["src", "src.birdreport.birdreport", "src.cli.birdreport", "src.cli.app"]
+HEAVY_MODULES = [
+    "selenium",
+    "PIL",
+    "fuzzywuzzy",
+    "textual_image",
+    "pandas",
+    "numpy",
+]
+
+# import time:     self [us] |    cumulative | imported package
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+
+def import_time(module: str) -> Tuple[float, Dict[str, float]]:
+    """Total ms to import module, and ms spent in each heavy package imported"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0.0
+    heavy: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        own, cumulative, name = match.groups()
+        if name == module:
+            total = int(cumulative) / 1000
+        top_level = name.split(".")[0]
+        if top_level in HEAVY_MODULES:
+            heavy[top_level] = heavy.get(top_level, 0.0) + int(own) / 1000
+    return total, heavy
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    print(f"{'':<28}{'import':>12}  heavy dependencies imported")
+    for module in args.modules:
+        # the fastest run, the others are slowed by a cold disk cache
+        total, heavy = min(
+            (import_time(module) for _ in range(args.repeat)), key=lambda r: r[0]
+        )
+        heavy_text = ", ".join(f"{name} {ms:.0f}ms" for name, ms in heavy.items())
+        print(f"{module:<28}{total:>10.1f}ms  {heavy_text or '-'}")
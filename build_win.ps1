@@ -9,6 +9,10 @@ Write-Output "GITHUB_API_TOKEN=`"$github_api_token`"" >> src/utils/consts.py
 pyinstaller --name commonBird `
     --add-data "common_bird_app.tcss:." `
     --add-data "public_key.pem:." `
+    --hidden-import selenium.webdriver `
+    --hidden-import selenium.common.exceptions `
+    --hidden-import PIL.Image `
+    --hidden-import fuzzywuzzy.fuzz `
     --exclude-module pandas `
     --exclude-module numpy `
     --exclude-module textual-dev `
@@ -1,28 +1,31 @@
 import logging
+import multiprocessing
 import sys
 
 from dotenv import load_dotenv
 
 from src import application_path, env_path
-from src.cli.app import CommonBirdApp
-from textual.logging import TextualHandler
-
-# 创建文件处理器
-file_handler = logging.FileHandler(
-    filename=application_path / "dump.log", mode="w", encoding="utf-8"
-)
-
-# 配置日志
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s %(levelname)s %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[file_handler, TextualHandler()],
-)
 
 logger = logging.getLogger(__name__)
 
 
+def setup_logging():
+    from textual.logging import TextualHandler
+
+    # 创建文件处理器
+    file_handler = logging.FileHandler(
+        filename=application_path / "dump.log", mode="w", encoding="utf-8"
+    )
+
+    # 配置日志
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        handlers=[file_handler, TextualHandler()],
+    )
+
+
 def handle_uncaught_exception(exc_type, exc_value, exc_traceback):
     """
     自定义的异常处理钩子，用于记录未捕获的异常。
@@ -36,14 +39,23 @@ def handle_uncaught_exception(exc_type, exc_value, exc_traceback):
     logger.critical("捕获到未处理的异常", exc_info=(exc_type, exc_value, exc_traceback))
 
 
-sys.excepthook = handle_uncaught_exception
+def main():
+    # 加密进程池中的子进程也会导入本模块，因此副作用只在主进程执行
+    if not env_path.exists():
+        open(env_path, "a").close()
+    load_dotenv(env_path)
 
-if not env_path.exists():
-    open(env_path, "a").close()
-load_dotenv(env_path)
+    # 带参数时以命令行模式运行，不加载界面，例如 `python cli.py export --since 2024-01-01`
+    if len(sys.argv) > 1:
+        from src.cli.batch import main as batch_main
 
+        sys.exit(batch_main(sys.argv[1:]))
+
+    setup_logging()
+    sys.excepthook = handle_uncaught_exception
+
+    from src.cli.app import CommonBirdApp
 
-def main():
     app = CommonBirdApp()
     reply = app.run()
 
@@ -52,4 +64,5 @@ def main():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
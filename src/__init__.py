@@ -3,17 +3,24 @@ import sys
 from pathlib import Path
 from typing import List
 
-from selenium.webdriver.common.driver_finder import DriverFinder
 
-selenium_ori_deiver_finder_to_arg = DriverFinder._to_args
+def patch_selenium_driver_finder(*_) -> None:
+    """Give selenium manager a timeout, called when selenium is first used"""
+    from selenium.webdriver.common.driver_finder import DriverFinder
 
-def selenium_ori_deiver_finder_to_arg_patch(self):
-    args: List = selenium_ori_deiver_finder_to_arg(self)
-    args.append("--timeout")
-    args.append("20")
-    return args
+    if getattr(DriverFinder._to_args, "patched", False):
+        return
+    selenium_ori_deiver_finder_to_arg = DriverFinder._to_args
+
+    def selenium_ori_deiver_finder_to_arg_patch(self):
+        args: List = selenium_ori_deiver_finder_to_arg(self)
+        args.append("--timeout")
+        args.append("20")
+        return args
+
+    selenium_ori_deiver_finder_to_arg_patch.patched = True
+    DriverFinder._to_args = selenium_ori_deiver_finder_to_arg_patch
 
-DriverFinder._to_args = selenium_ori_deiver_finder_to_arg_patch
 
 if getattr(sys, "frozen", False):
     inner_path = Path(sys._MEIPASS)
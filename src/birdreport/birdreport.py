@@ -1,5 +1,4 @@
 import logging
-import multiprocessing
 import hashlib
 import json
 import asyncio
@@ -7,24 +6,85 @@ import time
 import os
 import uuid
 import base64
-from typing import Callable
+from collections import deque
+from contextlib import aclosing
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import httpx
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
 from dotenv import load_dotenv
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
+from tenacity import retry, retry_if_exception_type
 
 from src import public_key_file
-from src.utils.long_rsa import LongRSAKey
+from src.utils.long_rsa import LongRSAKey, LongRSAEncryptEngine
+from src.utils.aes_cbc import AESCBCCipher
+from src.utils.rate_limit import (
+    get_host_limiter,
+    parse_retry_after,
+    stop_after_configured_attempts,
+    wait_backoff_or_retry_after,
+)
+from src.utils.http_client import (
+    create_async_client,
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+    DEFAULT_KEEPALIVE_EXPIRY,
+)
 from src.utils.consts import BirdreportTaxonVersion
 from src.utils.api_exceptions import (
     ApiError,
     AuthenticationError,
     ApiErrorBase,
     NetworkError,
+    RateLimitError,
     ServerError,
 )
+from src.utils.scheduler import (
+    AdaptiveChunkSize,
+    AdaptiveScheduler,
+    DEFAULT_INITIAL_CONCURRENCY,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_RPS,
+    is_congestion,
+)
+from src.utils.response_cache import DAY, ResponseCache, get_response_cache
+
+# payloads at least this long are encrypted / decoded in the crypto pool
+ENCRYPT_OFFLOAD_THRESHOLD = 1024
+DECODE_OFFLOAD_THRESHOLD = 64 * 1024
+
+# pages requested ahead at the same time when walking a paginated search
+PAGE_FETCH_WINDOW = 4
+
+# ids per excel request, adapted within the bounds so that a response carries
+# about EXCEL_TARGET_ROWS observations and arrives within EXCEL_TARGET_LATENCY
+EXCEL_CHUNK_SIZE = 200
+EXCEL_MIN_CHUNK_SIZE = 10
+EXCEL_MAX_CHUNK_SIZE = 1000
+EXCEL_TARGET_LATENCY = 5.0
+EXCEL_TARGET_ROWS = 5000
+
+# finished reports buffered for a slow consumer of iter_reports
+REPORT_QUEUE_SIZE = 100
+
+# how long the responses of rarely changing endpoints are cached
+TAXON_CACHE_TTL = 30 * DAY
+POINT_CACHE_TTL = 7 * DAY
+ACTIVITY_DETAIL_CACHE_TTL = 7 * DAY
+# reports ending earlier than this are considered final and may be cached
+FINISHED_REPORT_AGE = 30 * DAY
+
+AES_KEY = b"C8EB5514AF5ADDB94B2207B08C66601C"
+AES_IV = b"55DD79C6F04E1A67"
 
 
 def raise_last_exception(retry_state):
@@ -32,31 +92,153 @@ def raise_last_exception(retry_state):
     raise retry_state.outcome.exception()
 
 
+def report_congestion(retry_state):
+    """
+    tenacity before_sleep, a 429/5xx retried inside get_data still shrinks
+    the scheduler window, the scheduler would only see the final outcome
+    """
+    instance = retry_state.args[0]
+    if is_congestion(retry_state.outcome.exception()):
+        instance.scheduler.throttled()
+        instance.excel_scheduler.throttled()
+
+
+AES_CIPHER = AESCBCCipher(AES_KEY, AES_IV)
+
+
+def decrypt(text):
+    return AES_CIPHER.decrypt_text(text)
+
+
+def decrypt_json(text):
+    return json.loads(decrypt(text))
+
+
+def decode_response(content: bytes, decrypt_data: bool):
+    """Parse a raw response body, decrypting its data field if needed"""
+    _data = json.loads(content)
+    if decrypt_data:
+        _data = decrypt_json(_data["data"])
+    return _data
+
+
+def is_finished_report_detail(result) -> bool:
+    """Whether a member report detail is old enough to not be edited anymore"""
+    try:
+        end_time = time.strptime(result["data"]["end_time"], "%Y-%m-%d %H:%M:%S")
+    except (KeyError, TypeError, ValueError):
+        return False
+    return time.time() - time.mktime(end_time) > FINISHED_REPORT_AGE
+
+
 class Birdreport:
-    def __init__(self, token: str):
+    def __init__(
+        self,
+        token: str,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+        http2: bool = True,
+        crypto_workers: Optional[int] = None,
+        crypto_use_process: bool = True,
+        encrypt_offload_threshold: int = ENCRYPT_OFFLOAD_THRESHOLD,
+        decode_offload_threshold: int = DECODE_OFFLOAD_THRESHOLD,
+        initial_concurrency: int = DEFAULT_INITIAL_CONCURRENCY,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_rps: Optional[float] = DEFAULT_MAX_RPS,
+        use_response_cache: bool = True,
+    ):
         self.token = token
         self.user_info = None
 
         self.rsa = LongRSAKey(public_key_file)
+        self.rsa_engine = LongRSAEncryptEngine(
+            public_key_file,
+            max_workers=crypto_workers,
+            use_process=crypto_use_process,
+        )
+        self.encrypt_offload_threshold = encrypt_offload_threshold
+        self.decode_offload_threshold = decode_offload_threshold
+
+        self.client_options = {
+            "max_connections": max_connections,
+            "max_keepalive_connections": max_keepalive_connections,
+            "keepalive_expiry": keepalive_expiry,
+            "http2": http2,
+        }
+        self._client: Optional[httpx.AsyncClient] = None
+        self.rate_limiter = get_host_limiter("api.birdreport.cn")
+
+        # shared by every bulk request of this instance
+        self.scheduler = AdaptiveScheduler(
+            initial_concurrency=initial_concurrency,
+            max_concurrency=max_concurrency,
+            max_rps=max_rps,
+        )
+        # the excel chunks grow until a response takes EXCEL_TARGET_LATENCY,
+        # their latency says nothing about congestion and would drag the
+        # window of the small requests down, only 429/5xx shrink this one
+        self.excel_scheduler = AdaptiveScheduler(
+            initial_concurrency=initial_concurrency,
+            max_concurrency=max_concurrency,
+            max_rps=max_rps,
+            latency_tolerance=None,
+        )
+
+        self.response_cache = (
+            get_response_cache()
+            if use_response_cache
+            else ResponseCache(None, enabled=False)
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The pooled client shared by all requests of this instance, created on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = create_async_client(
+                follow_redirects=True, **self.client_options
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.rsa_engine.shutdown()
 
     @classmethod
     async def create(cls, token: str):
         instance = cls(token)
-        user_info = await instance.member_get_user()
+        try:
+            user_info = await instance.member_get_user()
+        except ApiErrorBase:
+            await instance.aclose()
+            raise
         instance.user_info = user_info
         return instance
 
     @classmethod
     async def retrieve_kaptcha(cls):
-        instance = cls("")
-        return await instance.get_kaptcha()
+        async with cls("") as instance:
+            return await instance.get_kaptcha()
 
     @classmethod
     async def login(cls, username, password, code, authToken):
         instance = cls("")
-        result = await instance.get_login_info(username, password, code, authToken)
+        try:
+            result = await instance.get_login_info(username, password, code, authToken)
+        except ApiErrorBase:
+            await instance.aclose()
+            raise
         if result["code"] != 0:
             print(result)
+            await instance.aclose()
             raise AuthenticationError(result["msg"])
         user_info = {"username": result["data"]["username"]}
         token = result["data"]["token"]
@@ -86,17 +268,16 @@ class Birdreport:
     def encrypt(self, text):
         return self.rsa.encrypt(text)
 
-    def encrypt_batch(self, texts):
-        pass
+    async def encrypt_batch(self, texts: List[str]) -> List[str]:
+        return await self.rsa_engine.encrypt_batch_async(texts)
 
     def decrypt(self, text):
-        cipher = AES.new(
-            b"C8EB5514AF5ADDB94B2207B08C66601C", AES.MODE_CBC, iv=b"55DD79C6F04E1A67"
-        )
-        text = base64.b64decode(text)
-        decrypted = cipher.decrypt(text)
-        unpadded = unpad(decrypted, AES.block_size)
-        return unpadded.decode("utf-8")
+        return decrypt(text)
+
+    async def decode_response(self, content: bytes, decrypt_data: bool):
+        if len(content) < self.decode_offload_threshold:
+            return decode_response(content, decrypt_data)
+        return await self.rsa_engine.run(decode_response, content, decrypt_data)
 
     def format(self, data):
         return json.dumps(data).replace(" ", "")
@@ -106,7 +287,6 @@ class Birdreport:
         headers = {
             "Accept": "application/json, text/javascript, */*; q=0.01",
             "Accept-Language": "en,zh-CN;q=0.9,zh;q=0.8,ja;q=0.7,es;q=0.6,es-ES;q=0.5",
-            "Connection": "keep-alive",
             "Content-Type": "application/json",
             "Host": "api.birdreport.cn",
             "Origin": "https://www.birdreport.cn",
@@ -129,7 +309,6 @@ class Birdreport:
         headers = {
             "Accept": "application/json, text/javascript, */*; q=0.01",
             "Accept-Language": "en,zh-CN;q=0.9,zh;q=0.8,ja;q=0.7,es;q=0.6,es-ES;q=0.5",
-            "Connection": "keep-alive",
             "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
             "Host": "api.birdreport.cn",
             "Origin": "https://www.birdreport.cn",
@@ -152,9 +331,10 @@ class Birdreport:
         return headers
 
     async def get_crypt_request_info(self, _data):
-        await asyncio.sleep(0.01)
         format_data = self.format(_data)
-        encrypt_data = self.encrypt(format_data)  # time consuming
+        encrypt_data = await self.rsa_engine.encrypt_async(
+            format_data, inline_threshold=self.encrypt_offload_threshold
+        )
         timestamp = self.getTimestamp()
         request_id = self.getRequestId()
         concat = format_data + request_id + str(timestamp)
@@ -162,6 +342,19 @@ class Birdreport:
         headers = self.get_crypt_headers(request_id, timestamp, sign)
         return headers, encrypt_data
 
+    async def get_crypt_request_info_batch(self, datas: List) -> List[Tuple[Dict, str]]:
+        format_datas = [self.format(_data) for _data in datas]
+        encrypt_datas = await self.encrypt_batch(format_datas)
+        request_infos = []
+        for format_data, encrypt_data in zip(format_datas, encrypt_datas):
+            timestamp = self.getTimestamp()
+            request_id = self.getRequestId()
+            concat = format_data + request_id + str(timestamp)
+            sign = self.md5(concat)
+            headers = self.get_crypt_headers(request_id, timestamp, sign)
+            request_infos.append((headers, encrypt_data))
+        return request_infos
+
     def get_request_info(self, _data):
         format_data = self.format(_data)
         headers = self.get_headers()
@@ -211,16 +404,19 @@ class Birdreport:
         )
         return a
 
-    async def member_get_activity_detail(self, serial_id):
+    async def member_get_activity_detail(self, serial_id, refresh: bool = False):
+        url = "https://api.birdreport.cn/member/system/activity/get"
         params = {
             "id": str(serial_id),
         }
 
-        return await self.get_data(
+        return await self.response_cache.fetch(
+            url,
             params,
-            "https://api.birdreport.cn/member/system/activity/get",
-            encode=False,
-            decode=False,
+            ACTIVITY_DETAIL_CACHE_TTL,
+            lambda: self.get_data(params, url, encode=False, decode=False),
+            should_store=is_finished_report_detail,
+            refresh=refresh,
         )
 
     async def member_get_taxon_stat(self, serial_id):
@@ -257,16 +453,18 @@ class Birdreport:
 
         return result["data"]
 
-    async def member_get_point(self, point_id):
+    async def member_get_point(self, point_id, refresh: bool = False):
+        url = "https://api.birdreport.cn/member/system/point/get"
         params = {
             "point_id": str(point_id),
         }
 
-        result = await self.get_data(
+        result = await self.response_cache.fetch(
+            url,
             params,
-            "https://api.birdreport.cn/member/system/point/get",
-            encode=False,
-            decode=False,
+            POINT_CACHE_TTL,
+            lambda: self.get_data(params, url, encode=False, decode=False),
+            refresh=refresh,
         )
 
         return result["data"]
@@ -295,28 +493,34 @@ class Birdreport:
 
         return result["data"]
 
-    async def member_get_taxon_list(self):
+    async def member_get_taxon_list(self, refresh: bool = False):
+        url = "https://api.birdreport.cn/member/system/taxon/list"
         params = {}
 
-        result = await self.get_data(
+        result = await self.response_cache.fetch(
+            url,
             params,
-            "https://api.birdreport.cn/member/system/taxon/list",
-            encode=False,
-            decode=False,
+            TAXON_CACHE_TTL,
+            lambda: self.get_data(params, url, encode=False, decode=False),
+            refresh=refresh,
         )
 
         return result["data"]
 
-    async def get_taxon_infos_by_version(self, version: BirdreportTaxonVersion):
+    async def get_taxon_infos_by_version(
+        self, version: BirdreportTaxonVersion, refresh: bool = False
+    ):
+        url = "https://api.birdreport.cn/front/excel/selectTaxon"
         params = {
             "version": version.value,
         }
 
-        result = await self.get_data(
+        result = await self.response_cache.fetch(
+            url,
             params,
-            "https://api.birdreport.cn/front/excel/selectTaxon",
-            encode=False,
-            decode=False,
+            TAXON_CACHE_TTL,
+            lambda: self.get_data(params, url, encode=False, decode=False),
+            refresh=refresh,
         )
 
         return result["data"]
@@ -394,48 +598,62 @@ class Birdreport:
         return a
 
     @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_fixed(2),
-        retry=retry_if_exception_type((NetworkError, ServerError)),
+        stop=stop_after_configured_attempts,
+        wait=wait_backoff_or_retry_after,
+        retry=retry_if_exception_type((NetworkError, ServerError, RateLimitError)),
+        before_sleep=report_congestion,
         retry_error_callback=raise_last_exception,
     )
     async def get_data(
-        self, param, url, query=None, encode=True, decode=True, method="POST"
+        self,
+        param,
+        url,
+        query=None,
+        encode=True,
+        decode=True,
+        method="POST",
+        request_info: Optional[Tuple[Dict, str]] = None,
     ):
-        if encode:
+        # request_info is the (headers, payload) prepared in advance, e.g. by a batch encryption
+        if request_info is not None:
+            headers, format_param = request_info
+        elif encode:
             headers, format_param = await self.get_crypt_request_info(param)
         else:
             headers, format_param = self.get_request_info(param)
 
         try:
             print(url, headers, format_param, query)
-            async with httpx.AsyncClient(follow_redirects=True) as client:
-                if method == "POST":
-                    response = await client.post(
-                        url,
-                        headers=headers,
-                        data=format_param if param is not None else None,
-                        params=query,
-                    )
-                elif method == "GET":
-                    response = await client.get(url, headers=headers, params=query)
-                else:
-                    raise ApiError("Invalid method")
+            await self.rate_limiter.acquire()
+            if method == "POST":
+                response = await self.client.post(
+                    url,
+                    headers=headers,
+                    data=format_param if param is not None else None,
+                    params=query,
+                )
+            elif method == "GET":
+                response = await self.client.get(url, headers=headers, params=query)
+            else:
+                raise ApiError("Invalid method")
 
             if response.status_code == 401:
                 raise AuthenticationError("Invalid token")
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                # hold back the other requests to this host as well
+                self.rate_limiter.penalize(retry_after)
+            if response.status_code == 429:
+                raise RateLimitError("Too many requests", retry_after=retry_after)
             if response.status_code >= 500:
                 print(response.content)
-                raise ServerError(f"Server error: {response.status_code}")
+                raise ServerError(
+                    f"Server error: {response.status_code}", retry_after=retry_after
+                )
             if response.status_code >= 400:
                 raise ApiError(f"API error: {response.status_code}")
 
-            if decode:
-                encrypt_res = response.json()
-                _data = json.loads(self.decrypt(encrypt_res["data"]))
-            else:
-                _data = response.json()
-            return _data
+            return await self.decode_response(response.content, decode)
         except ApiErrorBase:
             raise
         except httpx.RequestError as e:
@@ -445,24 +663,83 @@ class Birdreport:
         except Exception as e:
             raise ApiErrorBase(f"An unexpected error occurred: {e}") from e
 
-    async def get_all_report_url_list(self, data, report_api: Callable, limit=50):
-        page = 1
-        limit = limit
-        _data_list = []
-        while 1:
-            try:
-                print(f"正在获取第{page}页")
-                report_list = await report_api(page, limit, **data)
-                for report in report_list:
-                    _data_list.append(report)
-            except Exception as e:
-                logging.error(f"获取报告失败: {e}")
-                continue
-            if len(report_list) == 0:
-                break
-            if len(report_list) < limit:
-                break
-            page += 1
+    async def iter_report_pages(
+        self,
+        data,
+        report_api: Callable,
+        limit=50,
+        window=PAGE_FETCH_WINDOW,
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Yield every page of a search api in page order, as soon as it arrives.
+
+        The first page is fetched alone, if it is full the following pages are
+        probed ahead with at most `window` requests in flight until a page
+        shorter than `limit` shows up. Retries are left to get_data, a failed
+        page aborts the fetch once the pages before it are yielded, unless it
+        lies past the last page and was only probed ahead.
+        """
+
+        async def fetch_page(page):
+            print(f"正在获取第{page}页")
+            return await report_api(page, limit, **data)
+
+        first_page = await fetch_page(1)
+        yield first_page
+        # the first page shorter than limit is the last one
+        if len(first_page) < limit:
+            return
+
+        # pages arrived ahead of the one to yield next
+        pages: Dict[int, List[Dict]] = {}
+        # failed pages, raised when their turn comes
+        errors: Dict[int, BaseException] = {}
+        last_page = None
+        tasks: Dict[asyncio.Task, int] = {}
+        next_page = 2
+        next_yield = 2
+        try:
+            while last_page is None or next_yield <= last_page:
+                if next_yield in pages:
+                    page = pages.pop(next_yield)
+                    next_yield += 1
+                    yield page
+                    continue
+                if next_yield in errors:
+                    raise errors[next_yield]
+                # no more probing after a failure, the pages in flight tell
+                # whether it was past the last page
+                while last_page is None and not errors and len(tasks) < window:
+                    tasks[asyncio.create_task(fetch_page(next_page))] = next_page
+                    next_page += 1
+                done, _ = await asyncio.wait(
+                    tasks.keys(), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    page = tasks.pop(task)
+                    if task.exception() is not None:
+                        logging.error(f"获取第{page}页报告失败: {task.exception()}")
+                        errors[page] = task.exception()
+                        continue
+                    pages[page] = task.result()
+                    if len(pages[page]) < limit and (
+                        last_page is None or page < last_page
+                    ):
+                        last_page = page
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_all_report_url_list(
+        self,
+        data,
+        report_api: Callable,
+        limit=50,
+        window=PAGE_FETCH_WINDOW,
+    ):
+        """Every report of a search api, see iter_report_pages"""
+        pages = self.iter_report_pages(data, report_api, limit=limit, window=window)
+        _data_list = [report async for page in pages for report in page]
         print(f"共获取{len(_data_list)}份报告")
         return _data_list
 
@@ -475,7 +752,142 @@ class Birdreport:
         state="",
         taxon_id="",
     ):
-        params = {
+        point_params, handy_params = self._search_params(
+            start_date=start_date,
+            end_date=end_date,
+            point_name=point_name,
+            serial_id=serial_id,
+            state=state,
+            taxon_id=taxon_id,
+        )
+
+        # each branch fetches its observations as soon as its search is done
+        async def point_branch():
+            reports = await self.get_all_report_url_list(
+                point_params, self.member_search, limit=200
+            )
+            return await self._attach_point_obs(reports)
+
+        async def handy_branch():
+            reports = await self.get_all_report_url_list(
+                handy_params, self.member_handy_search, limit=200
+            )
+            return await self._attach_handy_obs(reports)
+
+        point_checklists, handy_checklists = await asyncio.gather(
+            point_branch(), handy_branch()
+        )
+        checklists = {report["id"]: report for report in point_checklists}
+        checklists.update({report["id"]: report for report in handy_checklists})
+        return list(checklists.values())
+
+    async def iter_reports(
+        self,
+        start_date="",
+        end_date="",
+        point_name="",
+        serial_id="",
+        state="",
+        taxon_id="",
+        queue_size=REPORT_QUEUE_SIZE,
+        handy: Optional[bool] = None,
+    ) -> AsyncIterator[Dict]:
+        """
+        Yield the reports of member_get_reports as soon as their observations
+        are attached, point and handy reports mixed in arrival order. `handy`
+        limits them to the handy (True) or the point (False) reports.
+
+        Search pages are only requested when the next excel chunk needs their
+        ids, and at most `queue_size` finished reports wait for the consumer,
+        so a slow consumer holds the fetching back instead of piling up the
+        whole account in memory.
+        """
+        point_params, handy_params = self._search_params(
+            start_date=start_date,
+            end_date=end_date,
+            point_name=point_name,
+            serial_id=serial_id,
+            state=state,
+            taxon_id=taxon_id,
+        )
+        queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # put by a branch when it is done, or the exception it failed with
+        done = object()
+
+        async def branch(search_api, params, excel_api, is_handy):
+            pending: Dict = {}
+
+            async def report_ids():
+                async with aclosing(
+                    self.iter_report_pages(params, search_api, limit=200)
+                ) as pages:
+                    async for page in pages:
+                        for report in page:
+                            pending[report["id"]] = report
+                        yield [report["id"] for report in page]
+
+            try:
+                async with aclosing(
+                    self.iter_excel_chunked(excel_api, report_ids())
+                ) as chunks:
+                    async for chunk, rows in chunks:
+                        checklists = {
+                            report_id: pending.pop(report_id) for report_id in chunk
+                        }
+                        self._attach_excel_rows(checklists, rows)
+                        for checklist in checklists.values():
+                            if is_handy:
+                                self._locate_handy_report(checklist)
+                            await queue.put(checklist)
+            except Exception as e:
+                await queue.put(e)
+            else:
+                await queue.put(done)
+
+        tasks = []
+        if handy is not True:
+            tasks.append(
+                asyncio.create_task(
+                    branch(
+                        self.member_search, point_params, self.member_get_excel, False
+                    )
+                )
+            )
+        if handy is not False:
+            tasks.append(
+                asyncio.create_task(
+                    branch(
+                        self.member_handy_search,
+                        handy_params,
+                        self.member_handy_get_excel,
+                        True,
+                    )
+                )
+            )
+        try:
+            running = len(tasks)
+            while running > 0:
+                item = await queue.get()
+                if item is done:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _search_params(
+        self,
+        start_date="",
+        end_date="",
+        point_name="",
+        serial_id="",
+        state="",
+        taxon_id="",
+    ) -> Tuple[Dict, Dict]:
+        point_params = {
             "start_date": f"{start_date}",
             "end_date": f"{end_date}",
             "point_name": f"{point_name}",
@@ -483,58 +895,207 @@ class Birdreport:
             "state": f"{state}",
             "taxon_id": f"{taxon_id}",
         }
-        checklists = {}
-        point_reports = await self.get_all_report_url_list(
-            params, self.member_search, limit=200
-        )
-        if len(point_reports) != 0:
-            point_checklists = {report["id"]: report for report in point_reports}
-            ids = list(point_checklists.keys())
-            point_excel_data = await self.member_get_excel(ids)
-            for taxon_entry in point_excel_data:
-                checklist = point_checklists[taxon_entry["activity_id"]]
-                if "obs" not in checklist:
-                    checklist["obs"] = []
-                checklist["obs"].append(taxon_entry)
-            checklists.update(point_checklists)
-
-        params = {
+        handy_params = {
             "start_date": f"{start_date}",
             "end_date": f"{end_date}",
             "serial_id": f"{serial_id}",
             "taxon_id": f"{taxon_id}",
         }
-        handy_reports = await self.get_all_report_url_list(
-            params, self.member_handy_search, limit=200
-        )
-        if len(handy_reports) != 0:
-            handy_checklists = {report["id"]: report for report in handy_reports}
-            ids = list(handy_checklists.keys())
-            handy_excel_data = await self.member_handy_get_excel(ids)
-            for taxon_entry in handy_excel_data:
-                checklist = handy_checklists[taxon_entry["activity_id"]]
-                if "obs" not in checklist:
-                    checklist["obs"] = []
-                checklist["obs"].append(taxon_entry)
-            # use the lat, long and city district as those of the report
-            # and assign a psudo-point_name
-            for checklist in handy_checklists.values():
-                first_record = checklist["obs"][0]
-                checklist["city_name"] = (
-                    first_record["city_name"] if "city_name" in first_record else ""
-                )
-                checklist["district_name"] = (
-                    first_record["district_name"]
-                    if "district_name" in first_record
-                    else ""
-                )
-                checklist["latitude"] = first_record["latitude"]
-                checklist["longitude"] = first_record["longitude"]
-                checklist["point_name"] = f"随手记地点-{checklist['start_time']}"
-            checklists.update(handy_checklists)
+        return point_params, handy_params
 
+    async def member_list_reports(
+        self,
+        start_date="",
+        end_date="",
+        point_name="",
+        serial_id="",
+        state="",
+        taxon_id="",
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """The point and the handy reports found by the search apis, without observations"""
+        point_params, handy_params = self._search_params(
+            start_date=start_date,
+            end_date=end_date,
+            point_name=point_name,
+            serial_id=serial_id,
+            state=state,
+            taxon_id=taxon_id,
+        )
+        point_reports, handy_reports = await asyncio.gather(
+            self.get_all_report_url_list(point_params, self.member_search, limit=200),
+            self.get_all_report_url_list(
+                handy_params, self.member_handy_search, limit=200
+            ),
+        )
+        return point_reports, handy_reports
+
+    async def member_attach_obs(
+        self, point_reports: List[Dict], handy_reports: List[Dict]
+    ) -> List[Dict]:
+        """Fetch the observations of the reports into their "obs", returns all of them"""
+        point_checklists, handy_checklists = await asyncio.gather(
+            self._attach_point_obs(point_reports),
+            self._attach_handy_obs(handy_reports),
+        )
+        checklists = {report["id"]: report for report in point_checklists}
+        checklists.update({report["id"]: report for report in handy_checklists})
         return list(checklists.values())
 
+    async def iter_excel_chunked(
+        self,
+        excel_api: Callable,
+        ids: Union[List, AsyncIterable[List]],
+        chunk_size: Optional[AdaptiveChunkSize] = None,
+    ) -> AsyncIterator[Tuple[List, List[Dict]]]:
+        """
+        Fetch the excel rows of ids in chunks through the excel scheduler, yielding
+        every (chunk ids, rows) as soon as it arrives.
+
+        `ids` is a list, or an async iterable of id lists that is only pulled
+        when the next chunk needs more ids. The next chunk is cut when a
+        request finishes, with the size adapted to the rows and latency of the
+        responses so far. A chunk failing with a network or server error once
+        get_data gave up is split in two and requested again, only a single
+        failing id aborts the whole fetch.
+        """
+        if chunk_size is None:
+            chunk_size = AdaptiveChunkSize(
+                EXCEL_CHUNK_SIZE,
+                minimum=EXCEL_MIN_CHUNK_SIZE,
+                maximum=EXCEL_MAX_CHUNK_SIZE,
+                target_latency=EXCEL_TARGET_LATENCY,
+                target_rows=EXCEL_TARGET_ROWS,
+            )
+        loop = asyncio.get_running_loop()
+
+        buffered: deque = deque()
+        if isinstance(ids, list):
+            buffered.extend(ids)
+            id_source = None
+        else:
+            id_source = ids.__aiter__()
+
+        async def fill(size):
+            nonlocal id_source
+            while id_source is not None and len(buffered) < size:
+                try:
+                    buffered.extend(await id_source.__anext__())
+                except StopAsyncIteration:
+                    id_source = None
+
+        async def fetch_chunk(chunk):
+            start = loop.time()
+            rows = await excel_api(chunk)
+            return rows, loop.time() - start
+
+        split_chunks: deque = deque()
+        tasks: Dict[asyncio.Task, List] = {}
+        try:
+            while True:
+                while len(tasks) < max(self.excel_scheduler.concurrency, 1):
+                    if split_chunks:
+                        chunk = split_chunks.popleft()
+                    else:
+                        await fill(chunk_size.size)
+                        if not buffered:
+                            break
+                        chunk = [
+                            buffered.popleft()
+                            for _ in range(min(chunk_size.size, len(buffered)))
+                        ]
+                    task = asyncio.create_task(
+                        self.excel_scheduler.run(fetch_chunk, chunk)
+                    )
+                    tasks[task] = chunk
+                if len(tasks) == 0:
+                    break
+                done, _ = await asyncio.wait(
+                    tasks.keys(), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    chunk = tasks.pop(task)
+                    try:
+                        rows, latency = task.result()
+                    except (NetworkError, ServerError) as e:
+                        if len(chunk) == 1:
+                            raise
+                        logging.warning(
+                            f"获取{len(chunk)}份报告的记录失败，拆分后重试: {e}"
+                        )
+                        chunk_size.shrink()
+                        half = len(chunk) // 2
+                        split_chunks.append(chunk[:half])
+                        split_chunks.append(chunk[half:])
+                        continue
+                    chunk_size.record(len(chunk), len(rows), latency)
+                    yield chunk, rows
+        finally:
+            for task in tasks:
+                task.cancel()
+            if id_source is not None and hasattr(id_source, "aclose"):
+                await id_source.aclose()
+
+    async def get_excel_chunked(
+        self,
+        excel_api: Callable,
+        ids: List,
+        chunk_size: Optional[AdaptiveChunkSize] = None,
+    ) -> List[Dict]:
+        """The excel rows of ids in the order of ids, see iter_excel_chunked"""
+        position = {report_id: i for i, report_id in enumerate(ids)}
+        results = [
+            (position[chunk[0]], rows)
+            async for chunk, rows in self.iter_excel_chunked(
+                excel_api, list(ids), chunk_size=chunk_size
+            )
+        ]
+        return [row for _, rows in sorted(results, key=lambda r: r[0]) for row in rows]
+
+    @staticmethod
+    def _attach_excel_rows(checklists: Dict, rows: List[Dict]) -> None:
+        for taxon_entry in rows:
+            checklist = checklists[taxon_entry["activity_id"]]
+            if "obs" not in checklist:
+                checklist["obs"] = []
+            checklist["obs"].append(taxon_entry)
+
+    @staticmethod
+    def _locate_handy_report(checklist: Dict) -> None:
+        # use the lat, long and city district as those of the report
+        # and assign a psudo-point_name
+        first_record = checklist["obs"][0]
+        checklist["city_name"] = (
+            first_record["city_name"] if "city_name" in first_record else ""
+        )
+        checklist["district_name"] = (
+            first_record["district_name"] if "district_name" in first_record else ""
+        )
+        checklist["latitude"] = first_record["latitude"]
+        checklist["longitude"] = first_record["longitude"]
+        checklist["point_name"] = f"随手记地点-{checklist['start_time']}"
+
+    async def _attach_point_obs(self, point_reports: List[Dict]) -> List[Dict]:
+        if len(point_reports) == 0:
+            return []
+        point_checklists = {report["id"]: report for report in point_reports}
+        point_excel_data = await self.get_excel_chunked(
+            self.member_get_excel, list(point_checklists.keys())
+        )
+        self._attach_excel_rows(point_checklists, point_excel_data)
+        return list(point_checklists.values())
+
+    async def _attach_handy_obs(self, handy_reports: List[Dict]) -> List[Dict]:
+        if len(handy_reports) == 0:
+            return []
+        handy_checklists = {report["id"]: report for report in handy_reports}
+        handy_excel_data = await self.get_excel_chunked(
+            self.member_handy_get_excel, list(handy_checklists.keys())
+        )
+        self._attach_excel_rows(handy_checklists, handy_excel_data)
+        for checklist in handy_checklists.values():
+            self._locate_handy_report(checklist)
+        return list(handy_checklists.values())
+
     async def member_handy_search(
         self, page, limit, start_date="", end_date="", serial_id="", taxon_id=""
     ):
@@ -590,6 +1151,63 @@ class Birdreport:
         print(res)
         return res
 
+    async def _attach_detail_and_taxon(self, report: Dict, is_member: bool) -> Dict:
+        if is_member:
+            id = report["id"]
+            detail = await self.member_get_activity_detail(id)
+            taxons = await self.member_get_taxon_stat(id)
+            detail = detail["data"]
+        else:
+            id = report["reportId"]
+            detail = await self.get_activity_detail(id)
+            taxons = await self.get_taxon(id)
+        print(f"已获取报告[{id}]")
+        report["obs"] = taxons
+        for key, value in detail.items():
+            if value is None:
+                continue
+            report[key] = value
+        return report
+
+    async def iter_taxon_from_reports(
+        self, reports: Iterable[Dict], window: Optional[int] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Yield the reports as soon as their detail and observations are
+        attached, in completion order.
+
+        Reports are only taken from `reports` while fewer than `window`
+        (twice the scheduler window by default) are in flight.
+        """
+        reports = iter(reports)
+        is_member = None
+        tasks = set()
+        try:
+            while True:
+                limit = window or max(self.scheduler.concurrency, 1) * 2
+                for report in reports:
+                    if is_member is None:
+                        is_member = "id" in report
+                    tasks.add(
+                        asyncio.create_task(
+                            self.scheduler.run(
+                                self._attach_detail_and_taxon, report, is_member
+                            )
+                        )
+                    )
+                    if len(tasks) >= limit:
+                        break
+                if len(tasks) == 0:
+                    break
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
     async def get_taxon_from_reports(self, reports):
         if len(reports) <= 0:
             return []
@@ -604,37 +1222,9 @@ class Birdreport:
                 id = item["reportId"]
             id_detail[id] = item
 
-        async def get_detail_and_taxon(self, report, id):
-            if is_member:
-                detail = await self.member_get_activity_detail(id)
-                taxons = await self.member_get_taxon_stat(id)
-                print(f"已获取报告[{id}]")
-                report["obs"] = taxons
-                for key, value in detail["data"].items():
-                    if value is None:
-                        continue
-                    report[key] = value
-            else:
-                detail = await self.get_activity_detail(id)
-                taxons = await self.get_taxon(id)
-                print(f"已获取报告[{id}]")
-                report["obs"] = taxons
-                for key, value in detail.items():
-                    if value is None:
-                        continue
-                    report[key] = value
-
-        # get cpu number
-        cpu_count = multiprocessing.cpu_count()
-        batch_size = cpu_count // 2
-
-        id_detail_items = list(id_detail.items())
-        for i in range(0, len(id_detail), batch_size):
-            tasks = [
-                get_detail_and_taxon(self, report, id)
-                for id, report in id_detail_items[i : i + batch_size]
-            ]
-            await asyncio.gather(*tasks)
+        # the reports are completed in place
+        async for _ in self.iter_taxon_from_reports(id_detail.values()):
+            pass
 
         print(f"已获取{len(id_detail)}份报告")
 
@@ -690,38 +1280,22 @@ class Birdreport:
         )
         return res["data"]
 
-    # async def get_taxon_info_batch(self, ids: List[int]):
-    #     async def gd(headers, data):
-    #         async with httpx.AsyncClient() as client:
-    #             response = await client.post(
-    #                 "https://api.birdreport.cn/front/taxon/get",
-    #                 headers=headers,
-    #                 data=data,
-    #             )
-    #         _data = response.json()
-    #         print(_data)
-    #         return _data["data"]
-
-    #     format_datas = [json.dumps({"id": f"{id}"}).replace(" ", "") for id in ids]
-    #     print(format_datas)
-
-    #     encrypt_datas = self.encrypt_batch(format_datas)
-    #     print(encrypt_datas)
-
-    #     tasks = []
-    #     for encrypt_data in encrypt_datas:
-    #         timestamp = self.getTimestamp()
-    #         request_id = self.getRequestId()
-    #         concat = encrypt_data + request_id + str(timestamp)
-    #         sign = self.md5(concat)
-    #         headers = self.get_crypt_headers(request_id, timestamp, sign)
-
-    #         tasks.append(gd(headers, encrypt_data))
-
-    #     res = await asyncio.gather(*tasks)
-    #     print(res)
-
-    #     return res
+    async def get_taxon_info_batch(self, ids: List[int]):
+        params_list = [{"id": f"{id}"} for id in ids]
+        request_infos = await self.get_crypt_request_info_batch(params_list)
+
+        async def get_taxon_info(item):
+            params, request_info = item
+            return await self.get_data(
+                params,
+                "https://api.birdreport.cn/front/taxon/get",
+                encode=True,
+                decode=False,
+                request_info=request_info,
+            )
+
+        res = await self.scheduler.map(get_taxon_info, zip(params_list, request_infos))
+        return [r["data"] for r in res]
 
 
 if __name__ == "__main__":
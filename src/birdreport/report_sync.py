@@ -0,0 +1,113 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+from typing import TYPE_CHECKING, Callable, Dict, List, NamedTuple, Optional
+
+from src.utils.checklist_store import ChecklistStore
+
+if TYPE_CHECKING:
+    from src.birdreport.birdreport import Birdreport
+
+# reports are often entered days after the birding, a quick sync lists the
+# reports starting this long before the last sync again
+SYNC_OVERLAP_DAYS = 30
+
+
+def content_hash(value) -> str:
+    """Hash of the json of value, independent of the key order"""
+    return hashlib.sha1(
+        json.dumps(
+            value, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+class SyncResult(NamedTuple):
+    # report ids
+    inserted: List
+    updated: List
+    deleted: List
+    # date the listing started from, "" for the whole account
+    since: str
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserted or self.updated or self.deleted)
+
+
+def sync_since(last_update_date: Optional[str], full: bool) -> str:
+    if full or not last_update_date:
+        return ""
+    last_update = datetime.datetime.strptime(last_update_date, "%Y-%m-%d")
+    return (last_update - datetime.timedelta(days=SYNC_OVERLAP_DAYS)).strftime(
+        "%Y-%m-%d"
+    )
+
+
+async def sync_reports(
+    client: "Birdreport",
+    store: ChecklistStore,
+    username: str,
+    update_date: str,
+    full: bool = False,
+    keep: Optional[Callable[[Dict], bool]] = None,
+) -> SyncResult:
+    """
+    Bring the stored reports of username up to date with birdreport.
+
+    The report lists are fetched from SYNC_OVERLAP_DAYS before the last sync
+    on, or entirely when `full`, which costs a request per 200 reports. A
+    quick sync only fetches the observations of the listed reports whose
+    summary hash differs from the stored one. The summaries carry nothing
+    about the observations, so an edit of the observations alone is only
+    detected by a `full` sync, which fetches the observations of every
+    listed report. Stored reports of the listed range missing from the
+    lists, or not kept, are deleted. `update_date` becomes the new last sync
+    date.
+    """
+    since = sync_since(store.last_update_date(username), full)
+    point_reports, handy_reports = await client.member_list_reports(start_date=since)
+    if keep is not None:
+        point_reports = [report for report in point_reports if keep(report)]
+        handy_reports = [report for report in handy_reports if keep(report)]
+
+    stored = await asyncio.to_thread(store.report_hashes, username, since)
+    # hashed before the observations are attached to the summaries
+    summary_hashes: Dict = {}
+    for report in point_reports + handy_reports:
+        summary_hashes[report["id"]] = content_hash(report)
+
+    def changed(report: Dict) -> bool:
+        if full:
+            return True
+        return stored.get(report["id"], (None, None))[0] != summary_hashes[report["id"]]
+
+    reports = await client.member_attach_obs(
+        [report for report in point_reports if changed(report)],
+        [report for report in handy_reports if changed(report)],
+    )
+
+    inserted, updated = [], []
+    hashes = {}
+    for report in reports:
+        report_id = report["id"]
+        hashes[report_id] = (
+            summary_hashes[report_id],
+            content_hash(report.get("obs", [])),
+        )
+        if report_id not in stored:
+            inserted.append(report_id)
+        elif stored[report_id] != hashes[report_id]:
+            updated.append(report_id)
+    deleted = [report_id for report_id in stored if report_id not in summary_hashes]
+
+    await asyncio.to_thread(store.upsert_reports, username, reports, hashes)
+    await asyncio.to_thread(store.delete_reports, deleted)
+    store.set_last_update_date(username, update_date)
+    logging.info(
+        f"Synced reports of {username} since {since or 'the beginning'}: "
+        f"{len(inserted)} new, {len(updated)} updated, {len(deleted)} deleted"
+    )
+    return SyncResult(inserted, updated, deleted, since)
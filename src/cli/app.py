@@ -1,9 +1,11 @@
+import asyncio
 import json
 import logging
 import os
+import threading
 import webbrowser
 import platform
-from typing import Dict, List, Optional, Union, TYPE_CHECKING
+from typing import Dict, Optional, Union, TYPE_CHECKING
 from packaging import version
 
 import httpx
@@ -13,8 +15,17 @@ from textual.containers import VerticalScroll, HorizontalGroup
 from textual.widgets import Footer, Header, Button, Markdown
 from textual.worker import Worker, WorkerState
 
-from src import application_path, database_path, inner_path, cache_path
+from src import application_path, database_path, inner_path
 from src.utils.consts import GITHUB_API_TOKEN, APP_VERSION, DOWNLOAD_URL
+from src.utils.taxon import compile_taxon_map
+from src.utils.hotspot_catalog import HotspotCatalog
+from src.utils.location import load_location_assign, save_location_assign
+from src.utils.location_matcher import LocationMatcher
+from src.utils.reference_db import (
+    EBIRD_TAXONOMY_SOURCE,
+    HOTSPOT_SOURCES,
+    get_reference_db,
+)
 from src.cli.birdreport import BirdreportScreen
 from src.cli.ebird import EbirdScreen
 from src.cli.general import ConfirmScreen, MessageScreen, DisplayScreen
@@ -24,22 +35,51 @@ if TYPE_CHECKING:
     from src.birdreport.birdreport import Birdreport
 
 
+class _ReferenceData:
+    """App attribute that waits for the reference data when it is read"""
+
+    def __set_name__(self, owner, name):
+        self.attr = "_" + name
+
+    def __get__(self, app, owner=None):
+        if app is None:
+            return self
+        app.load_reference_data()
+        return getattr(app, self.attr)
+
+    def __set__(self, app, value):
+        setattr(app, self.attr, value)
+
+
 class CommonBirdApp(App):
     CSS_PATH = inner_path / "common_bird_app.tcss"
 
+    # loaded by a background worker started at mount, reading one before
+    # that finished blocks until it has, see wait_reference_data
+    ebird_cn_hotspots = _ReferenceData()
+    ebird_other_hotspots = _ReferenceData()
+    ebird_hotspots_update_date = _ReferenceData()
+    hotspot_catalog = _ReferenceData()
+    ch4_to_eb_taxon_map = _ReferenceData()
+    ebird_taxon_info = _ReferenceData()
+    location_assign = _ReferenceData()
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
         self.ebird: EBird = None
         self.birdreport: Birdreport = None
 
-        self.ebird_cn_hotspots = None
-        self.ebird_other_hotspots = None
-        self.ebird_hotspots_update_date = None
-        self.ch4_to_eb_taxon_map = None
-        self.ebird_taxon_info = None
-
-        self.location_assign: Dict[str, Union[str, Dict]] = {}
+        self._reference_data_lock = threading.Lock()
+        self._reference_data_loaded = False
+        self._ebird_cn_hotspots = None
+        self._ebird_other_hotspots = None
+        self._ebird_hotspots_update_date = None
+        self._hotspot_catalog = HotspotCatalog([])
+        self._ch4_to_eb_taxon_map = None
+        self._ebird_taxon_info = None
+        self._location_assign: Dict[str, Union[str, Dict]] = {}
+        self._location_matcher: Optional[LocationMatcher] = None
 
         self.first_open = True
         if APP_VERSION == "beta":
@@ -47,18 +87,37 @@ class CommonBirdApp(App):
         else:
             self.version = version.parse(APP_VERSION)
 
-        self.reload_hotspot_info()
+    def load_reference_data(self) -> None:
+        """
+        Load the hotspots, the taxon map, the eBird taxonomy and the location
+        assign cache, once. Blocks while another thread is loading them.
+        """
+        if self._reference_data_loaded:
+            return
+        with self._reference_data_lock:
+            if self._reference_data_loaded:
+                return
+            self._load_reference_data()
+            self._reference_data_loaded = True
+
+    async def wait_reference_data(self) -> None:
+        """Wait for the reference data without blocking the ui"""
+        if not self._reference_data_loaded:
+            await asyncio.to_thread(self.load_reference_data)
+
+    def _load_reference_data(self) -> None:
+        self._reload_hotspot_info()
 
         # all exists or all not exists
         assert all(
             (
-                self.ebird_cn_hotspots,
-                self.ebird_other_hotspots,
+                self._ebird_cn_hotspots,
+                self._ebird_other_hotspots,
             )
         ) or all(
             (
-                not self.ebird_cn_hotspots,
-                not self.ebird_other_hotspots,
+                not self._ebird_cn_hotspots,
+                not self._ebird_other_hotspots,
             )
         )
 
@@ -66,41 +125,17 @@ class CommonBirdApp(App):
             with open(
                 database_path / "ch4_to_eb_taxon_map.json", "r", encoding="utf-8"
             ) as f:
-                self.ch4_to_eb_taxon_map = json.load(f)
+                self._ch4_to_eb_taxon_map = compile_taxon_map(json.load(f))
 
-        if (database_path / "ebird_taxonomy.json").exists():
-            with open(
-                database_path / "ebird_taxonomy.json", "r", encoding="utf-8"
-            ) as f:
-                self.ebird_taxon_info: Optional[List] = json.load(f)
-
-        if (cache_path / "location_assign.json").exists():
-            with open(cache_path / "location_assign.json", "r", encoding="utf-8") as f:
-                cache_data = json.load(f)
-
-                if "version" in cache_data and "data" in cache_data:
-                    self.location_assign = cache_data["data"]
-                else:
-                    # Old format, needs migration
-                    self.location_assign = cache_data
-
-                    # Build a mapping from locName to locId, and subnational1Code|locName to locId
-                    name_to_id = {}
-                    for loc_id, v in self.ebird_cn_hotspots.items():
-                        name_to_id[v["locName"]] = loc_id
-                    for loc_id, v in self.ebird_other_hotspots.items():
-                        name_to_id[v["locName"]] = loc_id
-
-                    result = {}
-                    for k, v in self.location_assign.items():
-                        if isinstance(v, dict):
-                            result[k] = v
-                        elif v in name_to_id:
-                            result[k] = name_to_id[v]
-                        else:
-                            result[k] = v
-                    self.location_assign = result
-                    self.save_location_assign_cache({})
+        reference_db = get_reference_db()
+        reference_db.sync((EBIRD_TAXONOMY_SOURCE,))
+        self._ebird_taxon_info = reference_db.ebird_taxonomy()
+
+        self._location_assign, migrated = load_location_assign(
+            (self._ebird_cn_hotspots, self._ebird_other_hotspots)
+        )
+        if migrated:
+            self._save_location_assign_cache({})
 
     def compose(self) -> ComposeResult:
         yield Header()
@@ -193,8 +228,21 @@ class CommonBirdApp(App):
         elif event.button.id == "exit":
             self.exit()
 
+    @work(group="reference_data")
+    async def preload_reference_data(self) -> None:
+        """Load the reference data while the menu is already shown"""
+        await self.wait_reference_data()
+        if self.version != "beta" and self.ch4_to_eb_taxon_map is None:
+            await self.push_screen_wait(
+                MessageScreen(
+                    "没有找到ch4_to_eb_taxon_map.json文件\n数据迁移可能出现错误\n请检查数据文件是否存在"
+                )
+            )
+
     @work
     async def on_mount(self) -> None:
+        self.preload_reference_data()
+
         github_api_token = os.getenv("GITHUB_API_TOKEN") or GITHUB_API_TOKEN
 
         if self.version == "beta":
@@ -202,13 +250,6 @@ class CommonBirdApp(App):
         elif self.first_open:
             self.first_open = False
 
-            if self.ch4_to_eb_taxon_map is None:
-                await self.push_screen_wait(
-                    MessageScreen(
-                        "没有找到ch4_to_eb_taxon_map.json文件\n数据迁移可能出现错误\n请检查数据文件是否存在"
-                    )
-                )
-
             GITHUB_API_URL = (
                 "https://api.github.com/repos/CKRainbow/commonBird/releases/latest"
             )
@@ -259,61 +300,55 @@ class CommonBirdApp(App):
                         MessageScreen(f"获取最新版本信息失败：{e}")
                     )
 
+    async def on_unmount(self) -> None:
+        if self.birdreport is not None:
+            await self.birdreport.aclose()
+        if self.ebird is not None:
+            await self.ebird.aclose()
+
     def save_location_assign_cache(self, location_assign_cache: dict) -> None:
-        self.location_assign.update(location_assign_cache)
-        self.location_assign = {
-            k: v for k, v in self.location_assign.items() if v is not None
-        }
+        self.load_reference_data()
+        self._save_location_assign_cache(location_assign_cache)
 
-        cache_data = {"version": APP_VERSION, "data": self.location_assign}
+    def _save_location_assign_cache(self, location_assign_cache: dict) -> None:
+        self._location_assign.update(location_assign_cache)
+        self._location_assign = {
+            k: v for k, v in self._location_assign.items() if v is not None
+        }
 
-        with open(cache_path / "location_assign.json", "w", encoding="utf-8") as f:
-            json.dump(cache_data, f, ensure_ascii=False, indent=4)
+        save_location_assign(self._location_assign)
 
     def reload_hotspot_info(self) -> None:
-        if (database_path / "ebird_cn_hotspots.json").exists():
-            with open(
-                database_path / "ebird_cn_hotspots.json", "r", encoding="utf-8"
-            ) as f:
-                data = json.load(f)
-                self.ebird_cn_hotspots: Dict = data["data"]
-                self.ebird_hotspots_update_date = data["last_update_date"]
-
-                # Migrate old format to new format
-                if self.ebird_cn_hotspots and any(
-                    "|" in k for k in self.ebird_cn_hotspots.keys()
-                ):
-                    self.ebird_cn_hotspots = {
-                        v["locId"]: v for v in self.ebird_cn_hotspots.values()
-                    }
-                    data["data"] = self.ebird_cn_hotspots
-                    with open(
-                        database_path / "ebird_cn_hotspots.json", "w", encoding="utf-8"
-                    ) as fw:
-                        json.dump(data, fw, ensure_ascii=False, indent=2)
-
-        if (database_path / "ebird_other_hotspots.json").exists():
-            with open(
-                database_path / "ebird_other_hotspots.json", "r", encoding="utf-8"
-            ) as f:
-                data = json.load(f)
-                self.ebird_other_hotspots: Dict = data["data"]
-                self.ebird_hotspots_update_date = data["last_update_date"]
-
-                # Migrate old format to new format
-                if self.ebird_other_hotspots and any(
-                    "|" in k for k in self.ebird_other_hotspots.keys()
-                ):
-                    self.ebird_other_hotspots = {
-                        v["locId"]: v for v in self.ebird_other_hotspots.values()
-                    }
-                    data["data"] = self.ebird_other_hotspots
-                    with open(
-                        database_path / "ebird_other_hotspots.json",
-                        "w",
-                        encoding="utf-8",
-                    ) as fw:
-                        json.dump(data, fw, ensure_ascii=False, indent=2)
+        self.load_reference_data()
+        with self._reference_data_lock:
+            self._reload_hotspot_info()
+
+    def _reload_hotspot_info(self) -> None:
+        reference_db = get_reference_db()
+        reference_db.sync(HOTSPOT_SOURCES)
+        # rows are decoded from the reference database when first read
+        self._ebird_cn_hotspots = reference_db.hotspots("ebird_cn_hotspots")
+        self._ebird_other_hotspots = reference_db.hotspots("ebird_other_hotspots")
+        for source in HOTSPOT_SOURCES:
+            if reference_db.has_source(source):
+                self._ebird_hotspots_update_date = reference_db.last_update_date(source)
+
+        # shared by every screen until the next reload
+        self._hotspot_catalog = HotspotCatalog(
+            [self._ebird_cn_hotspots, self._ebird_other_hotspots]
+        )
+
+    async def location_matcher(self) -> LocationMatcher:
+        """The matcher of the current hotspot catalog, built in a thread once"""
+        await self.wait_reference_data()
+        catalog = self.hotspot_catalog
+        # a reload of the hotspots replaces the catalog
+        if (
+            self._location_matcher is None
+            or self._location_matcher.catalog is not catalog
+        ):
+            self._location_matcher = await asyncio.to_thread(LocationMatcher, catalog)
+        return self._location_matcher
 
     def on_worker_state_changed(self, event: Worker.StateChanged) -> None:
         if event.worker.state is WorkerState.ERROR:
@@ -0,0 +1,360 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import abc
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    TextIO,
+    Union,
+)
+
+import pytz
+
+from src import application_path, database_path
+from src.birdreport.birdreport import Birdreport
+from src.birdreport.report_sync import sync_reports
+from src.utils.api_exceptions import ApiErrorBase, AuthenticationError
+from src.utils.checklist_store import get_checklist_store
+from src.utils.ebird_export import export_reports
+from src.utils.hotspot_catalog import HotspotCatalog
+from src.utils.location import (
+    AB_LOCATION,
+    load_location_assign,
+    save_location_assign,
+)
+from src.utils.reference_db import (
+    EBIRD_TAXONOMY_SOURCE,
+    HOTSPOT_SOURCES,
+    get_reference_db,
+)
+from src.utils.taxon import CompiledTaxonMap, compile_taxon_map
+
+TOKEN_NAME = "BIRDREPORT_TOKEN"
+
+EXIT_OK = 0
+EXIT_FAILURE = 1
+# also used by argparse for invalid arguments
+EXIT_USAGE = 2
+EXIT_AUTH = 3
+EXIT_API = 4
+
+# reports fetched between two progress events
+PROGRESS_INTERVAL = 100
+
+# --type -> the handy argument of Birdreport.iter_reports
+REPORT_TYPES = {"all": None, "point": False, "handy": True}
+
+
+class ProgressWriter:
+    """Events as one json object per line, for the scripts running an export"""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+
+    def emit(self, event: str, **fields) -> None:
+        self.stream.write(
+            json.dumps(
+                {"event": event, "time": round(time.time(), 3), **fields},
+                ensure_ascii=False,
+            )
+            + "\n"
+        )
+        self.stream.flush()
+
+
+class ExportReference(NamedTuple):
+    ch4_to_eb_taxon_map: Optional[CompiledTaxonMap]
+    ebird_taxon_info: Optional[Mapping[str, Dict]]
+    hotspot_catalog: HotspotCatalog
+    location_assign: Dict[str, Union[str, Dict]]
+
+
+def load_export_reference() -> ExportReference:
+    """The reference data the migration screens use, read the same way"""
+    reference_db = get_reference_db()
+    reference_db.sync(HOTSPOT_SOURCES + (EBIRD_TAXONOMY_SOURCE,))
+    hotspot_maps = [reference_db.hotspots(source) for source in HOTSPOT_SOURCES]
+
+    ch4_to_eb_taxon_map = None
+    if (database_path / "ch4_to_eb_taxon_map.json").exists():
+        with open(
+            database_path / "ch4_to_eb_taxon_map.json", "r", encoding="utf-8"
+        ) as f:
+            ch4_to_eb_taxon_map = compile_taxon_map(json.load(f))
+
+    location_assign, migrated = load_location_assign(hotspot_maps)
+    if migrated:
+        save_location_assign(location_assign)
+
+    return ExportReference(
+        ch4_to_eb_taxon_map,
+        reference_db.ebird_taxonomy(),
+        HotspotCatalog(hotspot_maps),
+        location_assign,
+    )
+
+
+def parse_date(value: str) -> str:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日期格式应为 YYYY-MM-DD: {value}")
+
+
+def next_day(date: str) -> str:
+    return (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).strftime(
+        "%Y-%m-%d"
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="commonBird", description="不带参数运行时启动交互界面"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    export = subparsers.add_parser(
+        "export",
+        help="将观鸟记录中心的记录导出为eBird导入文件，无需交互",
+        description="进度以每行一个 json 对象输出到标准输出，退出码："
+        f"{EXIT_OK} 成功，{EXIT_FAILURE} 未知错误，{EXIT_USAGE} 参数错误，"
+        f"{EXIT_AUTH} Token 无效，{EXIT_API} 接口请求失败",
+    )
+    export.add_argument(
+        "--since", type=parse_date, help="起始日期 YYYY-MM-DD，包含当天"
+    )
+    export.add_argument(
+        "--until", type=parse_date, help="结束日期 YYYY-MM-DD，包含当天"
+    )
+    export.add_argument(
+        "--type", choices=list(REPORT_TYPES), default="all", help="记录类型"
+    )
+    export.add_argument(
+        "--out", type=Path, default=application_path, help="csv 文件的输出目录"
+    )
+    export.add_argument(
+        "--token", help=f"观鸟记录中心 Token，默认读取 .env 中的 {TOKEN_NAME}"
+    )
+    export.add_argument(
+        "--incremental",
+        action="store_true",
+        help="与本地记录库同步，只导出新增或有变化的记录；"
+        "只修改了鸟种记录的报告不会被发现，需要加上 --full",
+    )
+    export.add_argument(
+        "--full",
+        action="store_true",
+        help="与 --incremental 一起使用，核对全部记录而非近期记录，"
+        "并重新下载全部记录的鸟种以发现只修改了鸟种的报告",
+    )
+    export.add_argument(
+        "--skip-unassigned",
+        action="store_true",
+        help="跳过地点分配缓存中没有对应eBird地点的记录",
+    )
+    export.add_argument(
+        "--verbose", action="store_true", help="将请求与日志输出到标准错误"
+    )
+    return parser
+
+
+def report_filter(
+    args: argparse.Namespace,
+    reference: ExportReference,
+    unassigned_points: Set[str],
+) -> Callable[[Dict], bool]:
+    """The reports to export, collecting the points without an assignment"""
+    handy = REPORT_TYPES[args.type]
+    until = next_day(args.until) if args.until else ""
+
+    def is_assigned(point_name: str) -> bool:
+        assigned = reference.location_assign.get(point_name)
+        return isinstance(assigned, dict) or (
+            assigned is not None and assigned in reference.hotspot_catalog
+        )
+
+    def keep(report: Dict) -> bool:
+        if report.get("province_name") not in AB_LOCATION.values():
+            return False
+        start_time = report["start_time"]
+        if args.since and start_time < args.since:
+            return False
+        if until and start_time >= until:
+            return False
+        if handy is not None and ("latitude" in report) != handy:
+            return False
+        if not is_assigned(report["point_name"]):
+            unassigned_points.add(report["point_name"])
+            if args.skip_unassigned:
+                return False
+        return True
+
+    return keep
+
+
+async def report_progress(
+    reports: Union[AsyncIterable[Dict], Iterable[Dict]], progress: ProgressWriter
+) -> AsyncIterator[Dict]:
+    count = 0
+
+    async def iterate():
+        if isinstance(reports, abc.AsyncIterable):
+            async for report in reports:
+                yield report
+        else:
+            for report in reports:
+                yield report
+
+    async for report in iterate():
+        count += 1
+        if count % PROGRESS_INTERVAL == 0:
+            progress.emit("progress", fetched=count)
+        yield report
+    progress.emit("fetched", fetched=count)
+
+
+async def run_export(args: argparse.Namespace, progress: ProgressWriter) -> int:
+    token = args.token or os.getenv(TOKEN_NAME)
+    if not token:
+        progress.emit("error", code=EXIT_AUTH, message=f"未提供 {TOKEN_NAME}")
+        return EXIT_AUTH
+
+    try:
+        client = await Birdreport.create(token)
+    except AuthenticationError as e:
+        progress.emit("error", code=EXIT_AUTH, message=f"Token 无效: {e.message}")
+        return EXIT_AUTH
+    except ApiErrorBase as e:
+        progress.emit("error", code=EXIT_API, message=f"获取用户信息失败: {e.message}")
+        return EXIT_API
+
+    async with client:
+        username = client.user_info["username"]
+        update_date = datetime.now(pytz.timezone("Asia/Shanghai")).strftime("%Y-%m-%d")
+        progress.emit(
+            "start",
+            username=username,
+            since=args.since,
+            until=args.until,
+            type=args.type,
+            incremental=args.incremental,
+        )
+
+        reference = await asyncio.to_thread(load_export_reference)
+        if reference.ch4_to_eb_taxon_map is None:
+            progress.emit("warning", message="没有找到ch4_to_eb_taxon_map.json文件")
+        unassigned_points: Set[str] = set()
+        keep = report_filter(args, reference, unassigned_points)
+
+        try:
+            if args.incremental:
+                store = get_checklist_store()
+                result = await sync_reports(
+                    client,
+                    store,
+                    username,
+                    update_date,
+                    full=args.full,
+                    keep=lambda x: x.get("province_name") in AB_LOCATION.values(),
+                )
+                progress.emit(
+                    "synced",
+                    since=result.since,
+                    inserted=len(result.inserted),
+                    updated=len(result.updated),
+                    deleted=len(result.deleted),
+                )
+                reports = await asyncio.to_thread(
+                    store.get_reports, result.inserted + result.updated
+                )
+            else:
+                reports = client.iter_reports(
+                    start_date=args.since or "",
+                    end_date=next_day(args.until) if args.until else "",
+                    handy=REPORT_TYPES[args.type],
+                )
+
+            args.out.mkdir(parents=True, exist_ok=True)
+            paths, stats = await export_reports(
+                report_progress(reports, progress),
+                lambda i: args.out / f"{username}_{update_date}_checklists_{i}.csv",
+                ch4_to_eb_taxon_map=reference.ch4_to_eb_taxon_map,
+                ebird_taxon_info=reference.ebird_taxon_info,
+                location_assign=reference.location_assign,
+                hotspot_catalog=reference.hotspot_catalog,
+                keep=keep,
+            )
+        except AuthenticationError as e:
+            progress.emit("error", code=EXIT_AUTH, message=f"Token 无效: {e.message}")
+            return EXIT_AUTH
+        except ApiErrorBase as e:
+            progress.emit("error", code=EXIT_API, message=f"获取报告失败: {e.message}")
+            return EXIT_API
+
+    if unassigned_points:
+        progress.emit(
+            "warning",
+            message="部分地点没有分配eBird地点",
+            skipped=args.skip_unassigned,
+            unassigned_points=sorted(unassigned_points),
+        )
+    progress.emit(
+        "done",
+        exported=stats["write"].emitted,
+        files=[str(path) for path in paths],
+        stages={
+            name: {
+                "received": stage.received,
+                "emitted": stage.emitted,
+                "busy": round(stage.busy, 3),
+                "throughput": round(stage.throughput, 1),
+            }
+            for name, stage in stats.items()
+        },
+    )
+    return EXIT_OK
+
+
+def main(argv: List[str]) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help(sys.stderr)
+        return EXIT_USAGE
+    if args.full and not args.incremental:
+        # exits with EXIT_USAGE
+        parser.error("--full 需要与 --incremental 一起使用")
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stderr,
+    )
+    progress = ProgressWriter(sys.stdout)
+    # the api client prints every request, keep them off the progress stream
+    with open(os.devnull, "w") as devnull, redirect_stdout(
+        sys.stderr if args.verbose else devnull
+    ):
+        try:
+            return asyncio.run(run_export(args, progress))
+        except Exception as e:
+            logging.exception("导出失败")
+            progress.emit("error", code=EXIT_FAILURE, message=str(e))
+            return EXIT_FAILURE
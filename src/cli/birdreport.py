@@ -4,17 +4,11 @@ import logging
 import os
 import io
 import asyncio
-import csv
-import time
 import pytz
 import platform
-from typing import Dict, Optional, Union, TYPE_CHECKING
-from datetime import datetime
-from pathlib import Path
+from typing import Dict, Set, Union, TYPE_CHECKING
+from datetime import datetime, timedelta
 
-from PIL import Image as PILImage
-from selenium.common.exceptions import WebDriverException
-from selenium import webdriver
 from textual import on, work
 from textual.app import ComposeResult
 from textual.screen import Screen, ModalScreen
@@ -31,19 +25,26 @@ from textual.widgets import (
     ListView,
     ListItem,
 )
-from textual_image.widget import Image
 from textual.worker import Worker, WorkerState
-from fuzzywuzzy.fuzz import partial_ratio
-from selenium import webdriver
 
-from src import application_path
+# not lazy, it queries the terminal on import which fails once textual runs
+from textual_image.widget import Image
+
+from src import application_path, patch_selenium_driver_finder
 from src.birdreport.birdreport import Birdreport
+from src.birdreport.report_sync import sync_reports
 from src.utils.location import (
     EBIRD_REGION_CODE_TO_NAME,
-    NAME_TO_EBIRD_REGION_CODE,
     AB_LOCATION,
 )
-from src.utils.taxon import convert_taxon_z4_ebird
+from src.utils.checklist_store import get_checklist_store
+from src.utils.ebird_export import (
+    export_reports,
+    get_report_eb_region_code,
+)
+from src.utils.lazy_import import lazy_import
+from src.utils.location_matcher import LocationPoint
+from src.utils.spatial_index import parse_coordinates
 from src.utils.token import store_token, check_token
 from src.utils.api_exceptions import ApiErrorBase, AuthenticationError
 from src.cli.general import (
@@ -58,20 +59,14 @@ from src.cli.ebird import EbirdScreen
 if TYPE_CHECKING:
     from src.cli.app import CommonBirdApp
 
+# only the kaptcha login and the browser token flow need these
+PILImage = lazy_import("PIL.Image")
+webdriver = lazy_import("selenium.webdriver", on_load=patch_selenium_driver_finder)
+selenium_exceptions = lazy_import("selenium.common.exceptions")
 
-def get_report_eb_region_code(province, city, district):
-    logging.debug(f"get_report_eb_region_code: {province}, {city}, {district}")
-    if province == "台湾省":
-        if city in NAME_TO_EBIRD_REGION_CODE:
-            return NAME_TO_EBIRD_REGION_CODE[city]
-        elif district in NAME_TO_EBIRD_REGION_CODE:
-            return NAME_TO_EBIRD_REGION_CODE[district]
-        else:
-            return ""
-    elif province in NAME_TO_EBIRD_REGION_CODE:
-        return NAME_TO_EBIRD_REGION_CODE[province]
-    else:
-        return ""
+HOTSPOT_SEARCH_LIMIT = 50
+# seconds without typing before searching
+HOTSPOT_SEARCH_DEBOUNCE = 0.3
 
 
 class BirdreportSearchReportScreen(Screen):
@@ -113,21 +108,13 @@ class BirdreportSearchReportScreen(Screen):
 
 
 class SearchEbirdHotspotScreen(ModalScreen):
-    def __init__(self, point_name, province, **kwargs):
+    def __init__(self, point_name, province, coordinates=None, **kwargs):
         super().__init__(kwargs)
 
         self.province = province
         self.point_name = point_name
-        self.target_cn_hotspot = {
-            name: hotspot
-            for name, hotspot in self.app.ebird_cn_hotspots.items()
-            if hotspot["subnational1Code"] == self.province
-        }
-        self.target_other_hotspot = {
-            name: hotspot
-            for name, hotspot in self.app.ebird_other_hotspots.items()
-            if hotspot["subnational1Code"] == self.province
-        }
+        # (lat, lng) of the point, nearby hotspots are ranked first
+        self.coordinates = coordinates
 
     def compose(self) -> ComposeResult:
         yield Grid(
@@ -146,29 +133,37 @@ class SearchEbirdHotspotScreen(ModalScreen):
         query_button.post_message(Button.Pressed(query_button))
 
     @on(Button.Pressed, "#query")
-    @work
-    async def on_button_pressed(self, event: Button.Pressed) -> None:
+    def on_button_pressed(self, event: Button.Pressed) -> None:
+        self.search_hotspots(0)
+
+    @on(Input.Changed, "#hotspot_name")
+    def on_input_changed(self, event: Input.Changed) -> None:
+        self.search_hotspots(HOTSPOT_SEARCH_DEBOUNCE)
+
+    @work(exclusive=True, group="hotspot_search")
+    async def search_hotspots(self, delay: float) -> None:
+        # a newer search cancels this one while it waits, so typing only
+        # searches once the input settles
+        if delay > 0:
+            await asyncio.sleep(delay)
+
         hotspot_name = self.query_one("#hotspot_name").value
         if hotspot_name == "":
             return
 
-        hotspot_listview = self.query_one(ListView)
-        await hotspot_listview.clear()
-
-        # 繁体简体（或许可以都转为简体后搜索）
-        hotspot_infos_cn = filter(
-            lambda x: partial_ratio(hotspot_name, x[1]["locName"]) > 80,
-            self.target_cn_hotspot.items(),
-        )
-        hotspot_infos_other = filter(
-            lambda x: partial_ratio(hotspot_name, x[1]["locName"]) > 80,
-            self.target_other_hotspot.items(),
+        # 名称已统一转为简体
+        hotspot_infos = self.app.hotspot_catalog.suggest(
+            self.province,
+            hotspot_name,
+            coordinates=self.coordinates,
+            limit=HOTSPOT_SEARCH_LIMIT,
         )
 
-        hotspot_infos = list(hotspot_infos_cn) + list(hotspot_infos_other)
+        hotspot_listview = self.query_one(ListView)
+        await hotspot_listview.clear()
 
         if len(hotspot_infos) == 0:
-            hotspot_listview.append(
+            await hotspot_listview.append(
                 ListItem(
                     Label("无搜索结果，点此不做修改"),
                     name=None,
@@ -177,23 +172,21 @@ class SearchEbirdHotspotScreen(ModalScreen):
             )
             return
 
-        hotspot_listview.append(
-            ListItem(Label("不做修改"), name=None, classes="hotspot_item")
-        )
-        for hotspot_info in hotspot_infos:
-            hotspot_listview.append(
+        items = [ListItem(Label("不做修改"), name=None, classes="hotspot_item")]
+        for hotspot, _, distance in hotspot_infos:
+            region_name = EBIRD_REGION_CODE_TO_NAME.get(
+                hotspot["subnational1Code"], hotspot["subnational1Code"]
+            )
+            if distance is not None:
+                region_name += f"  距离{distance:.1f}公里"
+            items.append(
                 ListItem(
-                    Label(
-                        hotspot_info[1]["locName"]
-                        + "\n"
-                        + EBIRD_REGION_CODE_TO_NAME[
-                            hotspot_info[1]["subnational1Code"]
-                        ],
-                    ),
-                    name=hotspot_info[0],
+                    Label(hotspot["locName"] + "\n" + region_name),
+                    name=hotspot["locId"],
                     classes="hotspot_item",
                 )
             )
+        await hotspot_listview.extend(items)
 
     @on(ListView.Selected)
     async def on_listview_selected(self, event: ListView.Selected) -> None:
@@ -256,10 +249,9 @@ class BirdreportToEbirdLocationAssignScreen(Screen):
         self.temp_assign_cache: Dict[str, Union[str, Dict]] = {}
 
     def get_hotspot_name(self, loc_id: str) -> str:
-        if loc_id in self.app.ebird_cn_hotspots:
-            return self.app.ebird_cn_hotspots[loc_id]["locName"]
-        if loc_id in self.app.ebird_other_hotspots:
-            return self.app.ebird_other_hotspots[loc_id]["locName"]
+        hotspot = self.app.hotspot_catalog.get(loc_id)
+        if hotspot is not None:
+            return hotspot["locName"]
         return loc_id
 
     @work
@@ -278,13 +270,15 @@ class BirdreportToEbirdLocationAssignScreen(Screen):
                 self.app.push_screen(loading_screen)
                 await self.app.ebird.update_hotspots()
                 loading_screen.dismiss()
-                self.app.reload_hotspot_info()
+                await asyncio.to_thread(self.app.reload_hotspot_info)
             except ApiErrorBase as e:
                 await self.app.push_screen_wait(
                     MessageScreen(f"更新eBird热点失败: {e}")
                 )
                 loading_screen.dismiss()
 
+        auto_matched = await self.auto_match_locations()
+
         vertical_scroll = VerticalScroll(id="location_assign_scroll")
         await self.mount(vertical_scroll)
         await vertical_scroll.mount(
@@ -294,6 +288,12 @@ class BirdreportToEbirdLocationAssignScreen(Screen):
                 Button("确认", id="confirm", variant="success"),
             )
         )
+        if auto_matched:
+            await vertical_scroll.mount(
+                Label(
+                    f"已自动匹配{len(auto_matched)}个地点（绿色），请检查后确认，其余地点请手动选择"
+                )
+            )
         horizonal_groups = []
         for point_id, (point_name, info) in enumerate(self.location_assign.items()):
             original_location_name = Label(
@@ -308,7 +308,7 @@ class BirdreportToEbirdLocationAssignScreen(Screen):
                 name=point_name,
                 id="converted_hotspot_" + str(point_id),
                 classes="converted_hotspot",
-                variant="default",
+                variant="success" if point_name in auto_matched else "default",
             )
 
             set_as_personal = Button(
@@ -354,7 +354,11 @@ class BirdreportToEbirdLocationAssignScreen(Screen):
             else "",
         )
         hotspot_name = await self.app.push_screen_wait(
-            SearchEbirdHotspotScreen(point_name, province_code)
+            SearchEbirdHotspotScreen(
+                point_name,
+                province_code,
+                coordinates=await self.get_point_coordinates(point_name),
+            )
         )
         button = event.button
 
@@ -365,6 +369,54 @@ class BirdreportToEbirdLocationAssignScreen(Screen):
 
         self.modify_converted_hotspot(event.button.name, hotspot_name)
 
+    async def auto_match_locations(self) -> Set[str]:
+        """Assign the points without an assignment to their confident matches"""
+        points = [
+            LocationPoint(
+                point_name,
+                get_report_eb_region_code(
+                    info["province"], info["city"], info["district"]
+                ),
+                parse_coordinates(info["latitude"], info["longitude"]),
+            )
+            for point_name, info in self.location_assign.items()
+            if "converted_hotspot" not in info
+        ]
+        if not points:
+            return set()
+
+        # scoring setup walks every hotspot, keep it off the event loop
+        matcher = await self.app.location_matcher()
+        matches = await asyncio.to_thread(matcher.match_all, points)
+
+        auto_matched = set()
+        for point_name, match in matches.items():
+            if match.confident:
+                # cached with the manual choices, once confirmed
+                self.modify_converted_hotspot(
+                    point_name, match.best, modify_cache=False
+                )
+                self.temp_assign_cache[point_name] = match.best
+                auto_matched.add(point_name)
+        return auto_matched
+
+    async def get_point_coordinates(self, point_name: str):
+        """(lat, lng) of a birdreport point, from its reports or the point api"""
+        info = self.location_assign[point_name]
+        coordinates = parse_coordinates(info["latitude"], info["longitude"])
+        if coordinates is None and info["point_id"]:
+            try:
+                point_info = await self.app.birdreport.member_get_point(
+                    info["point_id"]
+                )
+            except ApiErrorBase as e:
+                logging.warning(f"获取地点信息失败: {e}")
+                return None
+            coordinates = parse_coordinates(
+                point_info["latitude"], point_info["longitude"]
+            )
+        return coordinates
+
     @on(Button.Pressed, ".set_as_personal")
     @work
     async def on_button_set_as_personal_pressed(self, event: Button.Pressed) -> None:
@@ -426,10 +478,8 @@ class BirdreportToEbirdLocationAssignScreen(Screen):
         else:
             if custom_info is not None:
                 location_info = custom_info
-            elif converted_hotspot_name in self.app.ebird_cn_hotspots:
-                location_info = self.app.ebird_cn_hotspots[converted_hotspot_name]
-            elif converted_hotspot_name in self.app.ebird_other_hotspots:
-                location_info = self.app.ebird_other_hotspots[converted_hotspot_name]
+            elif converted_hotspot_name in self.app.hotspot_catalog:
+                location_info = self.app.hotspot_catalog.get(converted_hotspot_name)
             else:
                 return
 
@@ -505,40 +555,30 @@ class BirdreportFilterScreen(Screen):
             else:
                 return date
 
-        selectible_reports = []
-
         query_start_date = process_date(self.query_one("#start_date").value)
-        if query_start_date != "":
-            query_start_date = time.strptime(query_start_date, "%Y-%m-%d")
         query_end_date = process_date(self.query_one("#end_date").value)
         if query_end_date != "":
-            query_end_date = time.strptime(query_end_date, "%Y-%m-%d")
+            # the start times of that whole day are before the next one
+            query_end_date = (
+                datetime.strptime(query_end_date, "%Y-%m-%d") + timedelta(days=1)
+            ).strftime("%Y-%m-%d")
 
         query_version = self.query_one("#version").value
         query_type = self.query_one("#type").value
-        for report in self.app.cur_birdreport_data:
-            version = report["version"]
-            is_handy = "latitude" in report
-            start_date = time.strptime(report["start_time"].split(" ")[0], "%Y-%m-%d")
-            # filter reports of G3 which have been converted
-            if query_version != Select.BLANK:
-                if version != query_version:
-                    continue
-            if query_type != Select.BLANK:
-                if is_handy != (query_type == 1):
-                    continue
-            if query_start_date != "":
-                if start_date < query_start_date:
-                    continue
-            if query_end_date != "":
-                if start_date > query_end_date:
-                    continue
-            selectible_reports.append(
-                (
-                    f"{report['serial_id']}: {report['start_time']} - {report['point_name']}",
-                    report["id"],
-                )
+        reports = get_checklist_store().search(
+            self.app.birdreport.user_info["username"],
+            version=None if query_version == Select.BLANK else query_version,
+            is_handy=None if query_type == Select.BLANK else query_type == 1,
+            start_time=query_start_date,
+            end_time=query_end_date,
+        )
+        selectible_reports = [
+            (
+                f"{report.serial_id}: {report.start_time} - {report.point_name}",
+                report.id,
             )
+            for report in reports
+        ]
 
         selection_list = self.query_one(SelectionList)
         selection_list.clear_options()
@@ -550,17 +590,14 @@ class BirdreportFilterScreen(Screen):
         selection_list.select_all()
 
     @on(Button.Pressed, "#confirm")
-    def on_button_confirm_pressed(self, event: Button.Pressed) -> None:
+    async def on_button_confirm_pressed(self, event: Button.Pressed) -> None:
         selection_list = self.query_one(SelectionList)
-        new_list = list(
-            filter(
-                lambda x: x["id"] in selection_list.selected,
-                self.app.cur_birdreport_data,
-            )
-        )
-        if len(new_list) == 0:
+        if len(selection_list.selected) == 0:
             return
-        self.app.cur_birdreport_data = new_list
+        # only the selected reports are loaded from the store
+        self.app.cur_birdreport_data = await asyncio.to_thread(
+            get_checklist_store().get_reports, selection_list.selected
+        )
         self.dismiss()
 
     def on_mount(self) -> None:
@@ -580,52 +617,27 @@ class BirdreportToEbirdScreen(Screen):
     async def on_mount(self) -> None:
         username = self.app.birdreport.user_info["username"]
 
-        async def load_report(start_date: str = "") -> int:
-            try:
-                checklists = await self.app.birdreport.member_get_reports(
-                    start_date=start_date
-                )
-            except ApiErrorBase as e:
-                await self.app.push_screen_wait(MessageScreen(f"获取报告失败: {e}"))
-                return -1
-            candi_dup_checklists = list(
-                filter(
-                    lambda x: x["start_time"].split(" ")[0] == start_date, checklists
-                )
-            )
-            candi_dup_old_checklists = list(
-                filter(
-                    lambda x: x["start_time"].split(" ")[0] == start_date,
-                    self.app.cur_birdreport_data,
-                )
+        store = get_checklist_store()
+
+        async def load_report(full: bool) -> int:
+            self.cur_date = datetime.now(pytz.timezone("Asia/Shanghai")).strftime(
+                "%Y-%m-%d"
             )
-            for candi_dup in candi_dup_checklists:
-                for candi_dup_old in candi_dup_old_checklists:
-                    if candi_dup["id"] == candi_dup_old["id"]:
-                        checklists.remove(candi_dup)
-
-            checklists = list(
-                filter(
-                    lambda x: (
+            try:
+                await sync_reports(
+                    self.app.birdreport,
+                    store,
+                    username,
+                    self.cur_date,
+                    full=full,
+                    keep=lambda x: (
                         "province_name" in x
                         and x["province_name"] in AB_LOCATION.values()
                     ),
-                    checklists,
                 )
-            )
-
-            self.app.cur_birdreport_data += checklists
-
-            self.cur_date = datetime.now(pytz.timezone("Asia/Shanghai")).strftime(
-                "%Y-%m-%d"
-            )
-
-            with open(
-                application_path / f"{username}_{self.cur_date}_checklists.json",
-                "w",
-                encoding="utf-8",
-            ) as f:
-                json.dump(self.app.cur_birdreport_data, f, ensure_ascii=False, indent=2)
+            except ApiErrorBase as e:
+                await self.app.push_screen_wait(MessageScreen(f"获取报告失败: {e}"))
+                return -1
 
             loading_label = self.query_one(LoadingIndicator)
             await loading_label.remove()
@@ -634,33 +646,32 @@ class BirdreportToEbirdScreen(Screen):
             # )
             # grid.mount(new_button)
 
-        checklist_files = list(Path(".").glob(f"{username}_*_checklists.json"))
+        # snapshots written by older versions
+        for checklist_file in sorted(
+            application_path.glob(f"{username}_*_checklists.json"),
+            key=lambda path: path.stem.split("_")[-2],
+        ):
+            await asyncio.to_thread(store.import_snapshot, username, checklist_file)
+            os.remove(checklist_file)
+
+        update_date = store.last_update_date(username)
         use_existing = False
 
         # TODO: 记录时长太长应有提示跳出，终止任务
-        if len(checklist_files) >= 1:
-            checklist_file = checklist_files[-1]
+        if update_date is not None:
             use_existing = await self.app.push_screen_wait(
-                ConfirmScreen(f"文件{checklist_file.name}已经存在\n是否使用已有数据？"),
+                ConfirmScreen(
+                    f"已有{store.count(username)}条记录（更新于{update_date}）\n是否只同步近期的记录？\n只修改了鸟种的记录无法被发现，选择否将核对全部记录并重新下载全部鸟种"
+                ),
             )
-        if use_existing:
-            with open(checklist_file, "r", encoding="utf-8") as f:
-                self.app.cur_birdreport_data = json.load(f)
-                update_date = checklist_file.stem.split("_")[-2]
-            os.remove(checklist_file)
-            status = await load_report(update_date)
-            if status == -1:
-                self.dismiss()
-                return
-        else:
-            self.app.cur_birdreport_data = []
-            status = await load_report()
-            if status == -1:
-                self.dismiss()
-                return
+        status = await load_report(full=not use_existing)
+        if status == -1:
+            self.dismiss()
+            return
 
         await self.app.push_screen_wait(BirdreportFilterScreen())
 
+        await self.app.wait_reference_data()
         if (
             self.app.ebird_cn_hotspots is not None
             and self.app.ebird_other_hotspots is not None
@@ -685,138 +696,16 @@ class BirdreportToEbirdScreen(Screen):
         self.dismiss()
 
     async def dump_as_ebird_csv(self, update_date):
-        reports = self.app.cur_birdreport_data
-        ch4_to_eb_taxon_map = self.app.ch4_to_eb_taxon_map
         username = self.app.birdreport.user_info["username"]
-        ebird_taxon_info_dict: Optional[Dict] = None
-        if self.app.ebird_taxon_info is not None:
-            ebird_taxon_info_dict = {
-                taxon_info["sciName"]: taxon_info
-                for taxon_info in self.app.ebird_taxon_info
-            }
-
-        csvs = [[]]
-        for report in reports:
-            version = report["version"]
-            obs = report["obs"]
-
-            start_time = time.strptime(report["start_time"], "%Y-%m-%d %H:%M:%S")
-            end_time = time.strptime(report["end_time"], "%Y-%m-%d %H:%M:%S")
-            duration = (time.mktime(end_time) - time.mktime(start_time)) // 60
-
-            # FIXME: need alert
-            duration = max(min(duration, 24 * 60), 1)
-
-            if "eye_all_birds" in report:
-                all_observations_reported = (
-                    "Y" if report["eye_all_birds"] != "" else "N"
-                )
-            else:
-                all_observations_reported = "Y"
-
-            # TODO: add checklist comments
-            checklist_comment = (
-                report["note"].replace("\n", "\\n") if "note" in report else ""
-            )
-            if checklist_comment != "":
-                checklist_comment += "\\n"
-            # TODO: 可选是否添加
-            checklist_comment += (
-                f"Converted from BirdReport CN, report ID: {report['serial_id']}"
-            )
-
-            start_time = time.strftime("%m/%d/%Y %H:%M", start_time)
-            observation_date, start_time = start_time.split(" ")
-            region_code = get_report_eb_region_code(
-                report["province_name"],
-                report["city_name"] if "city_name" in report else "",
-                report["district_name"] if "district_name" in report else "",
-            )
-            if region_code.endswith("-"):
-                state = region_code
-                country = region_code[:-1]
-            else:
-                country, state = region_code.split("-")
-            location_name = report["point_name"]
-            lat = report["lat"] if "lat" in report else ""
-            lng = report["lng"] if "lng" in report else ""
-            protocol = "historical"  # historical
-            num_observers = 1
-
-            if "real_quantity" in report:
-                real_quantity = report["real_quantity"] == 1
-            elif all([o["taxon_count"] == 1 for o in obs]):
-                real_quantity = False
-            else:
-                real_quantity = True
-
-            if version == "G3":
-                pass
-            else:
-                if ch4_to_eb_taxon_map is not None:
-                    convert_taxon_z4_ebird(report, ch4_to_eb_taxon_map)
-                else:
-                    pass
-
-            for entry in obs:
-                # common_name = entry["taxon_name"]
-
-                common_name = ""
-                genus = ""
-                species = ""
-                if ebird_taxon_info_dict is not None:
-                    common_name = ebird_taxon_info_dict[entry["latinname"]]["comName"]
-                    if common_name == "鹗":
-                        common_name = "鹗鹗"
-                else:
-                    splited_latinname = entry["latinname"].split(" ")
-                    genus = splited_latinname[0]
-                    species = " ".join(splited_latinname[1:])
-
-                species_count = entry["taxon_count"] if real_quantity else "X"
-
-                note = entry["note"].replace("\n", "\\n") if "note" in entry else ""
-
-                species_comments = note
-                # only for detail taxon
-                # if entry["type"] == 2:
-                #     species_comments += "\\nHeard."
-                # if entry["outside_type"] != 0:
-                #     species_comments += "\nOut of scope or not confirmed."
-                csv_line = (
-                    common_name,
-                    genus,
-                    species,
-                    species_count,
-                    species_comments,
-                    location_name,
-                    lat,
-                    lng,
-                    observation_date,
-                    start_time,
-                    state,
-                    country,
-                    protocol,
-                    num_observers,
-                    duration,
-                    all_observations_reported,
-                    "",
-                    "",
-                    checklist_comment,
-                )
-                csvs[-1].append(csv_line)
-            if len(csvs[-1]) >= 4000:
-                csvs.append([])
-
-        for i in range(len(csvs)):
-            with open(
-                application_path / f"{username}_{update_date}_checklists_{i}.csv",
-                "w",
-                encoding="utf-8",
-                newline="",
-            ) as f:
-                writer = csv.writer(f)
-                writer.writerows(csvs[i])
+        # the locations are already assigned, the reports are converted and
+        # written one at a time, off the ui thread
+        await export_reports(
+            self.app.cur_birdreport_data,
+            lambda i: application_path
+            / f"{username}_{update_date}_checklists_{i}.csv",
+            ch4_to_eb_taxon_map=self.app.ch4_to_eb_taxon_map,
+            ebird_taxon_info=self.app.ebird_taxon_info,
+        )
 
     def on_worker_state_changed(self, event: Worker.StateChanged) -> None:
         if event.worker.state is WorkerState.ERROR:
@@ -868,6 +757,8 @@ class BirdreportScreen(DomainScreen):
             if client is None:
                 await self.app.push_screen_wait(MessageScreen("Token 未发生改变"))
                 return
+            if self.app.birdreport is not None:
+                await self.app.birdreport.aclose()
             self.app.birdreport = client
             store_token(self.token_name, client.token)
 
@@ -919,7 +810,7 @@ class BirdreportScreen(DomainScreen):
 
 
 class BirdreportLoginScreen(ModalScreen):
-    image: PILImage.Image | None
+    image: "PILImage.Image | None"
 
     def __init__(self, name=None, id=None, classes=None):
         super().__init__(name, id, classes)
@@ -1078,7 +969,7 @@ class BirdreportTokenFetchScreen(ModalScreen):
         try:
             self.driver.execute_script("return true")
             return True
-        except WebDriverException:
+        except selenium_exceptions.WebDriverException:
             return False
 
     async def on_button_pressed(self, event: Button.Pressed) -> None:
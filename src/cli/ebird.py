@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from typing import TYPE_CHECKING
 
@@ -57,7 +58,7 @@ class EbirdScreen(DomainScreen):
             await self.app.push_screen_wait(MessageScreen(f"更新eBird热点失败: {e}"))
             loading_screen.dismiss()
             return
-        self.app.reload_hotspot_info()
+        await asyncio.to_thread(self.app.reload_hotspot_info)
 
     @work
     async def on_button_pressed(self, event: Button.Pressed) -> None:
@@ -72,6 +73,8 @@ class EbirdScreen(DomainScreen):
             if result is None:
                 await self.app.push_screen_wait(MessageScreen("Token 未发生改变"))
                 return
+            if self.app.ebird is not None and self.app.ebird is not result:
+                await self.app.ebird.aclose()
             self.app.ebird = result
         elif event.button.id == "back":
             self.app.pop_screen()
@@ -2,12 +2,13 @@ import json
 import os
 import asyncio
 import datetime
-from typing import Dict
+from pathlib import Path
+from typing import Dict, List, Optional
 from enum import Enum
 
 import httpx
 from dotenv import load_dotenv
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
+from tenacity import retry, retry_if_exception_type
 from ebird.api.validation import (
     clean_back,
     clean_dist,
@@ -21,13 +22,28 @@ from ebird.api.regions import REGION_LIST_URL
 from ebird.api.taxonomy import TAXONOMY_URL
 
 from src import database_path
+from src.utils.http_client import (
+    create_async_client,
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+    DEFAULT_KEEPALIVE_EXPIRY,
+)
 from src.utils.api_exceptions import (
     ApiError,
     AuthenticationError,
     ApiErrorBase,
     NetworkError,
+    RateLimitError,
     ServerError,
 )
+from src.utils.reference_db import HOTSPOT_SOURCES, get_reference_db
+from src.utils.response_cache import DAY, ResponseCache, get_response_cache
+from src.utils.rate_limit import (
+    get_host_limiter,
+    parse_retry_after,
+    stop_after_configured_attempts,
+    wait_backoff_or_retry_after,
+)
 
 
 def raise_last_exception(retry_state):
@@ -41,21 +57,38 @@ class RegionType(Enum):
     SUBNATIONAL2 = "subnational2"
 
 
+HOTSPOT_REGIONS = ["CN", "TW", "HK", "MO"]
+MAX_CONCURRENT_REGION_REQUESTS = 4
+
+TAXONOMY_CACHE_TTL = 30 * DAY
+REGIONS_CACHE_TTL = 30 * DAY
+
+
 @retry(
-    stop=stop_after_attempt(3),
-    wait=wait_fixed(2),
-    retry=retry_if_exception_type((NetworkError, ServerError)),
+    stop=stop_after_configured_attempts,
+    wait=wait_backoff_or_retry_after,
+    retry=retry_if_exception_type((NetworkError, ServerError, RateLimitError)),
     retry_error_callback=raise_last_exception,
 )
-async def call(url: str, params: Dict, headers: Dict) -> Dict:
+async def call(
+    client: httpx.AsyncClient, url: str, params: Dict, headers: Dict
+) -> Dict:
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, headers=headers)
+        rate_limiter = get_host_limiter(httpx.URL(url).host)
+        await rate_limiter.acquire()
+        response = await client.get(url, params=params, headers=headers)
 
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None:
+            rate_limiter.penalize(retry_after)
         if response.status_code in [401, 403]:
             raise AuthenticationError(f"Authentication error: {response.status_code}")
+        if response.status_code == 429:
+            raise RateLimitError("Too many requests", retry_after=retry_after)
         if response.status_code >= 500:
-            raise ServerError(f"Server error: {response.status_code}")
+            raise ServerError(
+                f"Server error: {response.status_code}", retry_after=retry_after
+            )
         if response.status_code >= 400:
             raise ApiError(f"API error: {response.status_code}")
 
@@ -70,15 +103,78 @@ async def call(url: str, params: Dict, headers: Dict) -> Dict:
         raise ApiErrorBase(f"An unexpected error occurred: {e}") from e
 
 
+def dump_hotspots(hotspot_file: Path, hotspots: List, update_date: str) -> None:
+    res = {hotspot["locId"]: hotspot for hotspot in hotspots}
+    res = {
+        "last_update_date": update_date,
+        "data": res,
+    }
+    hotspot_file_bak = hotspot_file.with_suffix(".json.bak")
+    if hotspot_file_bak.exists():
+        os.remove(hotspot_file_bak)
+    if hotspot_file.exists():
+        os.rename(hotspot_file, hotspot_file_bak)
+    with open(hotspot_file, "w", encoding="utf-8") as f:
+        json.dump(res, f, ensure_ascii=False, indent=2)
+
+
 class EBird:
-    def __init__(self, token, locale="zh_SIM"):
+    def __init__(
+        self,
+        token,
+        locale="zh_SIM",
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+        http2: bool = True,
+        use_response_cache: bool = True,
+    ):
         self.token = token
         self.locale = locale
 
+        self.client_options = {
+            "max_connections": max_connections,
+            "max_keepalive_connections": max_keepalive_connections,
+            "keepalive_expiry": keepalive_expiry,
+            "http2": http2,
+        }
+        self._client: Optional[httpx.AsyncClient] = None
+
+        self.response_cache = (
+            get_response_cache()
+            if use_response_cache
+            else ResponseCache(None, enabled=False)
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The pooled client shared by all requests of this instance, created on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = create_async_client(**self.client_options)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     @classmethod
     async def create(cls, token: str):
         instance = cls(token)
-        res = await instance.get_regions(RegionType.SUBNATIONAL1, "MO")
+        try:
+            # never from the cache, the request checks the token
+            res = await instance.get_regions(
+                RegionType.SUBNATIONAL1, "MO", refresh=True
+            )
+        except ApiErrorBase:
+            await instance.aclose()
+            raise
         print(res)
         return instance
 
@@ -91,41 +187,41 @@ class EBird:
             params["back"] = clean_back(back)
         headers = {"X-eBirdApiToken": self.token}
 
-        res = await call(url, params, headers)
+        res = await call(self.client, url, params, headers)
         return res
 
+    async def get_hotspots_by_regions(
+        self,
+        regions: List[str],
+        max_concurrency: int = MAX_CONCURRENT_REGION_REQUESTS,
+    ) -> Dict[str, List]:
+        """Fetch the hotspots of several regions concurrently, keyed by region"""
+        semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+
+        async def fetch(region: str) -> List:
+            async with semaphore:
+                return await self.get_hotspots(region)
+
+        results = await asyncio.gather(*[fetch(region) for region in regions])
+        return dict(zip(regions, results))
+
     async def update_hotspots(self):
-        res = await self.get_hotspots("CN")
-        res = {hotspot["locId"]: hotspot for hotspot in res}
-        res = {
-            "last_update_date": datetime.datetime.now().strftime("%Y-%m-%d"),
-            "data": res,
-        }
-        old_cn_hotspots = database_path / "ebird_cn_hotspots.json"
-        old_cn_hotspots_bak = old_cn_hotspots.with_suffix(".json.bak")
-        if old_cn_hotspots_bak.exists():
-            os.remove(old_cn_hotspots_bak)
-        os.rename(old_cn_hotspots, old_cn_hotspots.with_suffix(".json.bak"))
-        with open(old_cn_hotspots, "w", encoding="utf-8") as f:
-            json.dump(res, f, ensure_ascii=False, indent=2)
-        tw_res = await self.get_hotspots("TW")
-        hk_res = await self.get_hotspots("HK")
-        mo_res = await self.get_hotspots("MO")
-        res = tw_res + hk_res + mo_res
-        res = {hotspot["locId"]: hotspot for hotspot in res}
-        res = {
-            "last_update_date": datetime.datetime.now().strftime("%Y-%m-%d"),
-            "data": res,
-        }
-        old_other_hotspots = database_path / "ebird_other_hotspots.json"
-        old_other_hotspots_bak = old_other_hotspots.with_suffix(".json.bak")
-        if old_other_hotspots_bak.exists():
-            os.remove(old_other_hotspots_bak)
-        os.rename(old_other_hotspots, old_other_hotspots.with_suffix(".json.bak"))
-        with open(old_other_hotspots, "w", encoding="utf-8") as f:
-            json.dump(res, f, ensure_ascii=False, indent=2)
-
-    async def get_regions(self, region_type: RegionType, region: str):
+        # fetch every region before touching the database files
+        res = await self.get_hotspots_by_regions(HOTSPOT_REGIONS)
+        update_date = datetime.datetime.now().strftime("%Y-%m-%d")
+
+        dump_hotspots(database_path / "ebird_cn_hotspots.json", res["CN"], update_date)
+        dump_hotspots(
+            database_path / "ebird_other_hotspots.json",
+            res["TW"] + res["HK"] + res["MO"],
+            update_date,
+        )
+        # compile the new files now rather than on the next startup
+        await asyncio.to_thread(get_reference_db().sync, HOTSPOT_SOURCES)
+
+    async def get_regions(
+        self, region_type: RegionType, region: str, refresh: bool = False
+    ):
         url = REGION_LIST_URL % (region_type.value, clean_region(region))
 
         params = {"fmt": "json", "locale": self.locale}
@@ -134,10 +230,16 @@ class EBird:
             "X-eBirdApiToken": self.token,
         }
 
-        res = await call(url, params, headers)
+        res = await self.response_cache.fetch(
+            url,
+            params,
+            REGIONS_CACHE_TTL,
+            lambda: call(self.client, url, params, headers),
+            refresh=refresh,
+        )
         return res
 
-    async def get_taxonomy(self):
+    async def get_taxonomy(self, refresh: bool = False):
         url = TAXONOMY_URL
 
         params = {"fmt": "json", "locale": self.locale}
@@ -146,7 +248,13 @@ class EBird:
             "X-eBirdApiToken": self.token,
         }
 
-        res = await call(url, params, headers)
+        res = await self.response_cache.fetch(
+            url,
+            params,
+            TAXONOMY_CACHE_TTL,
+            lambda: call(self.client, url, params, headers),
+            refresh=refresh,
+        )
         return res
 
 
@@ -155,7 +263,8 @@ if __name__ == "__main__":
     ebird = EBird(os.getenv("EBIRD_TOKEN"))
 
     async def inner():
-        result = await ebird.get_taxonomy()
+        async with ebird:
+            result = await ebird.get_taxonomy()
         return result
 
     result = asyncio.run(inner())
@@ -0,0 +1,36 @@
+import base64
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import unpad
+
+# below this size the cached ECB cipher beats building a new CBC cipher
+SMALL_MESSAGE_SIZE = 4096
+
+
+class AESCBCCipher:
+    """
+    AES-CBC decryption with a fixed key and iv.
+
+    A CBC cipher object carries the chaining state and cannot be reused, so the
+    key schedule is kept in a stateless ECB cipher built once. For small
+    messages every block is decrypted by it at once and chained by a single
+    xor, P_i = D(C_i) ^ C_{i-1}.
+    """
+
+    def __init__(self, key: bytes, iv: bytes):
+        self.key = key
+        self.iv = iv
+        self._ecb = AES.new(key, AES.MODE_ECB)
+
+    def decrypt(self, data: bytes) -> bytes:
+        if not data or len(data) > SMALL_MESSAGE_SIZE:
+            return AES.new(self.key, AES.MODE_CBC, iv=self.iv).decrypt(data)
+        decrypted = self._ecb.decrypt(data)
+        previous = self.iv + data[: -AES.block_size]
+        return (
+            int.from_bytes(decrypted, "little") ^ int.from_bytes(previous, "little")
+        ).to_bytes(len(data), "little")
+
+    def decrypt_text(self, text: str) -> str:
+        decrypted = self.decrypt(base64.b64decode(text))
+        return unpad(decrypted, AES.block_size).decode("utf-8")
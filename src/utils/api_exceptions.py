@@ -1,10 +1,15 @@
+from typing import Optional
+
+
 class ApiErrorBase(Exception):
     """Base exception for all API errors."""
 
-    def __init__(self, message, *args):
+    def __init__(self, message, *args, retry_after: Optional[float] = None):
         super().__init__(*args)
 
         self.message = message
+        # seconds the server asked to wait before retrying, if any
+        self.retry_after = retry_after
 
 
 class NetworkError(ApiErrorBase):
@@ -29,3 +34,9 @@ class ApiError(ApiErrorBase):
     """Raised when the API returns an unexpected response (e.g., 4xx client error, invalid data)."""
 
     pass
+
+
+class RateLimitError(ApiErrorBase):
+    """Raised when the server returns 429 Too Many Requests."""
+
+    pass
@@ -0,0 +1,277 @@
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from src import cache_path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id PRIMARY KEY,
+    username TEXT NOT NULL,
+    serial_id TEXT,
+    version TEXT,
+    is_handy INTEGER NOT NULL,
+    start_time TEXT,
+    province_name TEXT,
+    point_name TEXT,
+    data TEXT NOT NULL,
+    summary_hash TEXT,
+    obs_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS reports_start_time ON reports (username, start_time);
+CREATE INDEX IF NOT EXISTS reports_province_name ON reports (province_name);
+CREATE INDEX IF NOT EXISTS reports_point_name ON reports (point_name);
+CREATE INDEX IF NOT EXISTS reports_serial_id ON reports (serial_id);
+CREATE TABLE IF NOT EXISTS observations (
+    report_id NOT NULL REFERENCES reports (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (report_id, seq)
+);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    last_update_date TEXT
+);
+"""
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+# columns added after the first release of the store
+_ADDED_COLUMNS = {"reports": ("summary_hash TEXT", "obs_hash TEXT")}
+
+# ids per query, below the sqlite limit of bound parameters
+_ID_BATCH = 500
+
+
+class ReportSummary(NamedTuple):
+    id: object
+    serial_id: str
+    start_time: str
+    point_name: str
+
+
+class ChecklistStore:
+    """
+    The birdreport reports of every user, keyed by report id, with their
+    observations in a child table.
+
+    Reports are upserted, so fetching the same report again replaces it, and
+    the screens query the summaries or the few reports they need instead of
+    loading the whole history.
+    """
+
+    def __init__(self, db_file: Path):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(_SCHEMA)
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = {
+                row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")
+            }
+            for column in columns:
+                if column.split()[0] not in existing:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, params: Sequence = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def upsert_reports(
+        self,
+        username: str,
+        reports: Iterable[Dict],
+        hashes: Optional[Dict[object, Tuple[str, str]]] = None,
+    ) -> int:
+        """
+        Insert or replace reports with their observations, returns the count.
+        `hashes` are the (summary, observations) content hashes by report id.
+        """
+        hashes = hashes or {}
+        count = 0
+        with self._lock, self._conn:
+            conn = self._conn
+            for report in reports:
+                report = dict(report)
+                observations = report.pop("obs", [])
+                conn.execute(
+                    "INSERT INTO reports VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET username = excluded.username, "
+                    "serial_id = excluded.serial_id, version = excluded.version, "
+                    "is_handy = excluded.is_handy, start_time = excluded.start_time, "
+                    "province_name = excluded.province_name, "
+                    "point_name = excluded.point_name, data = excluded.data, "
+                    "summary_hash = excluded.summary_hash, obs_hash = excluded.obs_hash",
+                    (
+                        report["id"],
+                        username,
+                        report.get("serial_id"),
+                        report.get("version"),
+                        int("latitude" in report),
+                        report.get("start_time"),
+                        report.get("province_name"),
+                        report.get("point_name"),
+                        _dumps(report),
+                        *hashes.get(report["id"], (None, None)),
+                    ),
+                )
+                conn.execute(
+                    "DELETE FROM observations WHERE report_id = ?", (report["id"],)
+                )
+                conn.executemany(
+                    "INSERT INTO observations VALUES (?, ?, ?)",
+                    (
+                        (report["id"], seq, _dumps(observation))
+                        for seq, observation in enumerate(observations)
+                    ),
+                )
+                count += 1
+        return count
+
+    def delete_reports(self, ids: Iterable) -> None:
+        ids = list(ids)
+        with self._lock, self._conn:
+            for i in range(0, len(ids), _ID_BATCH):
+                batch = ids[i : i + _ID_BATCH]
+                self._conn.execute(
+                    f"DELETE FROM reports WHERE id IN ({', '.join('?' * len(batch))})",
+                    batch,
+                )
+
+    def report_hashes(
+        self, username: str, start_time: Optional[str] = None
+    ) -> Dict[object, Tuple[Optional[str], Optional[str]]]:
+        """(summary, observations) hashes by id of the reports from start_time on"""
+        sql = "SELECT id, summary_hash, obs_hash FROM reports WHERE username = ?"
+        params: List = [username]
+        if start_time:
+            sql += " AND start_time >= ?"
+            params.append(start_time)
+        return {
+            report_id: (summary_hash, obs_hash)
+            for report_id, summary_hash, obs_hash in self._execute(sql, params)
+        }
+
+    def clear(self, username: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM reports WHERE username = ?", (username,))
+            self._conn.execute("DELETE FROM users WHERE username = ?", (username,))
+
+    def count(self, username: str) -> int:
+        return self._execute(
+            "SELECT count(*) FROM reports WHERE username = ?", (username,)
+        )[0][0]
+
+    def last_update_date(self, username: str) -> Optional[str]:
+        found = self._execute(
+            "SELECT last_update_date FROM users WHERE username = ?", (username,)
+        )
+        return found[0][0] if found else None
+
+    def set_last_update_date(self, username: str, update_date: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO users VALUES (?, ?)", (username, update_date)
+            )
+
+    def search(
+        self,
+        username: str,
+        version: Optional[str] = None,
+        is_handy: Optional[bool] = None,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        province_names: Optional[Iterable[str]] = None,
+        point_name: Optional[str] = None,
+    ) -> List[ReportSummary]:
+        """
+        Summaries of the matching reports by start time, `start_time` is
+        inclusive and `end_time` exclusive, both compared as text
+        """
+        conditions = ["username = ?"]
+        params: List = [username]
+        if version is not None:
+            conditions.append("version = ?")
+            params.append(version)
+        if is_handy is not None:
+            conditions.append("is_handy = ?")
+            params.append(int(is_handy))
+        if start_time:
+            conditions.append("start_time >= ?")
+            params.append(start_time)
+        if end_time:
+            conditions.append("start_time < ?")
+            params.append(end_time)
+        if province_names is not None:
+            province_names = list(province_names)
+            conditions.append(
+                f"province_name IN ({', '.join('?' * len(province_names))})"
+            )
+            params.extend(province_names)
+        if point_name is not None:
+            conditions.append("point_name = ?")
+            params.append(point_name)
+        return [
+            ReportSummary(*row)
+            for row in self._execute(
+                "SELECT id, serial_id, start_time, point_name FROM reports "
+                f"WHERE {' AND '.join(conditions)} ORDER BY start_time, rowid",
+                params,
+            )
+        ]
+
+    def get_reports(self, ids: Iterable) -> List[Dict]:
+        """The full reports of ids, observations included, in the order given"""
+        ids = list(ids)
+        reports: Dict[object, Dict] = {}
+        for i in range(0, len(ids), _ID_BATCH):
+            batch = ids[i : i + _ID_BATCH]
+            placeholders = ", ".join("?" * len(batch))
+            for report_id, data in self._execute(
+                f"SELECT id, data FROM reports WHERE id IN ({placeholders})", batch
+            ):
+                report = json.loads(data)
+                report["obs"] = []
+                reports[report_id] = report
+            for report_id, data in self._execute(
+                f"SELECT report_id, data FROM observations "
+                f"WHERE report_id IN ({placeholders}) ORDER BY report_id, seq",
+                batch,
+            ):
+                reports[report_id]["obs"].append(json.loads(data))
+        return [reports[report_id] for report_id in ids if report_id in reports]
+
+    def import_snapshot(self, username: str, snapshot_file: Path) -> int:
+        """Upsert the reports of a `{username}_{date}_checklists.json` file"""
+        with open(snapshot_file, "r", encoding="utf-8") as f:
+            reports = json.load(f)
+        count = self.upsert_reports(username, reports)
+        update_date = snapshot_file.stem.split("_")[-2]
+        last_update_date = self.last_update_date(username)
+        if last_update_date is None or update_date > last_update_date:
+            self.set_last_update_date(username, update_date)
+        logging.info(f"Imported {count} reports from {snapshot_file}")
+        return count
+
+
+_default_store: Optional[ChecklistStore] = None
+
+
+def get_checklist_store() -> ChecklistStore:
+    """The checklist store under cache_path"""
+    global _default_store
+    if _default_store is None:
+        _default_store = ChecklistStore(cache_path / "checklists.sqlite3")
+    return _default_store
@@ -0,0 +1,329 @@
+import csv
+import logging
+import time
+from pathlib import Path
+from itertools import islice
+from typing import (
+    AsyncIterable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from src.utils.location import NAME_TO_EBIRD_REGION_CODE
+from src.utils.pipeline import DEFAULT_QUEUE_SIZE, Pipeline, Stage, StageStats
+from src.utils.taxon import (
+    CompiledTaxonMap,
+    compile_taxon_map,
+    convert_reports_z4_ebird,
+)
+
+# eBird refuses imports larger than 1MB, roughly 4000 rows
+EBIRD_CSV_MAX_ROWS = 4000
+# reports whose taxa are converted together
+CONVERT_CHUNK_SIZE = 1000
+
+# workers per stage of export_reports, the writer always has a single one.
+# More than one keeps a slow stage busy but no longer preserves the order
+DEFAULT_EXPORT_CONCURRENCY = {"normalize": 1, "convert": 1}
+
+
+def get_report_eb_region_code(province, city, district):
+    logging.debug(f"get_report_eb_region_code: {province}, {city}, {district}")
+    if province == "台湾省":
+        if city in NAME_TO_EBIRD_REGION_CODE:
+            return NAME_TO_EBIRD_REGION_CODE[city]
+        elif district in NAME_TO_EBIRD_REGION_CODE:
+            return NAME_TO_EBIRD_REGION_CODE[district]
+        else:
+            return ""
+    elif province in NAME_TO_EBIRD_REGION_CODE:
+        return NAME_TO_EBIRD_REGION_CODE[province]
+    else:
+        return ""
+
+
+def iter_report_rows(
+    report: Dict,
+    ebird_taxon_info_dict: Optional[Dict],
+) -> Iterator[Tuple]:
+    """
+    Yield the eBird record format rows of one report, one per observation,
+    its taxa must already be converted to the eBird taxonomy
+    """
+    obs = report["obs"]
+
+    start_time = time.strptime(report["start_time"], "%Y-%m-%d %H:%M:%S")
+    end_time = time.strptime(report["end_time"], "%Y-%m-%d %H:%M:%S")
+    duration = (time.mktime(end_time) - time.mktime(start_time)) // 60
+
+    # FIXME: need alert
+    duration = max(min(duration, 24 * 60), 1)
+
+    if "eye_all_birds" in report:
+        all_observations_reported = "Y" if report["eye_all_birds"] != "" else "N"
+    else:
+        all_observations_reported = "Y"
+
+    # TODO: add checklist comments
+    checklist_comment = report["note"].replace("\n", "\\n") if "note" in report else ""
+    if checklist_comment != "":
+        checklist_comment += "\\n"
+    # TODO: 可选是否添加
+    checklist_comment += (
+        f"Converted from BirdReport CN, report ID: {report['serial_id']}"
+    )
+
+    start_time = time.strftime("%m/%d/%Y %H:%M", start_time)
+    observation_date, start_time = start_time.split(" ")
+    region_code = get_report_eb_region_code(
+        report["province_name"],
+        report["city_name"] if "city_name" in report else "",
+        report["district_name"] if "district_name" in report else "",
+    )
+    if region_code.endswith("-"):
+        state = region_code
+        country = region_code[:-1]
+    else:
+        country, state = region_code.split("-")
+    location_name = report["point_name"]
+    lat = report["lat"] if "lat" in report else ""
+    lng = report["lng"] if "lng" in report else ""
+    protocol = "historical"  # historical
+    num_observers = 1
+
+    if "real_quantity" in report:
+        real_quantity = report["real_quantity"] == 1
+    elif all([o["taxon_count"] == 1 for o in obs]):
+        real_quantity = False
+    else:
+        real_quantity = True
+
+    for entry in obs:
+        common_name = ""
+        genus = ""
+        species = ""
+        if ebird_taxon_info_dict is not None:
+            common_name = ebird_taxon_info_dict[entry["latinname"]]["comName"]
+            if common_name == "鹗":
+                common_name = "鹗鹗"
+        else:
+            splited_latinname = entry["latinname"].split(" ")
+            genus = splited_latinname[0]
+            species = " ".join(splited_latinname[1:])
+
+        species_count = entry["taxon_count"] if real_quantity else "X"
+
+        note = entry["note"].replace("\n", "\\n") if "note" in entry else ""
+
+        species_comments = note
+        # only for detail taxon
+        # if entry["type"] == 2:
+        #     species_comments += "\\nHeard."
+        # if entry["outside_type"] != 0:
+        #     species_comments += "\nOut of scope or not confirmed."
+        yield (
+            common_name,
+            genus,
+            species,
+            species_count,
+            species_comments,
+            location_name,
+            lat,
+            lng,
+            observation_date,
+            start_time,
+            state,
+            country,
+            protocol,
+            num_observers,
+            duration,
+            all_observations_reported,
+            "",
+            "",
+            checklist_comment,
+        )
+
+
+def _taxon_info_by_sci_name(
+    ebird_taxon_info: Optional[Union[Mapping[str, Dict], List[Dict]]],
+) -> Optional[Mapping[str, Dict]]:
+    if isinstance(ebird_taxon_info, Mapping):
+        # already by sciName, e.g. the reference database table
+        return ebird_taxon_info
+    if ebird_taxon_info is not None:
+        return {taxon_info["sciName"]: taxon_info for taxon_info in ebird_taxon_info}
+    return None
+
+
+def iter_ebird_rows(
+    reports: Iterable[Dict],
+    ch4_to_eb_taxon_map: Optional[Dict] = None,
+    ebird_taxon_info: Optional[Union[Mapping[str, Dict], List[Dict]]] = None,
+) -> Iterator[Iterator[Tuple]]:
+    """
+    Yield the rows of every report lazily, grouped by report. The taxa of
+    the Z4 reports are converted in bulk, `CONVERT_CHUNK_SIZE` reports at a time.
+    """
+    ebird_taxon_info_dict = _taxon_info_by_sci_name(ebird_taxon_info)
+    reports = iter(reports)
+    while chunk := list(islice(reports, CONVERT_CHUNK_SIZE)):
+        if ch4_to_eb_taxon_map is not None:
+            convert_reports_z4_ebird(
+                [report for report in chunk if report["version"] != "G3"],
+                ch4_to_eb_taxon_map,
+            )
+        for report in chunk:
+            yield iter_report_rows(report, ebird_taxon_info_dict)
+
+
+class RotatingCsvWriter:
+    """
+    Write row groups to `file_path(0)`, `file_path(1)`, ...
+
+    A group (the rows of one checklist) is never split, a new file is started
+    once the current one holds at least `max_rows` rows.
+    """
+
+    def __init__(
+        self, file_path: Callable[[int], Path], max_rows: int = EBIRD_CSV_MAX_ROWS
+    ):
+        self.file_path = file_path
+        self.max_rows = max_rows
+        self.paths: List[Path] = []
+        self._file = None
+        self._writer = None
+        self._rows = 0
+
+    def write_group(self, group: Iterable[Tuple]) -> None:
+        if self._file is None:
+            self.paths.append(self.file_path(len(self.paths)))
+            self._file = open(self.paths[-1], "w", encoding="utf-8", newline="")
+            self._writer = csv.writer(self._file)
+            self._rows = 0
+        for row in group:
+            self._writer.writerow(row)
+            self._rows += 1
+        if self._rows >= self.max_rows:
+            self.close()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_rotating_csv(
+    row_groups: Iterable[Iterable[Tuple]],
+    file_path: Callable[[int], Path],
+    max_rows: int = EBIRD_CSV_MAX_ROWS,
+) -> List[Path]:
+    """Stream the rows to the files of a RotatingCsvWriter and return them"""
+    with RotatingCsvWriter(file_path, max_rows=max_rows) as writer:
+        for group in row_groups:
+            writer.write_group(group)
+    return writer.paths
+
+
+def apply_location_assign(
+    report: Dict,
+    location_assign: Mapping[str, Union[str, Dict]],
+    hotspot_catalog: Optional[Mapping[str, Dict]] = None,
+) -> bool:
+    """
+    Move report to its cached eBird location, like the location assign
+    screen does on confirm. The assignment is either the locId of a hotspot
+    or the {"lat", "lng"} of a personal location keeping the point name.
+    Returns whether the report had a usable assignment.
+    """
+    assigned = location_assign.get(report["point_name"])
+    if isinstance(assigned, dict):
+        location_info = assigned
+    elif assigned is not None and hotspot_catalog is not None:
+        location_info = hotspot_catalog.get(assigned)
+        if location_info is None:
+            return False
+        report["point_name"] = assigned
+    else:
+        return False
+    report["lat"] = location_info["lat"] if location_info["lat"] is not None else ""
+    report["lng"] = location_info["lng"] if location_info["lng"] is not None else ""
+    return True
+
+
+async def export_reports(
+    reports: Union[AsyncIterable[Dict], Iterable[Dict]],
+    file_path: Callable[[int], Path],
+    ch4_to_eb_taxon_map: Optional[Dict] = None,
+    ebird_taxon_info: Optional[Union[Mapping[str, Dict], List[Dict]]] = None,
+    location_assign: Optional[Mapping[str, Union[str, Dict]]] = None,
+    hotspot_catalog: Optional[Mapping[str, Dict]] = None,
+    keep: Optional[Callable[[Dict], bool]] = None,
+    max_rows: int = EBIRD_CSV_MAX_ROWS,
+    concurrency: Optional[Dict[str, int]] = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+) -> Tuple[List[Path], Dict[str, StageStats]]:
+    """
+    Stream reports through the normalize, convert and write stages of a
+    Pipeline into eBird csv files, returns the files and the stage stats.
+
+    normalize drops the reports not kept and applies the cached location
+    assignments, convert maps the Z4 taxa to eBird and write appends the rows
+    of each report to the rotating csv files. `concurrency` overrides the
+    workers of normalize and convert, with several convert workers the
+    reports may be written out of order.
+    """
+    concurrency = {**DEFAULT_EXPORT_CONCURRENCY, **(concurrency or {})}
+    ebird_taxon_info_dict = _taxon_info_by_sci_name(ebird_taxon_info)
+    taxon_map = ch4_to_eb_taxon_map
+    if taxon_map is not None and not isinstance(taxon_map, CompiledTaxonMap):
+        taxon_map = compile_taxon_map(taxon_map)
+    # shared by the convert workers, see convert_reports_z4_ebird
+    resolved_by_context: Dict = {}
+
+    def normalize(report: Dict) -> Optional[Dict]:
+        if keep is not None and not keep(report):
+            return None
+        if location_assign is not None:
+            apply_location_assign(report, location_assign, hotspot_catalog)
+        return report
+
+    def convert(report: Dict) -> Dict:
+        if taxon_map is not None and report["version"] != "G3":
+            convert_reports_z4_ebird([report], taxon_map, resolved_by_context)
+        return report
+
+    with RotatingCsvWriter(file_path, max_rows=max_rows) as writer:
+
+        def write(report: Dict) -> Dict:
+            writer.write_group(iter_report_rows(report, ebird_taxon_info_dict))
+            return report
+
+        pipeline = Pipeline(
+            reports,
+            [
+                Stage("normalize", normalize, concurrency=concurrency["normalize"]),
+                Stage(
+                    "convert",
+                    convert,
+                    concurrency=concurrency["convert"],
+                    threaded=True,
+                ),
+                Stage("write", write, threaded=True),
+            ],
+            queue_size=queue_size,
+        )
+        stats = await pipeline.run()
+    return writer.paths, stats
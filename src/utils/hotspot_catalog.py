@@ -0,0 +1,177 @@
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from src.utils.spatial_index import SpatialIndex, haversine, parse_coordinates
+from src.utils.text_search import NGramIndex, match_score
+
+# hotspots this close to a point are suggested even if their names differ
+NEARBY_RADIUS_KM = 20.0
+NEARBY_COUNT = 10
+# score points lost per km of distance when ranking suggestions
+DISTANCE_PENALTY = 2.0
+
+
+class HotspotCatalog:
+    """
+    Every eBird hotspot by locId, partitioned by subnational1Code.
+
+    Lookups by locId go to the given maps directly. The partitions are built
+    on the first region query, the name index of a partition on its first
+    search and the spatial index on the first distance query, then kept.
+    """
+
+    def __init__(self, hotspot_maps: Iterable[Optional[Mapping[str, Dict]]]):
+        self.hotspot_maps: List[Mapping[str, Dict]] = [
+            hotspots for hotspots in hotspot_maps if hotspots
+        ]
+        self._hotspots: Optional[Dict[str, Dict]] = None
+        self._regions: Optional[Dict[str, Dict[str, Dict]]] = None
+        self._indexes: Dict[str, NGramIndex] = {}
+        self._spatial_index: Optional[SpatialIndex] = None
+
+    def _partition(self) -> None:
+        hotspots: Dict[str, Dict] = {}
+        regions: Dict[str, Dict[str, Dict]] = {}
+        for hotspot_map in self.hotspot_maps:
+            for loc_id, hotspot in hotspot_map.items():
+                hotspots[loc_id] = hotspot
+                regions.setdefault(hotspot["subnational1Code"], {})[loc_id] = hotspot
+        self._hotspots, self._regions = hotspots, regions
+
+    @property
+    def hotspots(self) -> Dict[str, Dict]:
+        if self._hotspots is None:
+            self._partition()
+        return self._hotspots
+
+    @property
+    def regions(self) -> Dict[str, Dict[str, Dict]]:
+        if self._regions is None:
+            self._partition()
+        return self._regions
+
+    def __len__(self) -> int:
+        if self._hotspots is not None:
+            return len(self._hotspots)
+        return sum(len(hotspot_map) for hotspot_map in self.hotspot_maps)
+
+    def __contains__(self, loc_id: str) -> bool:
+        return self.get(loc_id) is not None
+
+    def get(self, loc_id: str) -> Optional[Dict]:
+        if self._hotspots is not None:
+            return self._hotspots.get(loc_id)
+        for hotspot_map in self.hotspot_maps:
+            hotspot = hotspot_map.get(loc_id)
+            if hotspot is not None:
+                return hotspot
+        return None
+
+    def region(self, subnational1_code: str) -> Dict[str, Dict]:
+        return self.regions.get(subnational1_code, {})
+
+    def search_index(self, subnational1_code: str) -> NGramIndex:
+        if subnational1_code not in self._indexes:
+            self._indexes[subnational1_code] = NGramIndex(
+                (loc_id, hotspot["locName"])
+                for loc_id, hotspot in self.region(subnational1_code).items()
+            )
+        return self._indexes[subnational1_code]
+
+    def search(self, subnational1_code: str, name: str, limit: int = 20):
+        """Return up to `limit` (hotspot, score) pairs of the region, best first"""
+        return [
+            (self.regions[subnational1_code][loc_id], score)
+            for loc_id, score in self.search_index(subnational1_code).search(
+                name, limit=limit
+            )
+        ]
+
+    @property
+    def spatial_index(self) -> SpatialIndex:
+        if self._spatial_index is None:
+            points = []
+            for loc_id, hotspot in self.hotspots.items():
+                coordinates = parse_coordinates(hotspot.get("lat"), hotspot.get("lng"))
+                if coordinates is not None:
+                    points.append((loc_id, *coordinates))
+            self._spatial_index = SpatialIndex(points)
+        return self._spatial_index
+
+    def distance(
+        self, coordinates: Tuple[float, float], hotspot: Dict
+    ) -> Optional[float]:
+        """km from coordinates to hotspot, None when it has no valid location"""
+        hotspot_coordinates = parse_coordinates(hotspot.get("lat"), hotspot.get("lng"))
+        if hotspot_coordinates is None:
+            return None
+        return haversine(*coordinates, *hotspot_coordinates)
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int = 5,
+        max_distance: Optional[float] = None,
+    ) -> List[Tuple[Dict, float]]:
+        """Up to k (hotspot, distance in km) pairs, closest first"""
+        return [
+            (self.hotspots[loc_id], distance)
+            for loc_id, distance in self.spatial_index.nearest(
+                lat, lng, k, max_distance
+            )
+        ]
+
+    def within(self, lat: float, lng: float, radius: float) -> List[Tuple[Dict, float]]:
+        """Every (hotspot, distance in km) pair within radius km, closest first"""
+        return [
+            (self.hotspots[loc_id], distance)
+            for loc_id, distance in self.spatial_index.within(lat, lng, radius)
+        ]
+
+    def suggest(
+        self,
+        subnational1_code: str,
+        name: str,
+        coordinates: Optional[Tuple[float, float]] = None,
+        limit: int = 20,
+    ) -> List[Tuple[Dict, int, Optional[float]]]:
+        """
+        Return up to `limit` (hotspot, score, distance) for a point, best first.
+
+        Without coordinates these are the name matches of the region. With
+        them the nearby hotspots of any region join in, and every candidate
+        loses DISTANCE_PENALTY score points per km, capped at the radius.
+        """
+        candidates: Dict[str, Tuple[Dict, int, Optional[float]]] = {
+            hotspot["locId"]: (hotspot, score, None)
+            for hotspot, score in self.search(subnational1_code, name, limit=limit)
+        }
+        if coordinates is None:
+            return list(candidates.values())
+
+        lat, lng = coordinates
+        for hotspot, distance in self.nearest(
+            lat, lng, k=NEARBY_COUNT, max_distance=NEARBY_RADIUS_KM
+        ):
+            loc_id = hotspot["locId"]
+            score = (
+                candidates[loc_id][1]
+                if loc_id in candidates
+                else match_score(name, hotspot["locName"])
+            )
+            candidates[loc_id] = (hotspot, score, distance)
+        for loc_id, (hotspot, score, distance) in candidates.items():
+            if distance is None:
+                candidates[loc_id] = (
+                    hotspot,
+                    score,
+                    self.distance(coordinates, hotspot),
+                )
+
+        def rank(candidate):
+            _, score, distance = candidate
+            if distance is None:
+                distance = NEARBY_RADIUS_KM
+            return score - DISTANCE_PENALTY * min(distance, NEARBY_RADIUS_KM)
+
+        return sorted(candidates.values(), key=rank, reverse=True)[:limit]
@@ -0,0 +1,36 @@
+import importlib.util
+
+import httpx
+
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+
+
+def is_http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (`httpx[http2]`)"""
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_async_client(
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+    http2: bool = True,
+    **kwargs,
+) -> httpx.AsyncClient:
+    """
+    Create a pooled client which keeps connections alive between requests.
+
+    Extra keyword arguments are passed to `httpx.AsyncClient`.
+    """
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        http2=http2 and is_http2_available(),
+        **kwargs,
+    )
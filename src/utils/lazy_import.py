@@ -0,0 +1,55 @@
+import importlib
+import threading
+import types
+from typing import Callable, Optional
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that is only imported on first attribute access.
+
+    `on_load` runs once with the real module right after it is imported.
+    Modules imported this way are invisible to PyInstaller, list them as
+    hidden imports in the build scripts.
+    """
+
+    def __init__(
+        self, name: str, on_load: Optional[Callable[[types.ModuleType], None]] = None
+    ):
+        super().__init__(name)
+        self.__dict__["_on_load"] = on_load
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    if self.__dict__["_on_load"] is not None:
+                        self.__dict__["_on_load"](module)
+                    self.__dict__["_module"] = module
+        return module
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(
+    name: str, on_load: Optional[Callable[[types.ModuleType], None]] = None
+) -> LazyModule:
+    """`name` imported on first use, e.g. `webdriver = lazy_import("selenium.webdriver")`"""
+    return LazyModule(name, on_load)
@@ -1,15 +1,18 @@
 import json
 import os
 import re
-import multiprocessing
 import asyncio
-from typing import Dict, List
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Union, TYPE_CHECKING
 
 from dotenv import load_dotenv
-from tqdm import tqdm
 
-from src.birdreport.birdreport import Birdreport
-from src import database_path
+from src import cache_path, database_path
+from src.utils.consts import APP_VERSION
+
+if TYPE_CHECKING:
+    from src.birdreport.birdreport import Birdreport
+
+LOCATION_ASSIGN_FILE = cache_path / "location_assign.json"
 
 WITH_TRANS = r"(\S*)\s*\(.*\)"
 GET_GROUPING = r"(\S*)\s*\[.*\]"
@@ -130,78 +133,106 @@ def process_name(name):
 
 
 async def extract_group_locations(
-    client: Birdreport, ebird_hotspots: List, old_group_locs: Dict = None
+    client: "Birdreport", ebird_hotspots: List, old_group_locs: Dict = None
 ) -> Dict:
     if old_group_locs is None:
-        old_group_locs = []
+        old_group_locs = {}
 
-    tasks = []
     group_names = []
     for hotspot in ebird_hotspots:
         name, group_name = process_name(hotspot["locName"])
-        if group_name in old_group_locs:
+        if group_name in old_group_locs or group_name in group_names:
             continue
+        group_names.append(group_name)
 
-        if group_name not in group_names:
-            tasks.append(client.member_search_hotspots_by_name(group_name))
-            group_names.append(group_name)
-
-        if (
-            len(tasks) % (multiprocessing.cpu_count() // 2) == 0
-            or hotspot == ebird_hotspots[-1]
-        ):
-            result = await asyncio.gather(*tasks)
-            for idx, locs in enumerate(result):
-                group_name = group_names[idx]
-                old_group_locs[group_name] = locs
-            tasks = []
-            group_names = []
+    result = await client.scheduler.map(
+        client.member_search_hotspots_by_name, group_names
+    )
+    for group_name, locs in zip(group_names, result):
+        old_group_locs[group_name] = locs
     return old_group_locs
 
 
 async def get_location_map(
-    client: Birdreport,
+    client: "Birdreport",
     ebird_hotspots: List,
     old_location_map: Dict = None,
     group_locs: Dict = None,
 ) -> Dict:
+    from tqdm import tqdm
+
     if old_location_map is None:
-        old_location_map = []
+        old_location_map = {}
 
-    tasks = []
-    group_names = []
-    names = []
-    for hotspot in tqdm(ebird_hotspots):
+    hotspots = {}
+    for hotspot in ebird_hotspots:
         name = hotspot["locName"]
-        _, group_name = process_name(hotspot["locName"])
-        lat, lng = hotspot["lat"], hotspot["lng"]
-        if name in old_location_map:
+        if name in old_location_map or name in hotspots:
             continue
+        hotspots[name] = hotspot
 
-        tasks.append(client.member_search_hotspots_nearby(5, lat, lng))
-        group_names.append(group_name)
-        names.append(name)
-
-        if (
-            len(tasks) % (multiprocessing.cpu_count() // 2) == 0
-            or hotspot == ebird_hotspots[-1]
-        ):
-            result = await asyncio.gather(*tasks)
-            for idx, locs in enumerate(result):
-                group_name = group_names[idx]
-                name = names[idx]
-                if group_locs is not None:
-                    group_loc = group_locs[group_name]
-                    locs.extend(group_loc)
-                locs = list(set([loc["point_name"] for loc in locs]))
-                old_location_map[name] = locs
-            tasks = []
-            group_names = []
-            names = []
+    progress = tqdm(total=len(hotspots))
+
+    async def search_nearby(hotspot):
+        name = hotspot["locName"]
+        _, group_name = process_name(name)
+        locs = await client.member_search_hotspots_nearby(
+            5, hotspot["lat"], hotspot["lng"]
+        )
+        if group_locs is not None:
+            locs.extend(group_locs[group_name])
+        old_location_map[name] = list(set([loc["point_name"] for loc in locs]))
+        progress.update()
+
+    try:
+        await client.scheduler.map(search_nearby, hotspots.values())
+    finally:
+        progress.close()
     return old_location_map
 
 
+def load_location_assign(
+    hotspot_maps: Iterable[Optional[Mapping[str, Dict]]],
+) -> Tuple[Dict[str, Union[str, Dict]], bool]:
+    """
+    The cached birdreport point name -> eBird locId or personal location, and
+    whether it was migrated from the old format keyed by hotspot names, in
+    which case it should be saved again
+    """
+    if not LOCATION_ASSIGN_FILE.exists():
+        return {}, False
+    with open(LOCATION_ASSIGN_FILE, "r", encoding="utf-8") as f:
+        cache_data = json.load(f)
+    if "version" in cache_data and "data" in cache_data:
+        return cache_data["data"], False
+
+    # Old format, needs migration
+    # Build a mapping from locName to locId
+    name_to_id = {}
+    for hotspots in hotspot_maps:
+        for loc_id, v in (hotspots or {}).items():
+            name_to_id[v["locName"]] = loc_id
+
+    result = {}
+    for k, v in cache_data.items():
+        if isinstance(v, dict):
+            result[k] = v
+        elif v in name_to_id:
+            result[k] = name_to_id[v]
+        else:
+            result[k] = v
+    return result, True
+
+
+def save_location_assign(location_assign: Dict[str, Union[str, Dict]]) -> None:
+    cache_data = {"version": APP_VERSION, "data": location_assign}
+    with open(LOCATION_ASSIGN_FILE, "w", encoding="utf-8") as f:
+        json.dump(cache_data, f, ensure_ascii=False, indent=4)
+
+
 if __name__ == "__main__":
+    from src.birdreport.birdreport import Birdreport
+
     load_dotenv()
     br = Birdreport(os.getenv("BIRDREPORT_TOKEN"))
 
@@ -0,0 +1,135 @@
+import math
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from src.utils.hotspot_catalog import HotspotCatalog
+from src.utils.lazy_import import lazy_import
+from src.utils.location import process_name
+from src.utils.text_search import normalize_text
+
+fuzz = lazy_import("fuzzywuzzy.fuzz")
+
+# blocking, only these hotspots are scored against a point
+NEARBY_RADIUS_KM = 10.0
+NEARBY_COUNT = 20
+NAME_CANDIDATES = 20
+
+# distance at which the distance score has dropped to 1/e
+DISTANCE_SCALE_KM = 2.0
+NAME_WEIGHT = 0.5
+DISTANCE_WEIGHT = 0.4
+POPULARITY_WEIGHT = 0.1
+
+# a best match is taken without review above this score, when the second
+# best is at least MIN_MARGIN behind
+MIN_CONFIDENT_SCORE = 0.8
+MIN_MARGIN = 0.1
+
+
+class LocationPoint(NamedTuple):
+    name: str
+    subnational1_code: str
+    coordinates: Optional[Tuple[float, float]] = None
+
+
+class LocationMatch(NamedTuple):
+    point_name: str
+    # (locId, score) best first
+    candidates: List[Tuple[str, float]]
+    confident: bool
+
+    @property
+    def best(self) -> Optional[str]:
+        return self.candidates[0][0] if self.candidates else None
+
+
+def name_similarity(point_name: str, hotspot_name: str) -> float:
+    """0-1, the hotspot name without its translation, whole or its last part"""
+    name, _ = process_name(hotspot_name)
+    name = normalize_text(name)
+    leaf = name.split("--")[-1]
+    return (
+        max(
+            fuzz.ratio(point_name, name),
+            fuzz.ratio(point_name, leaf),
+            0.9 * fuzz.partial_ratio(point_name, name),
+        )
+        / 100
+    )
+
+
+class LocationMatcher:
+    """
+    Score birdreport points against eBird hotspots by name, distance and
+    popularity.
+
+    A point is only compared to the hotspots near it and the best name
+    matches of its region, never to every hotspot.
+    """
+
+    def __init__(self, catalog: HotspotCatalog):
+        self.catalog = catalog
+        self.max_log_checklists = math.log1p(
+            max(
+                (h.get("numChecklistsAllTime", 0) for h in catalog.hotspots.values()),
+                default=0,
+            )
+        )
+
+    def popularity(self, hotspot: Dict) -> float:
+        if self.max_log_checklists == 0:
+            return 0.0
+        return (
+            math.log1p(hotspot.get("numChecklistsAllTime", 0)) / self.max_log_checklists
+        )
+
+    def candidates(self, point: LocationPoint) -> Dict[str, Optional[float]]:
+        """locId -> distance in km (None when unknown) of the hotspots to score"""
+        blocked: Dict[str, Optional[float]] = {}
+        index = self.catalog.search_index(point.subnational1_code)
+        for loc_id in index.candidates(normalize_text(point.name), NAME_CANDIDATES):
+            blocked[loc_id] = None
+        if point.coordinates is not None:
+            lat, lng = point.coordinates
+            for loc_id, distance in self.catalog.spatial_index.nearest(
+                lat, lng, k=NEARBY_COUNT, max_distance=NEARBY_RADIUS_KM
+            ):
+                blocked[loc_id] = distance
+        return blocked
+
+    def score(
+        self, point: LocationPoint, hotspot: Dict, distance: Optional[float]
+    ) -> float:
+        name_score = name_similarity(normalize_text(point.name), hotspot["locName"])
+        popularity = self.popularity(hotspot)
+        if point.coordinates is None:
+            # only the name tells, popularity breaks ties
+            return (1 - POPULARITY_WEIGHT) * name_score + POPULARITY_WEIGHT * popularity
+        if distance is None:
+            distance = self.catalog.distance(point.coordinates, hotspot)
+        distance_score = (
+            0.0 if distance is None else math.exp(-distance / DISTANCE_SCALE_KM)
+        )
+        return (
+            NAME_WEIGHT * name_score
+            + DISTANCE_WEIGHT * distance_score
+            + POPULARITY_WEIGHT * popularity
+        )
+
+    def match(self, point: LocationPoint, limit: int = 5) -> LocationMatch:
+        scored = sorted(
+            (
+                (loc_id, self.score(point, self.catalog.get(loc_id), distance))
+                for loc_id, distance in self.candidates(point).items()
+            ),
+            key=lambda item: item[1],
+            reverse=True,
+        )[:limit]
+        confident = (
+            len(scored) > 0
+            and scored[0][1] >= MIN_CONFIDENT_SCORE
+            and (len(scored) == 1 or scored[0][1] - scored[1][1] >= MIN_MARGIN)
+        )
+        return LocationMatch(point.name, scored, confident)
+
+    def match_all(self, points: Iterable[LocationPoint]) -> Dict[str, LocationMatch]:
+        return {point.name: self.match(point) for point in points}
@@ -1,34 +1,48 @@
-import re
+import os
 import base64
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Callable, List, Optional
 
 from Crypto.PublicKey import RSA
 from Crypto.Cipher import PKCS1_v1_5
 
-LT1_REGEX = r".{1,117}"
-LT2_REGEX = r".{1,256}"
+
+def split_utf8(data: bytes, max_length: int) -> List[bytes]:
+    """Split utf-8 bytes into pieces of at most max_length bytes without breaking a character"""
+    pieces = []
+    start = 0
+    while len(data) - start > max_length:
+        end = start + max_length
+        # step back over continuation bytes (0b10xxxxxx) to a character boundary
+        while data[end] & 0xC0 == 0x80:
+            end -= 1
+        pieces.append(data[start:end])
+        start = end
+    pieces.append(data[start:])
+    return pieces
 
 
 class LongRSAKey:
     def __init__(self, public_key_file: Path):
         self.rsa_key = RSA.import_key(public_key_file.read_bytes())
         self.cipher = PKCS1_v1_5.new(self.rsa_key)
-        
+        # PKCS#1 v1.5 padding takes 11 bytes of every block
+        self.max_length = (self.rsa_key.n.bit_length() + 7 >> 3) - 11
+
     def _encrypt(self, message: str) -> bytes:
         try:
-            max_length = (self.rsa_key.n.bit_length() + 7 >> 3) - 11
-            ct_1 = b""
-            if len(message) > max_length:
-                lt = re.findall(LT1_REGEX, message)
-                for i in lt:
-                    i = i.encode("utf-8")
-                    t1 = self.cipher.encrypt(i)
-                    ct_1 += t1
-                return base64.b64encode(ct_1)
             message = message.encode("utf-8")
-            t = self.cipher.encrypt(message)
-            return base64.b64encode(t)
+            if len(message) <= self.max_length:
+                return base64.b64encode(self.cipher.encrypt(message))
+            return base64.b64encode(
+                b"".join(
+                    self.cipher.encrypt(piece)
+                    for piece in split_utf8(message, self.max_length)
+                )
+            )
         except Exception as e:
             print(e)
             return None
@@ -37,6 +51,103 @@ class LongRSAKey:
         encrypted = self._encrypt(message)
         return encrypted.decode("utf-8")
 
+
+_worker_key: Optional[LongRSAKey] = None
+
+
+def _init_encrypt_worker(public_key_file: Path) -> None:
+    global _worker_key
+    _worker_key = LongRSAKey(public_key_file)
+
+
+def _encrypt_chunk(messages: List[str]) -> List[str]:
+    return [_worker_key.encrypt(message) for message in messages]
+
+
+class LongRSAEncryptEngine:
+    """
+    Encrypt many messages in a worker pool, the results keep the input order.
+
+    Args:
+        public_key_file: the key is loaded once in every worker
+        max_workers: defaults to the number of cpus, at most 4
+        chunk_size: number of messages sent to a worker at a time, batches
+            not larger than this are encrypted inline
+        use_process: use a process pool, otherwise a thread pool
+    """
+
+    def __init__(
+        self,
+        public_key_file: Path,
+        max_workers: Optional[int] = None,
+        chunk_size: int = 32,
+        use_process: bool = True,
+    ):
+        self.public_key_file = public_key_file
+        self.key = LongRSAKey(public_key_file)
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.chunk_size = max(chunk_size, 1)
+        self.use_process = use_process
+
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_process:
+                # spawn instead of fork, the event loop and ui threads must not be copied
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_encrypt_worker,
+                    initargs=(self.public_key_file,),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=_init_encrypt_worker,
+                    initargs=(self.public_key_file,),
+                )
+        return self._executor
+
+    def _chunks(self, messages: List[str]) -> List[List[str]]:
+        return [
+            messages[i : i + self.chunk_size]
+            for i in range(0, len(messages), self.chunk_size)
+        ]
+
+    def encrypt_batch(self, messages: List[str]) -> List[str]:
+        if len(messages) <= self.chunk_size:
+            return [self.key.encrypt(message) for message in messages]
+        results = self.executor.map(_encrypt_chunk, self._chunks(messages))
+        return [encrypted for chunk in results for encrypted in chunk]
+
+    async def encrypt_batch_async(self, messages: List[str]) -> List[str]:
+        if len(messages) <= self.chunk_size:
+            return [self.key.encrypt(message) for message in messages]
+        results = await asyncio.gather(
+            *[self.run(_encrypt_chunk, chunk) for chunk in self._chunks(messages)]
+        )
+        return [encrypted for chunk in results for encrypted in chunk]
+
+    async def encrypt_async(self, message: str, inline_threshold: int = 0) -> str:
+        """Encrypt a single message in the pool unless it is shorter than inline_threshold"""
+        if len(message) < inline_threshold:
+            return self.key.encrypt(message)
+        (encrypted,) = await self.run(_encrypt_chunk, [message])
+        return encrypted
+
+    async def run(self, func: Callable, *args):
+        """Run a picklable module-level function in the pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
 if __name__ == "__main__":
     key = LongRSAKey(Path("public_key.pem"))
     print(key.encrypt('1111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111111'))
\ No newline at end of file
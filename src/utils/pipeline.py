@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+from collections import abc
+from dataclasses import dataclass, field
+from typing import AsyncIterable, Callable, Dict, Iterable, List, Optional, Union
+
+DEFAULT_QUEUE_SIZE = 64
+
+# put into a queue once the previous stage is done
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Counters of a pipeline stage"""
+
+    name: str
+    received: int = 0
+    emitted: int = 0
+    # seconds spent inside the stage function, summed over its workers
+    busy: float = 0.0
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        """Items per second from the first item received until the stage ended"""
+        return self.received / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.received} in, {self.emitted} out, "
+            f"{self.throughput:.1f}/s, busy {self.busy:.2f}s"
+        )
+
+
+@dataclass
+class Stage:
+    """
+    A step of a Pipeline. `func` takes an item and returns the item for the
+    next stage, or None to drop it, it may be a coroutine function. A plain
+    function runs in a thread when `threaded`, otherwise in the event loop.
+    With more than one worker the items may be reordered.
+    """
+
+    name: str
+    func: Callable
+    concurrency: int = 1
+    threaded: bool = False
+    stats: StageStats = field(init=False)
+
+    def __post_init__(self):
+        self.stats = StageStats(self.name)
+
+    async def process(self, item):
+        start = time.monotonic()
+        try:
+            if asyncio.iscoroutinefunction(self.func):
+                return await self.func(item)
+            if self.threaded:
+                return await asyncio.to_thread(self.func, item)
+            return self.func(item)
+        finally:
+            self.stats.busy += time.monotonic() - start
+
+
+class Pipeline:
+    """
+    Stream the items of a source through stages connected by bounded queues.
+
+    Every stage runs `concurrency` workers, a full queue blocks the stage
+    feeding it, so a slow stage holds the source back instead of letting
+    items pile up. The first error of any stage cancels the whole pipeline.
+    """
+
+    def __init__(
+        self,
+        source: Union[AsyncIterable, Iterable],
+        stages: List[Stage],
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ):
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self.source_stats = StageStats("source")
+
+    @property
+    def stats(self) -> Dict[str, StageStats]:
+        return {
+            stats.name: stats
+            for stats in [self.source_stats] + [stage.stats for stage in self.stages]
+        }
+
+    async def _feed(self, queue: asyncio.Queue) -> None:
+        stats = self.source_stats
+        stats.started = time.monotonic()
+        if isinstance(self.source, abc.AsyncIterable):
+            async for item in self.source:
+                stats.received += 1
+                stats.emitted += 1
+                await queue.put(item)
+        else:
+            for item in self.source:
+                stats.received += 1
+                stats.emitted += 1
+                await queue.put(item)
+        stats.finished = time.monotonic()
+        await queue.put(_DONE)
+
+    async def _work(
+        self,
+        stage: Stage,
+        inbox: asyncio.Queue,
+        outbox: Optional[asyncio.Queue],
+    ) -> None:
+        stats = stage.stats
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                # for the sibling workers
+                await inbox.put(_DONE)
+                return
+            if stats.started is None:
+                stats.started = time.monotonic()
+            stats.received += 1
+            result = await stage.process(item)
+            if result is None:
+                continue
+            stats.emitted += 1
+            if outbox is not None:
+                await outbox.put(result)
+
+    async def _run_stage(
+        self,
+        stage: Stage,
+        inbox: asyncio.Queue,
+        outbox: Optional[asyncio.Queue],
+    ) -> None:
+        await asyncio.gather(
+            *[
+                self._work(stage, inbox, outbox)
+                for _ in range(max(stage.concurrency, 1))
+            ]
+        )
+        stage.stats.finished = time.monotonic()
+        if outbox is not None:
+            await outbox.put(_DONE)
+
+    async def run(self) -> Dict[str, StageStats]:
+        """Run until the source is exhausted, returns the stats by stage name"""
+        queues = [
+            asyncio.Queue(maxsize=self.queue_size) for _ in range(len(self.stages))
+        ]
+        tasks = [asyncio.create_task(self._feed(queues[0]))] + [
+            asyncio.create_task(
+                self._run_stage(
+                    stage,
+                    queues[i],
+                    queues[i + 1] if i + 1 < len(queues) else None,
+                )
+            )
+            for i, stage in enumerate(self.stages)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        for stats in self.stats.values():
+            logging.info(f"Pipeline stage {stats}")
+        return self.stats
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+# every value can be overridden in .env, e.g. BIRDREPORT_MAX_RPS=5
+RATE_LIMIT_DEFAULTS = {
+    "api.birdreport.cn": ("BIRDREPORT", 10.0, 10),
+    "api.ebird.org": ("EBIRD", 10.0, 10),
+}
+DEFAULT_MAX_RPS = 10.0
+DEFAULT_BURST = 10
+
+DEFAULT_RETRY_ATTEMPTS = 3
+DEFAULT_RETRY_MULTIPLIER = 1.0
+DEFAULT_RETRY_MAX_WAIT = 30.0
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        return default
+
+
+class TokenBucket:
+    """
+    Allow `rate` acquisitions per second with bursts of up to `capacity`.
+
+    Tokens are reserved synchronously and may go negative, a caller then
+    sleeps until its reservation is covered. No lock is needed, so one bucket
+    can be shared by all coroutines (and event loops) of the process.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        # no token is handed out before this, see penalize
+        self.blocked_until = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.tokens + (now - self.updated_at) * self.rate, self.capacity
+        )
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        """Take a token, return the seconds to wait before using it"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.blocked_until - self.updated_at)
+
+    async def acquire(self) -> None:
+        # wait out a penalty before reserving, so the callers held back by it
+        # resume at the configured rate instead of all at once
+        while (blocked := self.blocked_until - time.monotonic()) > 0:
+            await asyncio.sleep(blocked)
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def penalize(self, seconds: float) -> None:
+        """
+        Hold back every caller for `seconds`, e.g. when the server asks to
+        retry later. Overlapping penalties do not add up, the requests in
+        flight together all get the same Retry-After.
+        """
+        if self.rate <= 0:
+            return
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+_host_limiters: Dict[str, TokenBucket] = {}
+
+
+def get_host_limiter(host: str) -> TokenBucket:
+    """The bucket shared by every request to host, configured from the environment"""
+    if host not in _host_limiters:
+        prefix, rate, burst = RATE_LIMIT_DEFAULTS.get(
+            host, (None, DEFAULT_MAX_RPS, DEFAULT_BURST)
+        )
+        if prefix is not None:
+            rate = env_float(f"{prefix}_MAX_RPS", rate)
+            burst = env_float(f"{prefix}_BURST", burst)
+        _host_limiters[host] = TokenBucket(rate, burst)
+    return _host_limiters[host]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either a number of seconds or an http date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def retry_attempts() -> int:
+    return int(env_float("API_RETRY_ATTEMPTS", DEFAULT_RETRY_ATTEMPTS))
+
+
+def stop_after_configured_attempts(retry_state) -> bool:
+    """tenacity stop, the attempts are read from the environment on every call"""
+    return retry_state.attempt_number >= retry_attempts()
+
+
+def wait_backoff_or_retry_after(retry_state) -> float:
+    """
+    tenacity wait, exponential backoff with jitter, or the Retry-After of the
+    server (plus a little jitter) when there is one
+    """
+    max_wait = env_float("API_RETRY_MAX_WAIT", DEFAULT_RETRY_MAX_WAIT)
+    exception = retry_state.outcome.exception()
+    retry_after = getattr(exception, "retry_after", None)
+    if retry_after is not None:
+        return min(retry_after * random.uniform(1.0, 1.1), max_wait)
+
+    multiplier = env_float("API_RETRY_MULTIPLIER", DEFAULT_RETRY_MULTIPLIER)
+    backoff = min(multiplier * 2 ** (retry_state.attempt_number - 1), max_wait)
+    # half fixed, half random, so clients failing together spread out
+    return backoff / 2 + random.uniform(0, backoff / 2)
@@ -0,0 +1,303 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Sequence, Tuple
+
+from src import cache_path, database_path
+
+# bump when the tables change, older files are rebuilt from the json sources
+SCHEMA_VERSION = 1
+
+HOTSPOT_SOURCES = ("ebird_cn_hotspots", "ebird_other_hotspots")
+EBIRD_TAXONOMY_SOURCE = "ebird_taxonomy"
+BIRDREPORT_TAXON_INFOS_SOURCE = "birdreport_taxon_infos"
+SOURCES = HOTSPOT_SOURCES + (EBIRD_TAXONOMY_SOURCE, BIRDREPORT_TAXON_INFOS_SOURCE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    last_update_date TEXT
+);
+CREATE TABLE IF NOT EXISTS hotspots (
+    source TEXT NOT NULL,
+    loc_id TEXT NOT NULL,
+    subnational1_code TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (source, loc_id)
+);
+CREATE INDEX IF NOT EXISTS hotspots_subnational1_code
+    ON hotspots (subnational1_code);
+CREATE TABLE IF NOT EXISTS ebird_taxonomy (
+    sci_name TEXT PRIMARY KEY,
+    species_code TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS birdreport_taxon_infos (
+    version TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (version, id)
+);
+"""
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class LazyTable(Mapping[str, Dict]):
+    """
+    Read only mapping over the rows of one table selection.
+
+    Keys, length and membership are answered by sqlite, a row is only
+    decoded from json when it is first read and is then kept.
+    """
+
+    def __init__(
+        self,
+        db: "ReferenceDatabase",
+        table: str,
+        key_column: str,
+        where: str,
+        params: Sequence = (),
+    ):
+        self.db = db
+        self.table = table
+        self.key_column = key_column
+        self.where = where
+        self.params = tuple(params)
+        self._rows: Dict[str, Dict] = {}
+        self._complete = False
+        self._len: Optional[int] = None
+
+    def _query(self, columns: str, extra: str = "", params: Sequence = ()):
+        return self.db.execute(
+            f"SELECT {columns} FROM {self.table} WHERE {self.where}{extra} "
+            "ORDER BY rowid",
+            self.params + tuple(params),
+        )
+
+    def __getitem__(self, key: str) -> Dict:
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+        if self._complete:
+            raise KeyError(key)
+        found = self._query("data", f" AND {self.key_column} = ?", (key,))
+        if not found:
+            raise KeyError(key)
+        row = self._rows[key] = json.loads(found[0][0])
+        return row
+
+    def __contains__(self, key) -> bool:
+        if key in self._rows:
+            return True
+        if self._complete:
+            return False
+        return bool(self._query("1", f" AND {self.key_column} = ?", (key,)))
+
+    def __iter__(self) -> Iterator[str]:
+        if self._complete:
+            return iter(list(self._rows))
+        return iter([key for key, in self._query(self.key_column)])
+
+    def __len__(self) -> int:
+        if self._len is None:
+            self._len = self.db.execute(
+                f"SELECT count(*) FROM {self.table} WHERE {self.where}", self.params
+            )[0][0]
+        return self._len
+
+    def load_all(self) -> Dict[str, Dict]:
+        """Decode every row not read yet in one query, returns the rows by key"""
+        if not self._complete:
+            rows = {}
+            for key, data in self._query(f"{self.key_column}, data"):
+                rows[key] = self._rows.get(key) or json.loads(data)
+            self._rows = rows
+            self._complete = True
+            self._len = len(rows)
+        return self._rows
+
+    def items(self):
+        return self.load_all().items()
+
+    def values(self):
+        return self.load_all().values()
+
+
+class ReferenceDatabase:
+    """
+    The reference json files of database_path compiled into one sqlite file.
+
+    Every source is imported again when its json file changes (by mtime and
+    size), so the files stay the ones that are edited and shipped, and the
+    app only stats them at startup instead of parsing them.
+    """
+
+    def __init__(self, db_file: Path, source_dir: Path):
+        self.db_file = db_file
+        self.source_dir = source_dir
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        try:
+            conn = self._open()
+        except sqlite3.DatabaseError:
+            logging.warning(f"Rebuild the broken reference database {self.db_file}")
+            if self.db_file.exists():
+                os.remove(self.db_file)
+            conn = self._open()
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                for (table,) in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'"
+                ).fetchall():
+                    conn.execute(f"DROP TABLE {table}")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.executescript(_SCHEMA)
+            conn.commit()
+        except sqlite3.DatabaseError:
+            conn.close()
+            raise
+        return conn
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def execute(self, sql: str, params: Sequence = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def source_file(self, source: str) -> Path:
+        return self.source_dir / f"{source}.json"
+
+    def _signature(self, source: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.source_file(source).stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def sync(self, sources: Iterable[str] = SOURCES) -> None:
+        """Import again every source whose json file changed since the last sync"""
+        for source in sources:
+            signature = self._signature(source)
+            stored = self.execute(
+                "SELECT mtime_ns, size FROM sources WHERE name = ?", (source,)
+            )
+            if (tuple(stored[0]) if stored else None) == signature:
+                continue
+            logging.info(f"Import {source} into the reference database")
+            data = None
+            if signature is not None:
+                with open(self.source_file(source), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            self._import(source, data, signature)
+
+    def _import(self, source: str, data, signature: Optional[Tuple[int, int]]) -> None:
+        with self._lock, self._conn:
+            conn = self._conn
+            conn.execute("DELETE FROM sources WHERE name = ?", (source,))
+            last_update_date = None
+            if source in HOTSPOT_SOURCES:
+                conn.execute("DELETE FROM hotspots WHERE source = ?", (source,))
+                if data is not None:
+                    last_update_date = data["last_update_date"]
+                    # older files are keyed by subnational1Code|locName
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO hotspots VALUES (?, ?, ?, ?)",
+                        (
+                            (
+                                source,
+                                hotspot["locId"],
+                                hotspot.get("subnational1Code"),
+                                _dumps(hotspot),
+                            )
+                            for hotspot in data["data"].values()
+                        ),
+                    )
+            elif source == EBIRD_TAXONOMY_SOURCE:
+                conn.execute("DELETE FROM ebird_taxonomy")
+                if data is not None:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO ebird_taxonomy VALUES (?, ?, ?)",
+                        (
+                            (
+                                taxon_info["sciName"],
+                                taxon_info.get("speciesCode"),
+                                _dumps(taxon_info),
+                            )
+                            for taxon_info in data
+                        ),
+                    )
+            elif source == BIRDREPORT_TAXON_INFOS_SOURCE:
+                conn.execute("DELETE FROM birdreport_taxon_infos")
+                if data is not None:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO birdreport_taxon_infos "
+                        "VALUES (?, ?, ?)",
+                        (
+                            (version, str(taxon_id), _dumps(taxon_info))
+                            for version, taxon_infos in data.items()
+                            for taxon_id, taxon_info in taxon_infos.items()
+                        ),
+                    )
+            else:
+                raise ValueError(f"Unknown reference source {source}")
+            if signature is not None:
+                conn.execute(
+                    "INSERT INTO sources VALUES (?, ?, ?, ?)",
+                    (source, *signature, last_update_date),
+                )
+
+    def has_source(self, source: str) -> bool:
+        return bool(self.execute("SELECT 1 FROM sources WHERE name = ?", (source,)))
+
+    def last_update_date(self, source: str) -> Optional[str]:
+        found = self.execute(
+            "SELECT last_update_date FROM sources WHERE name = ?", (source,)
+        )
+        return found[0][0] if found else None
+
+    def hotspots(self, source: str) -> Optional[LazyTable]:
+        """The hotspots of a source by locId, None when its file does not exist"""
+        if not self.has_source(source):
+            return None
+        return LazyTable(self, "hotspots", "loc_id", "source = ?", (source,))
+
+    def ebird_taxonomy(self) -> Optional[LazyTable]:
+        """The eBird taxonomy by sciName, None when its file does not exist"""
+        if not self.has_source(EBIRD_TAXONOMY_SOURCE):
+            return None
+        return LazyTable(self, "ebird_taxonomy", "sci_name", "1")
+
+    def birdreport_taxon_infos(self, version: str) -> Optional[LazyTable]:
+        """The birdreport taxa of a version ("G3", "Z4") by id"""
+        if not self.has_source(BIRDREPORT_TAXON_INFOS_SOURCE):
+            return None
+        return LazyTable(
+            self, "birdreport_taxon_infos", "id", "version = ?", (version,)
+        )
+
+
+_default_db: Optional[ReferenceDatabase] = None
+
+
+def get_reference_db() -> ReferenceDatabase:
+    """The reference database of database_path, compiled under cache_path"""
+    global _default_db
+    if _default_db is None:
+        _default_db = ReferenceDatabase(cache_path / "reference.sqlite3", database_path)
+    return _default_db
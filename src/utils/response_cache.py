@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from src import cache_path
+from src.utils.rate_limit import env_float
+
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+DAY = 24 * 60 * 60
+
+
+def is_not_none(value: Any) -> bool:
+    return value is not None
+
+
+class ResponseCache:
+    """
+    Persistent cache of api responses, one json file per endpoint + params.
+
+    Entries expire after the ttl given when reading them. When the files grow
+    beyond `max_size` bytes the least recently used ones (by mtime, which is
+    touched on every hit) are removed. A disabled cache neither reads nor
+    writes anything.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path],
+        max_size: int = DEFAULT_MAX_SIZE,
+        enabled: bool = True,
+    ):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.enabled = enabled and cache_dir is not None
+
+        self._lock = threading.Lock()
+        self._sizes: Optional[Dict[Path, int]] = None
+
+    @staticmethod
+    def make_key(endpoint: str, params: Optional[Dict]) -> str:
+        normalized = json.dumps(
+            {
+                "endpoint": endpoint,
+                "params": {k: str(v) for k, v in (params or {}).items()},
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _path(self, endpoint: str, params: Optional[Dict]) -> Path:
+        return self.cache_dir / f"{self.make_key(endpoint, params)}.json"
+
+    def _index(self) -> Dict[Path, int]:
+        if self._sizes is None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._sizes = {
+                path: path.stat().st_size for path in self.cache_dir.glob("*.json")
+            }
+        return self._sizes
+
+    def get(
+        self, endpoint: str, params: Optional[Dict], ttl: float
+    ) -> Tuple[bool, Any]:
+        """Return (hit, value)"""
+        path = self._path(endpoint, params)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return False, None
+        if time.time() - entry["created_at"] > ttl:
+            return False, None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return True, entry["data"]
+
+    def set(self, endpoint: str, params: Optional[Dict], value: Any) -> None:
+        path = self._path(endpoint, params)
+        entry = {"endpoint": endpoint, "created_at": time.time(), "data": value}
+        with self._lock:
+            sizes = self._index()
+            tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            sizes[path] = path.stat().st_size
+            self._evict(sizes)
+
+    def _evict(self, sizes: Dict[Path, int]) -> None:
+        total = sum(sizes.values())
+        if total <= self.max_size:
+            return
+
+        def last_used(path: Path) -> float:
+            try:
+                return path.stat().st_mtime
+            except OSError:
+                return 0.0
+
+        for path in sorted(sizes, key=last_used):
+            if total <= self.max_size:
+                break
+            total -= sizes.pop(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in list(self._index()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._sizes = {}
+
+    async def fetch(
+        self,
+        endpoint: str,
+        params: Optional[Dict],
+        ttl: float,
+        fetch_func: Callable[[], Awaitable],
+        should_store: Optional[Callable[[Any], bool]] = None,
+        refresh: bool = False,
+    ):
+        """
+        Return the cached response or call fetch_func and cache its result.
+
+        `refresh` skips the lookup but still stores the new response. Only
+        results passing `should_store` (by default: not None) are stored.
+        """
+        if self.enabled and not refresh:
+            hit, value = await asyncio.to_thread(self.get, endpoint, params, ttl)
+            if hit:
+                return value
+
+        value = await fetch_func()
+
+        if should_store is None:
+            should_store = is_not_none
+        if self.enabled and should_store(value):
+            await asyncio.to_thread(self.set, endpoint, params, value)
+        return value
+
+
+_default_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    The cache under cache_path shared by the api clients, RESPONSE_CACHE=0 in
+    .env disables it and RESPONSE_CACHE_MAX_MB bounds its size
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache(
+            cache_path / "responses",
+            max_size=int(
+                env_float("RESPONSE_CACHE_MAX_MB", DEFAULT_MAX_SIZE / 1024 / 1024)
+                * 1024
+                * 1024
+            ),
+            enabled=os.getenv("RESPONSE_CACHE", "1") != "0",
+        )
+    return _default_cache
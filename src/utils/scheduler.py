@@ -0,0 +1,222 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+from src.utils.api_exceptions import RateLimitError, ServerError
+from src.utils.rate_limit import TokenBucket
+
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_MAX_RPS = 10.0
+# successful jobs the latency baseline is the minimum of, so that it follows
+# the server instead of the fastest answer ever seen
+DEFAULT_LATENCY_WINDOW = 32
+
+
+def is_congestion(exception: BaseException) -> bool:
+    """Errors telling that the server is overloaded"""
+    return isinstance(exception, (RateLimitError, ServerError))
+
+
+class AdaptiveScheduler:
+    """
+    Run coroutines in a sliding window whose size adapts to the server.
+
+    A new job starts as soon as one finishes, there is no barrier between
+    batches. The window grows by one for every window of successful jobs and
+    halves on a 429/5xx error or when the latency grows beyond
+    `latency_tolerance` times the fastest of the last `latency_window` jobs
+    (AIMD), at most once per round trip. Independently, job starts are spaced
+    to keep under `max_rps`.
+
+    The latency signal only makes sense for jobs of comparable cost, give
+    jobs whose duration depends on their size their own scheduler, or turn
+    the signal off with `latency_tolerance=None`.
+    """
+
+    def __init__(
+        self,
+        initial_concurrency: int = DEFAULT_INITIAL_CONCURRENCY,
+        min_concurrency: int = DEFAULT_MIN_CONCURRENCY,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_rps: Optional[float] = DEFAULT_MAX_RPS,
+        latency_tolerance: Optional[float] = 3.0,
+        decrease_factor: float = 0.5,
+        latency_window: int = DEFAULT_LATENCY_WINDOW,
+    ):
+        self.min_concurrency = max(min_concurrency, 1)
+        self.max_concurrency = max(max_concurrency, self.min_concurrency)
+        self.limit = float(
+            min(max(initial_concurrency, self.min_concurrency), self.max_concurrency)
+        )
+        self.max_rps = max_rps
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+
+        self.in_flight = 0
+        self.min_latency: Optional[float] = None
+        self.avg_latency: Optional[float] = None
+        self._latencies: deque = deque(maxlen=max(latency_window, 1))
+
+        self._condition = asyncio.Condition()
+        self._pacer = TokenBucket(max_rps, 1) if max_rps else None
+        self._last_decrease = 0.0
+
+    @property
+    def concurrency(self) -> int:
+        return int(self.limit)
+
+    async def _acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.concurrency)
+            self.in_flight += 1
+        if self._pacer is not None:
+            try:
+                await self._pacer.acquire()
+            except BaseException:
+                # cancelled while paced, give the slot back
+                await self._release()
+                raise
+
+    async def _release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            # only as many waiters as there are free slots, waking all of
+            # them on every release is quadratic in the number waiting
+            free = self.concurrency - self.in_flight
+            if free > 0:
+                self._condition.notify(free)
+
+    def _decrease(self, now: float) -> None:
+        # one decrease per round trip, the jobs in flight saw the same congestion
+        if (
+            self.avg_latency is not None
+            and now - self._last_decrease < self.avg_latency
+        ):
+            return
+        self._last_decrease = now
+        self.limit = max(self.limit * self.decrease_factor, self.min_concurrency)
+
+    def throttled(self) -> None:
+        """
+        Report a 429/5xx answer the job retries by itself, e.g. inside
+        tenacity, the window shrinks as if the job had failed
+        """
+        self._decrease(asyncio.get_running_loop().time())
+
+    def _on_success(self, latency: float, now: float) -> None:
+        self._latencies.append(latency)
+        self.min_latency = min(self._latencies)
+        if self.avg_latency is None:
+            self.avg_latency = latency
+        else:
+            self.avg_latency = 0.8 * self.avg_latency + 0.2 * latency
+
+        if (
+            self.latency_tolerance is not None
+            and latency > self.min_latency * self.latency_tolerance
+        ):
+            self._decrease(now)
+        else:
+            self.limit = min(self.limit + 1 / self.limit, self.max_concurrency)
+
+    async def run(self, func: Callable[..., Awaitable], *args, **kwargs):
+        """
+        Run func in the window. Its latency is compared with the jobs run
+        before, which must be of comparable cost, see the class docstring.
+        """
+        await self._acquire()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            if is_congestion(e):
+                self._decrease(loop.time())
+            raise
+        else:
+            now = loop.time()
+            self._on_success(now - start, now)
+            return result
+        finally:
+            await self._release()
+
+    async def map(
+        self,
+        func: Callable[..., Awaitable],
+        items: Iterable,
+        return_exceptions: bool = False,
+    ) -> List:
+        """
+        Run func on every item, the results keep the order of items.
+
+        At most max_concurrency workers take the items one after another, so
+        a long list does not park a waiting coroutine per item.
+        """
+        items = list(items)
+        results: List = [None] * len(items)
+        pending = iter(enumerate(items))
+
+        async def worker():
+            for i, item in pending:
+                try:
+                    results[i] = await self.run(func, item)
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    results[i] = e
+
+        workers = [
+            asyncio.create_task(worker())
+            for _ in range(min(self.max_concurrency, len(items)))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        return results
+
+
+class AdaptiveChunkSize:
+    """
+    Number of ids to request at once from a bulk endpoint.
+
+    After every response the size is steered towards the one that would have
+    returned about `target_rows` rows within `target_latency` seconds, growing
+    at most twice per response. A failed request halves it.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 1,
+        maximum: Optional[int] = None,
+        target_latency: float = 5.0,
+        target_rows: int = 5000,
+    ):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum or initial, self.minimum)
+        self.target_latency = target_latency
+        self.target_rows = target_rows
+        self._size = float(min(max(initial, self.minimum), self.maximum))
+
+    @property
+    def size(self) -> int:
+        return int(self._size)
+
+    def _clamp(self, size: float) -> float:
+        return min(max(size, self.minimum), self.maximum)
+
+    def record(self, ids: int, rows: int, latency: float) -> None:
+        scale = min(
+            self.target_latency / max(latency, 1e-3),
+            self.target_rows / max(rows, 1),
+            2.0,
+        )
+        # smoothed, a single odd response should not swing the size
+        self._size = self._clamp(0.5 * self._size + 0.5 * ids * scale)
+
+    def shrink(self) -> None:
+        self._size = self._clamp(self._size / 2)
@@ -0,0 +1,142 @@
+import heapq
+import math
+from collections import defaultdict
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# about 11km of latitude
+DEFAULT_CELL_SIZE = 0.1
+
+
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great circle distance in km"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_coordinates(lat, lng) -> Optional[Tuple[float, float]]:
+    """(lat, lng) as floats, None when missing or invalid"""
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or (lat == 0 and lng == 0):
+        return None
+    return lat, lng
+
+
+class SpatialIndex:
+    """
+    Points bucketed in a grid of `cell_size` degrees.
+
+    Queries only visit the cells around the query point, ring by ring, and
+    stop once no unvisited cell can hold a closer point.
+    """
+
+    def __init__(
+        self,
+        points: Iterable[Tuple[Hashable, float, float]],
+        cell_size: float = DEFAULT_CELL_SIZE,
+    ):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[Tuple[Hashable, float, float]]] = (
+            defaultdict(list)
+        )
+        for key, lat, lng in points:
+            self.cells[self._cell(lat, lng)].append((key, lat, lng))
+        self.size = sum(len(cell) for cell in self.cells.values())
+        if self.cells:
+            rows = [row for row, _ in self.cells]
+            cols = [col for _, col in self.cells]
+            self._bounds = (min(rows), max(rows), min(cols), max(cols))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+
+    def _ring(self, row: int, col: int, r: int):
+        if r == 0:
+            yield row, col
+            return
+        for c in range(col - r, col + r + 1):
+            yield row - r, c
+            yield row + r, c
+        for rr in range(row - r + 1, row + r):
+            yield rr, col - r
+            yield rr, col + r
+
+    def _ring_min_distance(self, lat: float, r: int) -> float:
+        """Lower bound of the distance to any point in ring r or beyond"""
+        if r <= 1:
+            return 0.0
+        # at least r - 1 whole cells away, and a degree of longitude is
+        # shortest at the highest latitude those cells reach
+        max_lat = min(abs(lat) + (r + 1) * self.cell_size, 90.0)
+        cell_km = self.cell_size * KM_PER_DEGREE * math.cos(math.radians(max_lat))
+        return (r - 1) * cell_km
+
+    def _max_ring(self, row: int, col: int) -> int:
+        min_row, max_row, min_col, max_col = self._bounds
+        return max(
+            abs(row - min_row),
+            abs(row - max_row),
+            abs(col - min_col),
+            abs(col - max_col),
+        )
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int = 5,
+        max_distance: Optional[float] = None,
+    ) -> List[Tuple[Hashable, float]]:
+        """Up to k (key, distance in km) pairs, closest first"""
+        if not self.cells or k <= 0:
+            return []
+        row, col = self._cell(lat, lng)
+        # max heap of the k best as (-distance, key)
+        best: List[Tuple[float, Hashable]] = []
+        for r in range(self._max_ring(row, col) + 1):
+            bound = self._ring_min_distance(lat, r)
+            if max_distance is not None and bound > max_distance:
+                break
+            if len(best) == k and -best[0][0] <= bound:
+                break
+            for cell in self._ring(row, col, r):
+                for key, p_lat, p_lng in self.cells.get(cell, ()):
+                    distance = haversine(lat, lng, p_lat, p_lng)
+                    if max_distance is not None and distance > max_distance:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, key))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, key))
+        return [(key, -neg) for neg, key in sorted(best, reverse=True)]
+
+    def within(
+        self, lat: float, lng: float, radius: float
+    ) -> List[Tuple[Hashable, float]]:
+        """Every (key, distance in km) pair within radius km, closest first"""
+        if not self.cells:
+            return []
+        row, col = self._cell(lat, lng)
+        found = []
+        for r in range(self._max_ring(row, col) + 1):
+            if self._ring_min_distance(lat, r) > radius:
+                break
+            for cell in self._ring(row, col, r):
+                for key, p_lat, p_lng in self.cells.get(cell, ()):
+                    distance = haversine(lat, lng, p_lat, p_lng)
+                    if distance <= radius:
+                        found.append((key, distance))
+        found.sort(key=lambda item: item[1])
+        return found
@@ -1,9 +1,13 @@
 import json
 from pathlib import Path
-from typing import List
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple, Union
 
 from src.utils.location import AB_LOCATION
-from src import database_path
+from src.utils.reference_db import (
+    BIRDREPORT_TAXON_INFOS_SOURCE,
+    EBIRD_TAXONOMY_SOURCE,
+    get_reference_db,
+)
 
 Z3_TO_Z4 = {
     "大山雀": "欧亚大山雀",
@@ -33,6 +37,60 @@ def process_loc(loc):
             return prov
 
 
+# bit m set for every month m in 1..12
+ALL_MONTHS = 0b1111111111110
+
+
+def parse_months(spec: str) -> int:
+    """Month bitmask of a "time" condition, e.g. "1-3,5-9" """
+    mask = 0
+    for tr in spec.split(","):
+        if "-" in tr:
+            start, end = tr.split("-")
+            for month in range(int(start), int(end) + 1):
+                mask |= 1 << month
+        else:
+            mask |= 1 << int(tr)
+    return mask
+
+
+class TaxonRule(NamedTuple):
+    name: str
+    # "prov" or "prov-city" names, None matches everywhere
+    locs: Optional[FrozenSet[str]]
+    months: int
+
+
+class CompiledTaxonMap(dict):
+    """latin name -> converted latin name, or the ordered rules choosing it"""
+
+
+def compile_taxon_map(taxon_map: Dict) -> CompiledTaxonMap:
+    """Parse the conditions of a ch4_to_eb_taxon_map once"""
+    compiled = CompiledTaxonMap()
+    for latin_name, converted_latinname in taxon_map.items():
+        if isinstance(converted_latinname, List):
+            compiled[latin_name] = tuple(
+                TaxonRule(
+                    convert_cond["name"],
+                    (
+                        frozenset(process_loc(loc) for loc in convert_cond["loc"])
+                        if "loc" in convert_cond
+                        else None
+                    ),
+                    (
+                        parse_months(convert_cond["time"])
+                        if "time" in convert_cond
+                        else ALL_MONTHS
+                    ),
+                )
+                for convert_cond in converted_latinname
+            )
+        else:
+            compiled[latin_name] = converted_latinname
+    return compiled
+
+
 def highlight_rows(row, changed_idx, questionalble_idx):
     if row.name in changed_idx:
         return ["color: green"] * len(row)
@@ -47,22 +105,15 @@ def preview_taxon_map(map_file: Path, output_path: Path):
 
     taxon_map = json.load(open(map_file, "r", encoding="utf-8"))
 
-    br_taxon_infos = json.load(
-        open(database_path / "birdreport_taxon_infos.json", "r", encoding="utf-8")
-    )
+    reference_db = get_reference_db()
+    reference_db.sync((BIRDREPORT_TAXON_INFOS_SOURCE, EBIRD_TAXONOMY_SOURCE))
     br_taxon_infos = {
         id: taxon_info
-        for id, taxon_info in br_taxon_infos["Z4"].items()
+        for id, taxon_info in reference_db.birdreport_taxon_infos("Z4").items()
         if int(id) >= 4000 and int(id) < 9000
     }
 
-    ebird_taxon_infos = json.load(
-        open(database_path / "ebird_taxonomy.json", "r", encoding="utf-8")
-    )
-
-    ebird_taxon_infos = {
-        taxon_info["sciName"]: taxon_info for taxon_info in ebird_taxon_infos
-    }
+    ebird_taxon_infos = reference_db.ebird_taxonomy()
 
     header = ["原学名", "原俗名", "", "现学名", "现俗名", "备注"]
 
@@ -141,35 +192,87 @@ def preview_taxon_map(map_file: Path, output_path: Path):
     df.to_html(output_path, index=False)
 
 
-def convert_taxon_z4_ebird(report, taxon_map):
-    obs = report["obs"]
+def convert_taxon_z4_ebird(report, taxon_map: Union[CompiledTaxonMap, Dict]) -> None:
+    """Convert the latin names of the observations of report in place"""
+    if not isinstance(taxon_map, CompiledTaxonMap):
+        taxon_map = compile_taxon_map(taxon_map)
+
     prov = report["province_name"]
     city = report["city_name"] if "city_name" in report else ""
     _, month, _ = report["start_time"].split(" ")[0].split("-")
+    _convert_taxons(report["obs"], taxon_map, prov, city, month, {})
 
+
+def _convert_taxons(
+    obs: List[Dict],
+    taxon_map: CompiledTaxonMap,
+    prov: str,
+    city: str,
+    month: str,
+    resolved: Dict[str, Optional[str]],
+) -> None:
+    # the result only depends on the latin name for a given place and month
+    prov_city = f"{prov}-{city}"
+    month_bit = 1 << int(month)
     for taxon in obs:
         latin_name = taxon["latinname"].strip()
-        if latin_name in taxon_map:
-            converted_latinname = taxon_map[latin_name]
-            if isinstance(converted_latinname, List):
-                for idx, convert_cond in enumerate(converted_latinname):
-                    if "loc" in convert_cond:
-                        locs_cond = [process_loc(loc) for loc in convert_cond["loc"]]
-                        if not ((prov in locs_cond) or (f"{prov}-{city}" in locs_cond)):
-                            continue
-                    if "time" in convert_cond:
-                        # "time" can be "1-3,5-9"
-                        time_ranges = convert_cond["time"].split(",")
-                        time_range = set()
-                        for tr in time_ranges:
-                            if "-" in tr:
-                                start, end = tr.split("-")
-                                time_range.update(range(int(start), int(end) + 1))
-                            else:
-                                time_range.add(int(tr))
-                        if int(month) not in time_range:
-                            continue
-                    taxon["latinname"] = convert_cond["name"]
-                    break
-            else:
-                taxon["latinname"] = converted_latinname
+        if latin_name not in resolved:
+            resolved[latin_name] = resolve_taxon(
+                taxon_map.get(latin_name), prov, prov_city, month_bit
+            )
+        converted_latinname = resolved[latin_name]
+        if converted_latinname is not None:
+            taxon["latinname"] = converted_latinname
+
+
+def convert_reports_z4_ebird(
+    reports: Iterable[Dict],
+    taxon_map: Union[CompiledTaxonMap, Dict],
+    resolved_by_context: Optional[
+        Dict[Tuple[str, str, str], Dict[str, Optional[str]]]
+    ] = None,
+) -> None:
+    """
+    Convert the observations of many reports in place at once.
+
+    Reports are grouped by (province, city, month), every distinct latin name
+    is resolved once per group no matter how many reports share it. Passing
+    the same `resolved_by_context` to several calls shares that work between
+    them, e.g. when the reports are streamed.
+    """
+    if not isinstance(taxon_map, CompiledTaxonMap):
+        taxon_map = compile_taxon_map(taxon_map)
+
+    if resolved_by_context is None:
+        resolved_by_context = {}
+    for report in reports:
+        prov = report["province_name"]
+        city = report["city_name"] if "city_name" in report else ""
+        _, month, _ = report["start_time"].split(" ")[0].split("-")
+        context = (prov, city, month)
+        if context not in resolved_by_context:
+            resolved_by_context[context] = {}
+        _convert_taxons(
+            report["obs"], taxon_map, prov, city, month, resolved_by_context[context]
+        )
+
+
+def resolve_taxon(
+    converted: Union[str, Tuple[TaxonRule, ...], None],
+    prov: str,
+    prov_city: str,
+    month_bit: int,
+) -> Optional[str]:
+    if converted is None or isinstance(converted, str):
+        return converted
+    for rule in converted:
+        if (
+            rule.locs is not None
+            and prov not in rule.locs
+            and prov_city not in rule.locs
+        ):
+            continue
+        if not rule.months & month_bit:
+            continue
+        return rule.name
+    return None
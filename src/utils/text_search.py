@@ -0,0 +1,139 @@
+import heapq
+import unicodedata
+from collections import defaultdict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from src.utils.lazy_import import lazy_import
+
+fuzz = lazy_import("fuzzywuzzy.fuzz")
+
+# traditional -> simplified characters common in place names, enough to match
+# the Taiwan / Hong Kong / Macao hotspots with a simplified query and back
+_T2S_PAIRS = (
+    "臺台 灣湾 園园 東东 國国 門门 濕湿 觀观 蘭兰 區区 嶺岭 過过 號号 龍龙 關关 頭头 "
+    "濱滨 頂顶 魯鲁 閣阁 壢坜 態态 陽阳 遊游 島岛 樂乐 興兴 車车 華华 會会 鳥鸟 墾垦 "
+    "魚鱼 風风 環环 線线 漁渔 復复 豐丰 烏乌 寶宝 長长 崙仑 宮宫 鳳凤 業业 萬万 綠绿 "
+    "鎮镇 營营 軍军 峽峡 鐵铁 灘滩 雙双 運运 員员 鹽盐 漢汉 霧雾 溝沟 護护 蘆芦 圍围 "
+    "親亲 後后 楊杨 廟庙 羅罗 縣县 與与 驗验 務务 紀纪 腳脚 場场 橋桥 雲云 馬马 學学 "
+    "農农 嶼屿 蓮莲 莊庄 雞鸡 礦矿 點点 紅红 廣广 廠厂 鄉乡 間间 開开 電电 達达 遠远 "
+    "邊边 進进 連连 選选 還还 鄰邻 醫医 銀银 錦锦 鐘钟 陰阴 陸陆 隊队 際际 隱隐 難难 "
+    "靈灵 韓韩 項项 順顺 領领 題题 顏颜 類类 飛飞 館馆 駐驻 體体 鬥斗 鮮鲜 鳴鸣 鴨鸭 "
+    "鴻鸿 鵝鹅 鷹鹰 麥麦 黃黄 齊齐 龜龟 巖岩 崗岗 峯峰 濟济 澗涧 測测 湧涌 溫温 濤涛 "
+    "瀾澜 灑洒 爐炉 為为 無无 熱热 燈灯 燒烧 牆墙 獅狮 現现 畫画 當当 發发 盡尽 監监 "
+    "盤盘 碼码 確确 禪禅 禮礼 種种 穀谷 積积 窪洼 窯窑 築筑 簡简 糧粮 約约 級级 細细 "
+    "終终 組组 經经 結结 給给 統统 絲丝 維维 網网 緣缘 總总 繞绕 續续 聖圣 聯联 聲声 "
+    "舊旧 藝艺 節节 葉叶 蓋盖 蒼苍 蔣蒋 蕭萧 薩萨 藍蓝 蘇苏 處处 蟲虫 術术 衛卫 裏里 "
+    "裡里 補补 見见 視视 覺觉 計计 記记 許许 設设 訪访 證证 詩诗 話话 誠诚 語语 說说 "
+    "調调 請请 論论 謝谢 識识 讀读 變变 讓让 豬猪 貝贝 財财 貢贡 貨货 貴贵 買买 費费 "
+    "賀贺 資资 賓宾 賞赏 賢贤 賣卖 質质 賴赖 趙赵 軒轩 較较 輕轻 載载 輔辅 輝辉 轉转 "
+    "辦办 迴回 這这 違违 遙遥 適适 遲迟 遼辽 鄭郑 鄧邓 釋释 鈴铃 銅铜 鋪铺 鋼钢 錄录 "
+    "錢钱 鍋锅 鎖锁 鏡镜 鑄铸 閃闪 閉闭 閒闲 閘闸 闊阔 陳陈 險险 雜杂 離离 靜静 響响 "
+    "頁页 須须 預预 頓顿 頻频 額额 願愿 顯显 飄飘 飯饭 餘余 駕驾 騎骑 驚惊 鬧闹 鯉鲤 "
+    "鯨鲸 鵲鹊 鶴鹤 鷺鹭 鹹咸 麗丽 黨党 溼湿 濁浊 滬沪 淺浅 澤泽 潔洁 潤润 渾浑 滿满 "
+    "漲涨 瀨濑 瀉泻 燦灿 獎奖 瑤瑶 璽玺 碩硕 祿禄 禎祯 穩稳 窩窝 筍笋 範范 篤笃 籃篮 "
+    "紹绍 綿绵 緩缓 緯纬 縱纵 織织 羨羡 膠胶 臨临 艦舰 莖茎 萊莱 葦苇 蔭荫 薑姜 蘋苹 "
+    "虧亏 蝦虾 蠔蚝 衝冲 裝装 製制 觸触 詠咏 謙谦 譚谭 豎竖 貓猫 賜赐 贊赞 趕赶 跡迹 "
+    "蹟迹 軌轨 輪轮 輸输 轎轿 辭辞 鄒邹 醬酱 釣钓 鉅巨 銘铭 鋒锋 錫锡 鍾钟 鎢钨 閩闽 "
+    "闆板 隴陇 雖虽 靂雳 靄霭 韋韦 頌颂 頸颈 颱台 飼饲 饒饶 駱骆 騰腾 驛驿 髮发 鬆松 "
+    "魷鱿 鰲鳌 鱷鳄 鳶鸢 鴿鸽 鵑鹃 鵬鹏 鶯莺 鷗鸥 麵面 黴霉 齋斋 齡龄 嶽岳 壩坝 塹堑 "
+    "墳坟 壯壮 奮奋 孫孙 寧宁 將将 專专 尋寻 對对 屬属 岡冈 帶带 師师 彎弯 徑径 從从 "
+    "懷怀 戰战 擴扩 攝摄 敵敌 斷断 於于 時时 晉晋 暢畅 書书 椏桠 極极 構构 標标 樓楼 "
+    "樹树 橫横 檔档 櫻樱 歐欧 歸归 殘残 氣气 決决 沒没 況况 淨净 湯汤 準准 滾滚 漿浆 "
+    "潛潜 瀝沥"
+)
+T2S = str.maketrans({pair[0]: pair[1] for pair in _T2S_PAIRS.split()})
+
+
+def normalize_text(text: str) -> str:
+    """Simplified, half width, lower case and without spaces, for matching"""
+    text = unicodedata.normalize("NFKC", text).translate(T2S).lower()
+    return "".join(text.split())
+
+
+def ngrams(text: str, n: int) -> Set[str]:
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+
+def match_score(query: str, text: str) -> int:
+    """Fuzzy score (0-100) of query within text, both normalized first"""
+    return fuzz.partial_ratio(normalize_text(query), normalize_text(text))
+
+
+class NGramIndex:
+    """
+    Character n-gram inverted index for fuzzy name search.
+
+    A query only scores the documents sharing enough of its n-grams, ranked
+    by the number of shared n-grams, instead of every document.
+    """
+
+    def __init__(self, documents: Iterable[Tuple[Hashable, str]], n: int = 2):
+        self.n = n
+        self.texts: Dict[Hashable, str] = {}
+        self.postings: Dict[str, List[Hashable]] = defaultdict(list)
+        # unigrams too, queries of one character still find something
+        self.unigrams: Dict[str, List[Hashable]] = defaultdict(list)
+        for key, text in documents:
+            normalized = normalize_text(text)
+            self.texts[key] = normalized
+            for gram in ngrams(normalized, n):
+                self.postings[gram].append(key)
+            for char in set(normalized):
+                self.unigrams[char].append(key)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def candidates(
+        self,
+        query: str,
+        max_candidates: int,
+        min_overlap: float = 0.5,
+        accept: Optional[Callable[[Hashable], bool]] = None,
+    ) -> List[Hashable]:
+        """
+        Accepted documents sharing at least `min_overlap` of the n-grams of
+        the normalized query, most shared first
+        """
+        if len(query) < self.n:
+            postings, grams = self.unigrams, set(query)
+        else:
+            postings, grams = self.postings, ngrams(query, self.n)
+        hits: Dict[Hashable, int] = defaultdict(int)
+        for gram in grams:
+            for key in postings.get(gram, ()):
+                hits[key] += 1
+        min_hits = max(1, int(len(grams) * min_overlap))
+        shortlist = [
+            (count, key)
+            for key, count in hits.items()
+            if count >= min_hits and (accept is None or accept(key))
+        ]
+        return [
+            key
+            for _, key in heapq.nlargest(
+                max_candidates, shortlist, key=lambda item: item[0]
+            )
+        ]
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        min_score: int = 80,
+        max_candidates: int = 500,
+        accept: Optional[Callable[[Hashable], bool]] = None,
+    ) -> List[Tuple[Hashable, int]]:
+        """Return up to `limit` (key, score) pairs, best first"""
+        query = normalize_text(query)
+        if not query:
+            return []
+        scored = []
+        for key in self.candidates(query, max_candidates, accept=accept):
+            score = fuzz.partial_ratio(query, self.texts[key])
+            if score >= min_score:
+                scored.append((score, -len(self.texts[key]), key))
+        # higher score first, then the shorter, closer names
+        return [(key, score) for score, _, key in heapq.nlargest(limit, scored)]
@@ -0,0 +1,135 @@
+import csv
+import json
+
+import pytest
+
+from src.cli import batch
+from src.utils.api_exceptions import AuthenticationError
+from src.utils.hotspot_catalog import HotspotCatalog
+
+
+def make_report(report_id, start_time, point_name, handy=False):
+    report = {
+        "id": report_id,
+        "serial_id": f"CR{report_id}",
+        "version": "G3",
+        "start_time": start_time,
+        "end_time": start_time,
+        "province_name": "上海市",
+        "point_name": point_name,
+        "obs": [{"latinname": "Passer montanus", "taxon_count": 2}],
+    }
+    if handy:
+        report["latitude"] = "31.2"
+    return report
+
+
+class FakeBirdreport:
+    reports = []
+    calls = []
+
+    def __init__(self):
+        self.user_info = {"username": "alice"}
+
+    @classmethod
+    async def create(cls, token):
+        if token != "good":
+            raise AuthenticationError("Invalid token")
+        return cls()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def iter_reports(self, start_date="", end_date="", handy=None):
+        self.calls.append((start_date, end_date, handy))
+        for report in self.reports:
+            yield report
+
+
+def run(monkeypatch, capsys, argv):
+    monkeypatch.setattr(batch, "Birdreport", FakeBirdreport)
+    monkeypatch.setattr(
+        batch,
+        "load_export_reference",
+        lambda: batch.ExportReference(
+            None,
+            None,
+            HotspotCatalog([{"L1": {"lat": 31.0, "lng": 121.0, "locName": "公园"}}]),
+            {"公园": "L1"},
+        ),
+    )
+    code = batch.main(argv)
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    return code, events
+
+
+def test_export(monkeypatch, capsys, tmp_path):
+    FakeBirdreport.reports = [
+        make_report(1, "2024-04-30 07:00:00", "公园"),
+        make_report(2, "2024-05-01 07:00:00", "公园"),
+        make_report(3, "2024-05-31 07:00:00", "家"),
+        make_report(4, "2024-06-01 07:00:00", "公园"),
+        make_report(5, "2024-05-02 07:00:00", "公园", handy=True),
+    ]
+    code, events = run(
+        monkeypatch,
+        capsys,
+        [
+            "export",
+            "--token",
+            "good",
+            "--since",
+            "2024-05-01",
+            "--until",
+            "2024-05-31",
+            "--type",
+            "point",
+            "--out",
+            str(tmp_path),
+        ],
+    )
+
+    assert code == batch.EXIT_OK
+    assert FakeBirdreport.calls[-1] == ("2024-05-01", "2024-06-01", False)
+    assert [event["event"] for event in events] == [
+        "start",
+        "warning",
+        "fetched",
+        "warning",
+        "done",
+    ]
+    assert events[3]["unassigned_points"] == ["家"]
+    done = events[-1]
+    assert done["exported"] == 2
+    assert done["stages"]["normalize"]["received"] == 5
+    (path,) = done["files"]
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    assert [row[5] for row in rows] == ["L1", "家"]
+
+
+def test_export_exit_codes(monkeypatch, capsys, tmp_path):
+    code, events = run(
+        monkeypatch, capsys, ["export", "--token", "bad", "--out", str(tmp_path)]
+    )
+    assert code == batch.EXIT_AUTH
+    assert events[-1]["event"] == "error" and events[-1]["code"] == batch.EXIT_AUTH
+
+    FakeBirdreport.reports = [make_report(1, "2024-05-01 07:00:00", "家")]
+    code, events = run(
+        monkeypatch,
+        capsys,
+        ["export", "--token", "good", "--out", str(tmp_path), "--skip-unassigned"],
+    )
+    assert code == batch.EXIT_OK
+    assert events[-1]["exported"] == 0 and events[-1]["files"] == []
+
+
+def test_full_requires_incremental(capsys):
+    with pytest.raises(SystemExit) as e:
+        batch.main(["export", "--full"])
+    assert e.value.code == batch.EXIT_USAGE
+    assert "--incremental" in capsys.readouterr().err
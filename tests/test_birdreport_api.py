@@ -1,8 +1,15 @@
+import asyncio
+import base64
+import json
+
 import pytest
 import respx
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
 from httpx import Response, TimeoutException
 
-from src.birdreport.birdreport import Birdreport
+from src.birdreport.birdreport import AES_IV, AES_KEY, Birdreport
+from src.utils.scheduler import AdaptiveChunkSize
 from src.utils.api_exceptions import (
     ApiError,
     AuthenticationError,
@@ -16,7 +23,7 @@ BIRDREPORT_API_URL = "https://api.birdreport.cn/member/system/user/get"
 @pytest.fixture
 def birdreport_client():
     # We use a dummy token because we are mocking the API responses
-    return Birdreport(token="dummy_token")
+    return Birdreport(token="dummy_token", use_response_cache=False)
 
 
 @pytest.mark.asyncio
@@ -55,9 +62,12 @@ async def test_get_data_server_error_retry(birdreport_client):
         ]
     )
 
+    limit = birdreport_client.scheduler.limit
     user_info = await birdreport_client.member_get_user()
     assert user_info["username"] == "testuser_after_retry"
     assert mock_route.call_count == 3
+    # the retried 500s still reach the scheduler
+    assert birdreport_client.scheduler.limit < limit
 
 
 @pytest.mark.asyncio
@@ -97,3 +107,316 @@ async def test_get_data_api_error_on_bad_json(birdreport_client):
 
     with pytest.raises(ApiError):
         await birdreport_client.member_get_user()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_get_data_reuses_client(birdreport_client):
+    respx.post(BIRDREPORT_API_URL).mock(
+        return_value=Response(200, json={"code": 200, "data": {"username": "testuser"}})
+    )
+
+    await birdreport_client.member_get_user()
+    client = birdreport_client.client
+    await birdreport_client.member_get_user()
+    assert birdreport_client.client is client
+    assert not client.is_closed
+
+    await birdreport_client.aclose()
+    assert client.is_closed
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_context_manager_closes_client():
+    respx.post(BIRDREPORT_API_URL).mock(
+        return_value=Response(200, json={"code": 200, "data": {"username": "testuser"}})
+    )
+
+    async with Birdreport(
+        token="dummy_token", max_connections=2, use_response_cache=False
+    ) as birdreport:
+        await birdreport.member_get_user()
+        client = birdreport.client
+
+    assert client.is_closed
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_get_taxon_info_batch():
+    mock_route = respx.post("https://api.birdreport.cn/front/taxon/get").mock(
+        return_value=Response(200, json={"code": 0, "data": {"name": "大山雀"}})
+    )
+
+    async with Birdreport(
+        token="dummy_token", crypto_use_process=False, use_response_cache=False
+    ) as client:
+        client.rsa_engine.chunk_size = 2
+        res = await client.get_taxon_info_batch([1, 2, 3, 4, 5])
+
+    assert len(res) == 5
+    assert mock_route.call_count == 5
+    assert all(
+        "sign" in call.request.headers and call.request.content
+        for call in mock_route.calls
+    )
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_get_data_decode_offloaded():
+    reports = [{"id": i, "point_name": "上海科技大学"} for i in range(200)]
+    cipher = AES.new(AES_KEY, AES.MODE_CBC, iv=AES_IV)
+    encrypted = cipher.encrypt(pad(json.dumps(reports).encode("utf-8"), AES.block_size))
+    respx.post("https://api.birdreport.cn/member/system/activity/search").mock(
+        return_value=Response(
+            200, json={"code": 0, "data": base64.b64encode(encrypted).decode()}
+        )
+    )
+
+    async with Birdreport(
+        token="dummy_token", crypto_use_process=False, decode_offload_threshold=0
+    ) as client:
+        res = await client.member_search(1, 200)
+
+    assert res == reports
+
+
+@pytest.mark.asyncio
+async def test_get_all_report_url_list_keeps_page_order(birdreport_client):
+    calls = []
+
+    async def report_api(page, limit, **kwargs):
+        calls.append(page)
+        # later pages answer first
+        await asyncio.sleep(0.01 * (10 - page))
+        # probed past the last page, the error is dropped
+        if page == 7:
+            raise ServerError("Server error: 500")
+        if page > 5:
+            return []
+        size = limit if page < 5 else limit // 2
+        return [{"id": (page, i)} for i in range(size)]
+
+    reports = await birdreport_client.get_all_report_url_list(
+        {}, report_api, limit=4, window=3
+    )
+
+    assert [report["id"] for report in reports] == [
+        (page, i) for page in range(1, 6) for i in range(4 if page < 5 else 2)
+    ]
+    assert sorted(calls) == sorted(set(calls))
+    assert 7 in calls and max(calls) <= 5 + 3
+
+
+@pytest.mark.asyncio
+async def test_get_all_report_url_list_raises_failed_page(birdreport_client):
+    calls = []
+
+    async def report_api(page, limit, **kwargs):
+        calls.append(page)
+        if page == 2:
+            raise ServerError("Server error: 500")
+        return [{"id": page}] * limit
+
+    pages = []
+    with pytest.raises(ServerError):
+        async for page in birdreport_client.iter_report_pages(
+            {}, report_api, limit=2, window=3
+        ):
+            pages.append(page)
+    # retried by get_data, not again here, and no probing after the failure
+    assert pages == [[{"id": 1}] * 2]
+    assert calls.count(2) == 1 and max(calls) <= 4
+
+
+@pytest.mark.asyncio
+async def test_get_excel_chunked_splits_failing_chunks(birdreport_client):
+    chunks = []
+
+    async def excel_api(ids):
+        chunks.append(list(ids))
+        # later chunks answer first
+        await asyncio.sleep(0.001 * (100 - ids[0]) / 10)
+        if len(ids) > 4:
+            raise NetworkError("Network error: timed out")
+        return [{"activity_id": i, "n": n} for i in ids for n in range(2)]
+
+    chunk_size = AdaptiveChunkSize(8, minimum=1, maximum=8)
+    rows = await birdreport_client.get_excel_chunked(
+        excel_api, list(range(30)), chunk_size=chunk_size
+    )
+
+    assert rows == [{"activity_id": i, "n": n} for i in range(30) for n in range(2)]
+    # the failing chunks of 8 were split into ones of 4
+    assert max(len(chunk) for chunk in chunks) == 8
+    assert [len(chunk) for chunk in chunks].count(4) >= 2
+
+
+@pytest.mark.asyncio
+async def test_get_excel_chunked_growing_chunks_keep_the_window():
+    client = Birdreport(token="dummy_token", use_response_cache=False, max_rps=None)
+
+    async def small_request(i):
+        await asyncio.sleep(0.002)
+
+    await client.scheduler.map(small_request, range(40))
+    concurrency = client.scheduler.concurrency
+    chunk_lengths = []
+
+    async def excel_api(ids):
+        chunk_lengths.append(len(ids))
+        # the latency follows the chunk size, not the server load
+        await asyncio.sleep(0.0001 * len(ids))
+        return [{"activity_id": i} for i in ids]
+
+    chunk_size = AdaptiveChunkSize(
+        10, minimum=10, maximum=1000, target_latency=0.05, target_rows=10000
+    )
+    rows = await client.get_excel_chunked(
+        excel_api, list(range(3000)), chunk_size=chunk_size
+    )
+
+    assert len(rows) == 3000
+    assert max(chunk_lengths) >= 100
+    assert client.excel_scheduler.concurrency >= 4
+    assert client.scheduler.concurrency == concurrency
+
+
+@pytest.mark.asyncio
+async def test_get_excel_chunked_gives_up_on_single_id(birdreport_client):
+    async def excel_api(ids):
+        if 3 in ids:
+            raise ServerError("Server error: 500")
+        return [{"activity_id": i} for i in ids]
+
+    with pytest.raises(ServerError):
+        await birdreport_client.get_excel_chunked(
+            excel_api, list(range(10)), chunk_size=AdaptiveChunkSize(4)
+        )
+
+
+@pytest.mark.asyncio
+async def test_member_get_reports_runs_branches_concurrently(birdreport_client):
+    running = set()
+    overlapped = False
+
+    def search(kind):
+        async def report_api(page, limit, **kwargs):
+            nonlocal overlapped
+            running.add(kind)
+            overlapped = overlapped or len(running) == 2
+            await asyncio.sleep(0.01)
+            running.discard(kind)
+            offset = 0 if kind == "point" else 100
+            return [{"id": offset + i, "start_time": "2024-05-01"} for i in range(3)]
+
+        return report_api
+
+    async def point_excel(ids):
+        return [{"activity_id": i} for i in ids]
+
+    async def handy_excel(ids):
+        return [
+            {"activity_id": i, "latitude": "31.2", "longitude": "121.5"} for i in ids
+        ]
+
+    birdreport_client.member_search = search("point")
+    birdreport_client.member_handy_search = search("handy")
+    birdreport_client.member_get_excel = point_excel
+    birdreport_client.member_handy_get_excel = handy_excel
+
+    reports = await birdreport_client.member_get_reports()
+
+    assert overlapped
+    assert [report["id"] for report in reports] == [0, 1, 2, 100, 101, 102]
+    assert reports[0]["obs"] == [{"activity_id": 0}]
+    assert reports[3]["point_name"] == "随手记地点-2024-05-01"
+
+
+@pytest.mark.asyncio
+async def test_iter_reports_streams_with_backpressure(birdreport_client):
+    excel_calls = []
+
+    def search(offset, total):
+        async def report_api(page, limit, **kwargs):
+            start = (page - 1) * limit
+            return [
+                {"id": offset + i, "start_time": "2024-05-01"}
+                for i in range(start, min(start + limit, total))
+            ]
+
+        return report_api
+
+    def excel(extra):
+        async def excel_api(ids):
+            excel_calls.append(list(ids))
+            await asyncio.sleep(0)
+            return [{"activity_id": i, **extra} for i in ids]
+
+        return excel_api
+
+    birdreport_client.member_search = search(0, 1000)
+    birdreport_client.member_handy_search = search(10000, 5)
+    birdreport_client.member_get_excel = excel({})
+    birdreport_client.member_handy_get_excel = excel(
+        {"latitude": "31.2", "longitude": "121.5"}
+    )
+
+    reports = birdreport_client.iter_reports(queue_size=2)
+    first = await reports.__anext__()
+    assert first["obs"] == [{"activity_id": first["id"], **first["obs"][0]}]
+    await asyncio.sleep(0.05)
+    # the fetching waits for the consumer instead of running ahead
+    assert sum(len(chunk) for chunk in excel_calls) < 1005
+    await reports.aclose()
+
+    reports = [report async for report in birdreport_client.iter_reports()]
+    assert sorted(report["id"] for report in reports) == list(range(1000)) + list(
+        range(10000, 10005)
+    )
+    handy = [report for report in reports if report["id"] >= 10000]
+    assert all(report["latitude"] == "31.2" for report in handy)
+
+
+@pytest.mark.asyncio
+async def test_iter_reports_raises_branch_errors(birdreport_client):
+    async def report_api(page, limit, **kwargs):
+        return [{"id": 1, "start_time": "2024-05-01"}]
+
+    async def excel_api(ids):
+        raise ApiError("API error: 400")
+
+    birdreport_client.member_search = report_api
+    birdreport_client.member_handy_search = report_api
+    birdreport_client.member_get_excel = excel_api
+    birdreport_client.member_handy_get_excel = excel_api
+
+    with pytest.raises(ApiError):
+        async for _ in birdreport_client.iter_reports():
+            pass
+
+
+@pytest.mark.asyncio
+async def test_iter_taxon_from_reports_bounds_in_flight(birdreport_client):
+    running = 0
+    peak = 0
+
+    async def attach(report, is_member):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+        report["obs"] = [report["id"]]
+        return report
+
+    birdreport_client._attach_detail_and_taxon = attach
+    reports = [{"id": i} for i in range(20)]
+    done = [
+        report
+        async for report in birdreport_client.iter_taxon_from_reports(reports, window=3)
+    ]
+    assert sorted(report["id"] for report in done) == list(range(20))
+    assert peak <= 3
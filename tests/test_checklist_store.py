@@ -0,0 +1,83 @@
+import json
+
+from src.utils.checklist_store import ChecklistStore
+
+
+def make_report(report_id, start_time, n_obs=2, handy=False, **fields):
+    report = {
+        "id": report_id,
+        "serial_id": f"S{report_id}",
+        "version": "CH4",
+        "start_time": start_time,
+        "province_name": "上海市",
+        "point_name": f"地点{report_id}",
+        "obs": [{"taxon_name": f"鸟{i}", "taxon_count": i} for i in range(n_obs)],
+        **fields,
+    }
+    if handy:
+        report["latitude"] = "31.2"
+        report["longitude"] = "121.5"
+    return report
+
+
+def test_upsert_and_get(tmp_path):
+    store = ChecklistStore(tmp_path / "checklists.sqlite3")
+    reports = [make_report(i, f"2024-05-0{i} 07:00:00") for i in range(1, 4)]
+    assert store.upsert_reports("alice", reports) == 3
+    assert store.count("alice") == 3 and store.count("bob") == 0
+
+    assert store.get_reports([3, 1]) == [reports[2], reports[0]]
+    # the caller's reports are left as they were
+    assert len(reports[0]["obs"]) == 2
+
+    # fetched again, the report and its observations are replaced
+    store.upsert_reports("alice", [make_report(2, "2024-05-02 08:00:00", n_obs=1)])
+    assert store.count("alice") == 3
+    (report,) = store.get_reports([2])
+    assert report["start_time"] == "2024-05-02 08:00:00"
+    assert len(report["obs"]) == 1
+
+    store.clear("alice")
+    assert store.count("alice") == 0
+    assert store.get_reports([1]) == []
+    store.close()
+
+
+def test_search(tmp_path):
+    store = ChecklistStore(tmp_path / "checklists.sqlite3")
+    store.upsert_reports(
+        "alice",
+        [
+            make_report(1, "2024-05-03 07:00:00"),
+            make_report(2, "2024-05-01 07:00:00", handy=True),
+            make_report(3, "2024-06-01 07:00:00", province_name="北京市"),
+            make_report(4, "2024-05-02 07:00:00", version="G3"),
+        ],
+    )
+    store.upsert_reports("bob", [make_report(5, "2024-05-01 07:00:00")])
+
+    def ids(**kwargs):
+        return [report.id for report in store.search("alice", **kwargs)]
+
+    assert ids() == [2, 4, 1, 3]
+    assert ids(version="CH4", is_handy=False) == [1, 3]
+    assert ids(is_handy=True) == [2]
+    assert ids(start_time="2024-05-02", end_time="2024-06-01") == [4, 1]
+    assert ids(province_names=["北京市"]) == [3]
+    assert store.search("alice", point_name="地点1")[0].serial_id == "S1"
+    store.close()
+
+
+def test_import_snapshot(tmp_path):
+    store = ChecklistStore(tmp_path / "checklists.sqlite3")
+    snapshot = tmp_path / "alice_2024-05-10_checklists.json"
+    with open(snapshot, "w", encoding="utf-8") as f:
+        json.dump([make_report(1, "2024-05-01 07:00:00")], f, ensure_ascii=False)
+
+    assert store.last_update_date("alice") is None
+    assert store.import_snapshot("alice", snapshot) == 1
+    assert store.last_update_date("alice") == "2024-05-10"
+    store.set_last_update_date("alice", "2024-06-01")
+    store.import_snapshot("alice", snapshot)
+    assert store.last_update_date("alice") == "2024-06-01"
+    store.close()
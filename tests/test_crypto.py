@@ -0,0 +1,70 @@
+import base64
+
+import pytest
+from Crypto.Cipher import AES, PKCS1_v1_5
+from Crypto.PublicKey import RSA
+from Crypto.Util.Padding import pad
+
+from src.utils.aes_cbc import AESCBCCipher
+from src.utils.long_rsa import LongRSAEncryptEngine, LongRSAKey, split_utf8
+
+AES_KEY = b"0123456789abcdef0123456789abcdef"
+AES_IV = b"fedcba9876543210"
+
+
+@pytest.fixture
+def private_key():
+    return RSA.generate(1024)
+
+
+@pytest.fixture
+def public_key_path(tmp_path, private_key):
+    key_path = tmp_path / "public_key.pem"
+    key_path.write_bytes(private_key.publickey().export_key())
+    return key_path
+
+
+def rsa_decrypt(private_key, text: str) -> str:
+    # every 128-byte block is decrypted separately, like the server does
+    cipher = PKCS1_v1_5.new(private_key)
+    data = base64.b64decode(text)
+    return b"".join(
+        cipher.decrypt(data[i : i + 128], None) for i in range(0, len(data), 128)
+    ).decode("utf-8")
+
+
+def test_split_utf8_keeps_characters():
+    data = ("上海" * 100).encode("utf-8")
+    pieces = split_utf8(data, 117)
+    assert b"".join(pieces) == data
+    assert all(len(piece) <= 117 for piece in pieces)
+    for piece in pieces:
+        piece.decode("utf-8")
+
+
+def test_encrypt_long_chinese_message(public_key_path, private_key):
+    key = LongRSAKey(public_key_path)
+    message = '{"keywords":"' + "上海科技大学" * 30 + '"}'
+    assert rsa_decrypt(private_key, key.encrypt(message)) == message
+
+
+@pytest.mark.parametrize("use_process", [False, True])
+def test_encrypt_engine_keeps_order(public_key_path, private_key, use_process):
+    engine = LongRSAEncryptEngine(
+        public_key_path, chunk_size=2, use_process=use_process
+    )
+    messages = [f'{{"id":"{i}"}}' for i in range(7)]
+    encrypted = engine.encrypt_batch(messages)
+    engine.shutdown()
+
+    assert [rsa_decrypt(private_key, text) for text in encrypted] == messages
+
+
+@pytest.mark.parametrize("size", [1, 100, 10000])
+def test_aes_cbc_cipher_reusable(size):
+    cipher = AESCBCCipher(AES_KEY, AES_IV)
+    for message in ["小" * size, "b" * size]:
+        encrypted = AES.new(AES_KEY, AES.MODE_CBC, iv=AES_IV).encrypt(
+            pad(message.encode("utf-8"), AES.block_size)
+        )
+        assert cipher.decrypt_text(base64.b64encode(encrypted)) == message
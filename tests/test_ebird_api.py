@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 import respx
 from httpx import Response, TimeoutException
@@ -16,7 +18,7 @@ EBIRD_API_URL = "https://api.ebird.org/v2/ref/region/list/subnational1/CN"
 @pytest.fixture
 def ebird_client():
     # We use a dummy token because we are mocking the API responses
-    return EBird(token="dummy_token")
+    return EBird(token="dummy_token", use_response_cache=False)
 
 
 @pytest.mark.asyncio
@@ -93,3 +95,40 @@ async def test_call_api_error_on_bad_json(ebird_client):
 
     with pytest.raises(ApiError):
         await ebird_client.get_regions(RegionType.SUBNATIONAL1, "CN")
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_get_hotspots_by_regions(ebird_client):
+    for region in ["CN", "TW", "HK", "MO"]:
+        respx.get(f"https://api.ebird.org/v2/ref/hotspot/{region}").mock(
+            return_value=Response(
+                200, json=[{"locId": f"L{region}", "locName": region}]
+            )
+        )
+
+    res = await ebird_client.get_hotspots_by_regions(
+        ["CN", "TW", "HK", "MO"], max_concurrency=2
+    )
+    assert list(res.keys()) == ["CN", "TW", "HK", "MO"]
+    assert res["HK"][0]["locId"] == "LHK"
+
+    await ebird_client.aclose()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_call_rate_limited_honours_retry_after(ebird_client):
+    mock_route = respx.get(EBIRD_API_URL).mock(
+        side_effect=[
+            Response(429, headers={"Retry-After": "0.2"}),
+            Response(200, json=[{"name": "Beijing_after_429"}]),
+        ]
+    )
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    regions = await ebird_client.get_regions(RegionType.SUBNATIONAL1, "CN")
+    assert regions[0]["name"] == "Beijing_after_429"
+    assert mock_route.call_count == 2
+    assert 0.2 <= loop.time() - start < 1
@@ -0,0 +1,84 @@
+import csv
+
+import pytest
+
+from src.utils.ebird_export import (
+    apply_location_assign,
+    export_reports,
+    iter_ebird_rows,
+    write_rotating_csv,
+)
+
+
+def make_report(serial_id, n_obs):
+    return {
+        "serial_id": serial_id,
+        "version": "G3",
+        "start_time": "2024-05-01 06:00:00",
+        "end_time": "2024-05-01 08:30:00",
+        "province_name": "上海市",
+        "point_name": "上海科技大学",
+        "obs": [
+            {"latinname": "Passer montanus", "taxon_count": i + 2} for i in range(n_obs)
+        ],
+    }
+
+
+def test_iter_ebird_rows():
+    rows = [row for group in iter_ebird_rows([make_report("CR1", 2)]) for row in group]
+    assert len(rows) == 2
+    assert rows[0][1:4] == ("Passer", "montanus", 2)
+    assert rows[0][8:10] == ("05/01/2024", "06:00")
+    assert rows[0][14] == 150
+    assert rows[0][-1] == "Converted from BirdReport CN, report ID: CR1"
+
+
+def test_write_rotating_csv_keeps_reports_whole(tmp_path):
+    reports = [make_report(f"CR{i}", 3) for i in range(5)]
+    paths = write_rotating_csv(
+        iter_ebird_rows(reports), lambda i: tmp_path / f"out_{i}.csv", max_rows=4
+    )
+
+    assert [path.name for path in paths] == ["out_0.csv", "out_1.csv", "out_2.csv"]
+    counts = []
+    for path in paths:
+        with open(path, encoding="utf-8", newline="") as f:
+            counts.append(len(list(csv.reader(f))))
+    assert counts == [6, 6, 3]
+
+
+@pytest.mark.asyncio
+async def test_export_reports_streams_to_csv(tmp_path):
+    async def reports():
+        for i in range(5):
+            report = make_report(f"CR{i}", 3)
+            report["point_name"] = "家" if i % 2 else "公园"
+            yield report
+
+    location_assign = {"家": {"lat": 31.2, "lng": 121.5}, "公园": "L123"}
+    hotspot_catalog = {"L123": {"lat": 31.0, "lng": 121.0}}
+    paths, stats = await export_reports(
+        reports(),
+        lambda i: tmp_path / f"out_{i}.csv",
+        location_assign=location_assign,
+        hotspot_catalog=hotspot_catalog,
+        keep=lambda report: report["serial_id"] != "CR4",
+        max_rows=4,
+    )
+
+    assert [path.name for path in paths] == ["out_0.csv", "out_1.csv"]
+    rows = []
+    for path in paths:
+        with open(path, encoding="utf-8", newline="") as f:
+            rows.extend(csv.reader(f))
+    assert len(rows) == 12
+    assert rows[0][5:8] == ["L123", "31.0", "121.0"]
+    assert rows[3][5:8] == ["家", "31.2", "121.5"]
+    assert stats["normalize"].emitted == 4
+    assert stats["write"].received == 4
+
+
+def test_apply_location_assign_skips_unknown_hotspots():
+    report = make_report("CR1", 1)
+    assert not apply_location_assign(report, {"上海科技大学": "L404"}, {})
+    assert report["point_name"] == "上海科技大学" and "lat" not in report
@@ -0,0 +1,65 @@
+from src.utils.hotspot_catalog import HotspotCatalog
+
+CN_HOTSPOTS = {
+    "L1": {"locId": "L1", "locName": "南汇东滩", "subnational1Code": "CN-31"},
+    "L2": {"locId": "L2", "locName": "滴水湖", "subnational1Code": "CN-31"},
+    "L3": {"locId": "L3", "locName": "滇池海口", "subnational1Code": "CN-53"},
+}
+OTHER_HOTSPOTS = {
+    "L4": {"locId": "L4", "locName": "#11觀音重要濕地", "subnational1Code": "TW-TAO"},
+}
+
+
+def test_partitions():
+    catalog = HotspotCatalog([CN_HOTSPOTS, None, OTHER_HOTSPOTS])
+    assert len(catalog) == 4
+    assert "L4" in catalog
+    assert catalog.get("L3")["locName"] == "滇池海口"
+    assert set(catalog.region("CN-31")) == {"L1", "L2"}
+    assert catalog.region("CN-11") == {}
+
+
+def test_search_within_region():
+    catalog = HotspotCatalog([CN_HOTSPOTS, OTHER_HOTSPOTS])
+    assert [h["locId"] for h, _ in catalog.search("TW-TAO", "观音重要湿地")] == ["L4"]
+    assert catalog.search("CN-53", "滴水湖") == []
+    assert catalog.search_index("CN-31") is catalog.search_index("CN-31")
+
+
+def test_suggest_ranks_nearby_first():
+    hotspots = {
+        "A": {
+            "locId": "A",
+            "locName": "世纪公园",
+            "subnational1Code": "CN-31",
+            "lat": 31.2165,
+            "lng": 121.5486,
+        },
+        "B": {
+            "locId": "B",
+            "locName": "世纪公园",
+            "subnational1Code": "CN-31",
+            "lat": 31.50,
+            "lng": 121.20,
+        },
+        "C": {
+            "locId": "C",
+            "locName": "上海科技大学",
+            "subnational1Code": "CN-31",
+            "lat": 31.18,
+            "lng": 121.59,
+        },
+    }
+    catalog = HotspotCatalog([hotspots])
+
+    suggestions = catalog.suggest("CN-31", "世纪公园", coordinates=(31.2170, 121.5480))
+    assert [h["locId"] for h, _, _ in suggestions] == ["A", "B", "C"]
+    assert suggestions[0][2] < 0.1
+    assert catalog.nearest(31.18, 121.59, k=1)[0][0]["locId"] == "C"
+    assert [h["locId"] for h, _ in catalog.within(31.2170, 121.5480, 10)] == ["A", "C"]
+
+    # without coordinates only the name matches
+    assert {h["locId"] for h, _, d in catalog.suggest("CN-31", "世纪公园")} == {
+        "A",
+        "B",
+    }
@@ -0,0 +1,15 @@
+import json.decoder
+
+from src.utils.lazy_import import lazy_import
+
+
+def test_imports_on_first_use():
+    loaded = []
+    module = lazy_import("json.decoder", on_load=loaded.append)
+    assert not module.is_loaded and loaded == []
+
+    assert module.JSONDecoder is json.decoder.JSONDecoder
+    assert module.is_loaded and loaded == [json.decoder]
+
+    module.JSONDecodeError
+    assert loaded == [json.decoder]
@@ -0,0 +1,75 @@
+from src.utils.hotspot_catalog import HotspotCatalog
+from src.utils.location_matcher import (
+    LocationMatcher,
+    LocationPoint,
+    name_similarity,
+)
+
+HOTSPOTS = {
+    "A": {
+        "locId": "A",
+        "locName": "世纪公园 (Century Park)",
+        "subnational1Code": "CN-31",
+        "lat": 31.2165,
+        "lng": 121.5486,
+        "numChecklistsAllTime": 1200,
+    },
+    "B": {
+        "locId": "B",
+        "locName": "世纪公园",
+        "subnational1Code": "CN-31",
+        "lat": 31.50,
+        "lng": 121.20,
+        "numChecklistsAllTime": 3,
+    },
+    "C": {
+        "locId": "C",
+        "locName": "南汇东滩--滴水湖 (Nanhui Dongtan--Dishui Lake)",
+        "subnational1Code": "CN-31",
+        "lat": 30.90,
+        "lng": 121.93,
+    },
+    "D": {
+        "locId": "D",
+        "locName": "#11觀音重要濕地",
+        "subnational1Code": "TW-TAO",
+        "lat": 25.03,
+        "lng": 121.08,
+    },
+}
+
+
+def test_name_similarity():
+    assert (
+        name_similarity("滴水湖", "南汇东滩--滴水湖 (Nanhui Dongtan--Dishui Lake)") == 1
+    )
+    assert name_similarity("世纪公园", "滇池海口") == 0
+
+
+def test_match_with_coordinates():
+    matcher = LocationMatcher(HotspotCatalog([HOTSPOTS]))
+    match = matcher.match(LocationPoint("世纪公园", "CN-31", (31.2170, 121.5480)))
+    assert match.best == "A"
+    assert match.confident
+
+    match = matcher.match(LocationPoint("滴水湖", "CN-31", (30.901, 121.931)))
+    assert match.best == "C"
+    assert match.confident
+
+
+def test_ambiguous_points_are_left_for_review():
+    matcher = LocationMatcher(HotspotCatalog([HOTSPOTS]))
+    # two hotspots share the name and nothing tells them apart
+    match = matcher.match(LocationPoint("世纪公园", "CN-31"))
+    assert {loc_id for loc_id, _ in match.candidates} == {"A", "B"}
+    assert not match.confident
+
+    matches = matcher.match_all(
+        [
+            LocationPoint("观音重要湿地", "TW-TAO"),
+            LocationPoint("不存在的地点", "CN-31", (40.0, 116.0)),
+        ]
+    )
+    assert matches["观音重要湿地"].best == "D"
+    assert matches["不存在的地点"].best is None
+    assert not matches["不存在的地点"].confident
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from src.utils.pipeline import Pipeline, Stage
+
+
+@pytest.mark.asyncio
+async def test_pipeline_streams_through_bounded_queues():
+    produced = 0
+    peak_ahead = 0
+    written = []
+
+    async def source():
+        nonlocal produced
+        for i in range(50):
+            produced += 1
+            yield i
+
+    def double(item):
+        return item * 2
+
+    def drop_odd_tens(item):
+        return None if item % 20 == 10 else item
+
+    async def write(item):
+        nonlocal peak_ahead
+        peak_ahead = max(peak_ahead, produced - len(written))
+        await asyncio.sleep(0.001)
+        written.append(item)
+        return item
+
+    pipeline = Pipeline(
+        source(),
+        [
+            Stage("double", double),
+            Stage("filter", drop_odd_tens, threaded=True),
+            Stage("write", write),
+        ],
+        queue_size=2,
+    )
+    stats = await pipeline.run()
+
+    assert written == [i * 2 for i in range(50) if i * 2 % 20 != 10]
+    # the source never runs far ahead of the slow writer
+    assert peak_ahead < 20
+    assert stats["source"].emitted == 50
+    assert stats["filter"].received == 50
+    assert stats["filter"].emitted == len(written)
+    assert stats["write"].throughput > 0
+
+
+@pytest.mark.asyncio
+async def test_pipeline_concurrency_and_errors():
+    running = 0
+    peak = 0
+
+    async def slow(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+        return item
+
+    results = []
+    await Pipeline(
+        range(20), [Stage("slow", slow, concurrency=4), Stage("sink", results.append)]
+    ).run()
+    assert sorted(results) == list(range(20)) and peak == 4
+
+    def fail(item):
+        if item == 5:
+            raise ValueError(item)
+        return item
+
+    with pytest.raises(ValueError):
+        await Pipeline(range(100), [Stage("fail", fail)], queue_size=1).run()
@@ -0,0 +1,52 @@
+import asyncio
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.utils.rate_limit import TokenBucket, parse_retry_after
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = TokenBucket(rate=10, capacity=3)
+    waits = [bucket.reserve() for _ in range(5)]
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert 0.09 < waits[3] <= 0.1
+    assert 0.19 < waits[4] <= 0.2
+
+
+def test_token_bucket_penalize_holds_callers():
+    bucket = TokenBucket(rate=10, capacity=3)
+    bucket.penalize(2)
+    assert bucket.reserve() > 1.9
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_concurrent_penalties_do_not_add_up():
+    bucket = TokenBucket(rate=10, capacity=3)
+
+    async def throttled():
+        # a 429 with the same Retry-After for every request in flight
+        await asyncio.sleep(0)
+        bucket.penalize(5)
+
+    await asyncio.gather(*[throttled() for _ in range(8)])
+    assert 4.9 < bucket.reserve() <= 5.0
+
+    bucket = TokenBucket(rate=10, capacity=3)
+    for _ in range(8):
+        bucket.penalize(0.2)
+    start = time.monotonic()
+    await bucket.acquire()
+    assert 0.19 < time.monotonic() - start < 0.3
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("not a date") is None
+
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 30
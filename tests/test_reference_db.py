@@ -0,0 +1,117 @@
+import json
+import os
+
+from src.utils.hotspot_catalog import HotspotCatalog
+from src.utils.reference_db import ReferenceDatabase
+
+CN_HOTSPOTS = {
+    "L1": {"locId": "L1", "locName": "南汇东滩", "subnational1Code": "CN-31"},
+    "L2": {"locId": "L2", "locName": "滴水湖", "subnational1Code": "CN-31"},
+}
+
+
+def write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def test_sync_and_lookup(tmp_path):
+    write_json(
+        tmp_path / "ebird_cn_hotspots.json",
+        {"last_update_date": "2025-01-01", "data": CN_HOTSPOTS},
+    )
+    write_json(
+        tmp_path / "ebird_taxonomy.json",
+        [
+            {
+                "sciName": "Parus minor",
+                "comName": "Japanese Tit",
+                "speciesCode": "japtit2",
+            }
+        ],
+    )
+    db = ReferenceDatabase(tmp_path / "reference.sqlite3", tmp_path)
+    db.sync()
+
+    hotspots = db.hotspots("ebird_cn_hotspots")
+    assert len(hotspots) == 2
+    assert "L2" in hotspots and "L9" not in hotspots
+    assert hotspots["L2"]["locName"] == "滴水湖"
+    assert hotspots["L2"] is hotspots["L2"]
+    assert list(hotspots) == ["L1", "L2"]
+    assert db.last_update_date("ebird_cn_hotspots") == "2025-01-01"
+    assert db.ebird_taxonomy()["Parus minor"]["comName"] == "Japanese Tit"
+    # missing json files
+    assert db.hotspots("ebird_other_hotspots") is None
+    assert db.birdreport_taxon_infos("Z4") is None
+
+    catalog = HotspotCatalog([hotspots])
+    assert [h["locId"] for h, _ in catalog.search("CN-31", "滴水湖")] == ["L2"]
+    db.close()
+
+    # the compiled rows persist, no sync needed to read them
+    db = ReferenceDatabase(tmp_path / "reference.sqlite3", tmp_path)
+    assert len(db.hotspots("ebird_cn_hotspots")) == 2
+    db.close()
+
+
+def test_sync_follows_json_changes(tmp_path):
+    hotspot_file = tmp_path / "ebird_cn_hotspots.json"
+    # old format, keyed by subnational1Code|locName
+    write_json(
+        hotspot_file,
+        {
+            "last_update_date": "2025-01-01",
+            "data": {f"CN-31|{v['locName']}": v for v in CN_HOTSPOTS.values()},
+        },
+    )
+    db = ReferenceDatabase(tmp_path / "reference.sqlite3", tmp_path)
+    db.sync()
+    assert set(db.hotspots("ebird_cn_hotspots")) == {"L1", "L2"}
+
+    write_json(
+        hotspot_file,
+        {"last_update_date": "2025-02-01", "data": {"L1": CN_HOTSPOTS["L1"]}},
+    )
+    db.sync()
+    assert set(db.hotspots("ebird_cn_hotspots")) == {"L1"}
+    assert db.last_update_date("ebird_cn_hotspots") == "2025-02-01"
+
+    os.remove(hotspot_file)
+    db.sync()
+    assert db.hotspots("ebird_cn_hotspots") is None
+    db.close()
+
+
+def test_birdreport_taxon_infos(tmp_path):
+    write_json(
+        tmp_path / "birdreport_taxon_infos.json",
+        {
+            "G3": {"1": {"id": 1, "name": "大山雀"}},
+            "Z4": {
+                "1": {"id": 1, "name": "花尾榛鸡"},
+                "2": {"id": 2, "name": "斑尾榛鸡"},
+            },
+        },
+    )
+    db = ReferenceDatabase(tmp_path / "reference.sqlite3", tmp_path)
+    db.sync()
+    z4 = db.birdreport_taxon_infos("Z4")
+    assert dict(z4.items()) == {
+        "1": {"id": 1, "name": "花尾榛鸡"},
+        "2": {"id": 2, "name": "斑尾榛鸡"},
+    }
+    assert db.birdreport_taxon_infos("G3")["1"]["name"] == "大山雀"
+    db.close()
+
+
+def test_broken_file_is_rebuilt(tmp_path):
+    (tmp_path / "reference.sqlite3").write_bytes(b"not a database" * 100)
+    write_json(
+        tmp_path / "ebird_cn_hotspots.json",
+        {"last_update_date": "2025-01-01", "data": CN_HOTSPOTS},
+    )
+    db = ReferenceDatabase(tmp_path / "reference.sqlite3", tmp_path)
+    db.sync()
+    assert len(db.hotspots("ebird_cn_hotspots")) == 2
+    db.close()
@@ -0,0 +1,123 @@
+import copy
+
+import pytest
+
+from src.birdreport.report_sync import sync_reports, sync_since
+from src.utils.checklist_store import ChecklistStore
+
+
+class FakeBirdreport:
+    def __init__(self, point_reports, handy_reports=()):
+        self.point_reports = list(point_reports)
+        self.handy_reports = list(handy_reports)
+        self.obs = {}
+        self.list_calls = []
+        self.obs_fetched = []
+
+    async def member_list_reports(self, start_date=""):
+        self.list_calls.append(start_date)
+
+        def listed(reports):
+            return [
+                copy.deepcopy(report)
+                for report in reports
+                if report["start_time"] >= start_date
+            ]
+
+        return listed(self.point_reports), listed(self.handy_reports)
+
+    async def member_attach_obs(self, point_reports, handy_reports):
+        reports = point_reports + handy_reports
+        for report in reports:
+            self.obs_fetched.append(report["id"])
+            report["obs"] = copy.deepcopy(self.obs.get(report["id"], []))
+        return reports
+
+
+def make_report(report_id, start_time, province_name="上海市"):
+    return {
+        "id": report_id,
+        "serial_id": f"S{report_id}",
+        "start_time": start_time,
+        "province_name": province_name,
+        "point_name": "p",
+    }
+
+
+def test_sync_since():
+    assert sync_since(None, full=False) == ""
+    assert sync_since("2024-05-31", full=True) == ""
+    assert sync_since("2024-05-31", full=False) == "2024-05-01"
+
+
+@pytest.mark.asyncio
+async def test_only_changed_reports_are_fetched(tmp_path):
+    store = ChecklistStore(tmp_path / "checklists.sqlite3")
+    client = FakeBirdreport(
+        [
+            make_report(1, "2020-01-01 07:00:00"),
+            make_report(2, "2024-05-20 07:00:00"),
+            make_report(3, "2024-05-25 07:00:00", province_name="外国"),
+        ],
+        [make_report(4, "2024-05-30 07:00:00")],
+    )
+    client.obs = {1: [{"taxon_name": "麻雀"}], 2: [{"taxon_name": "喜鹊"}]}
+
+    def keep(report):
+        return report["province_name"] != "外国"
+
+    result = await sync_reports(client, store, "alice", "2024-05-31", keep=keep)
+    assert sorted(result.inserted) == [1, 2, 4]
+    assert result.updated == [] and result.deleted == [] and result.since == ""
+    assert store.count("alice") == 3
+    assert store.get_reports([1])[0]["obs"] == [{"taxon_name": "麻雀"}]
+
+    # nothing changed, the lists are fetched again but no observations
+    client.obs_fetched.clear()
+    result = await sync_reports(client, store, "alice", "2024-06-01", keep=keep)
+    assert not result.changed
+    assert client.obs_fetched == []
+    assert client.list_calls[-1] == "2024-05-01"
+
+    # an edit, a new report and a deletion upstream
+    client.point_reports[1]["point_name"] = "q"
+    client.obs[2] = [{"taxon_name": "乌鸫"}]
+    client.point_reports.append(make_report(5, "2024-06-01 07:00:00"))
+    client.handy_reports.clear()
+    result = await sync_reports(client, store, "alice", "2024-06-02", keep=keep)
+    assert result.inserted == [5]
+    assert result.updated == [2]
+    assert result.deleted == [4]
+    assert sorted(client.obs_fetched) == [2, 5]
+    assert store.get_reports([2])[0]["obs"] == [{"taxon_name": "乌鸫"}]
+    assert store.last_update_date("alice") == "2024-06-02"
+
+    # the report outside the quick sync range is only checked by a full one
+    client.point_reports[0]["point_name"] = "r"
+    result = await sync_reports(client, store, "alice", "2024-06-02")
+    assert result.updated == []
+    result = await sync_reports(client, store, "alice", "2024-06-02", full=True)
+    assert result.updated == [1]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_observation_only_edit_needs_full_sync(tmp_path):
+    store = ChecklistStore(tmp_path / "checklists.sqlite3")
+    client = FakeBirdreport(
+        [make_report(1, "2024-05-20 07:00:00"), make_report(2, "2024-05-25 07:00:00")]
+    )
+    client.obs = {1: [{"taxon_name": "麻雀"}], 2: [{"taxon_name": "喜鹊"}]}
+    await sync_reports(client, store, "alice", "2024-05-31")
+
+    # the summary of the report stays the same
+    client.obs[1] = [{"taxon_name": "麻雀"}, {"taxon_name": "乌鸫"}]
+    client.obs_fetched.clear()
+    result = await sync_reports(client, store, "alice", "2024-05-31")
+    assert not result.changed and client.obs_fetched == []
+
+    result = await sync_reports(client, store, "alice", "2024-05-31", full=True)
+    assert result.updated == [1] and result.inserted == []
+    assert sorted(client.obs_fetched) == [1, 2]
+    assert len(store.get_reports([1])[0]["obs"]) == 2
+    store.close()
@@ -0,0 +1,73 @@
+import os
+import time
+
+import pytest
+import respx
+from httpx import Response
+
+from src.ebird.ebird import EBird, RegionType
+from src.utils.response_cache import ResponseCache
+
+EBIRD_API_URL = "https://api.ebird.org/v2/ref/region/list/subnational1/CN"
+
+
+def test_get_set_and_ttl(tmp_path):
+    cache = ResponseCache(tmp_path)
+    assert cache.get("url", {"a": 1}, ttl=60) == (False, None)
+
+    cache.set("url", {"a": 1}, {"data": [1, 2]})
+    assert cache.get("url", {"a": 1}, ttl=60) == (True, {"data": [1, 2]})
+    # params are normalized, other params are another entry
+    assert cache.get("url", {"a": "1"}, ttl=60)[0]
+    assert not cache.get("url", {"a": 2}, ttl=60)[0]
+    assert not cache.get("url", {"a": 1}, ttl=-1)[0]
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResponseCache(tmp_path)
+    cache.set("url", {"id": 1}, "x" * 100)
+    cache.set("url", {"id": 2}, "x" * 100)
+    # room for two entries
+    entry_size = max(path.stat().st_size for path in tmp_path.glob("*.json"))
+    cache.max_size = 2 * entry_size + 10
+    # make entry 1 older, then use it so that entry 2 is the least recently used
+    old = time.time() - 100
+    for path in tmp_path.glob("*.json"):
+        os.utime(path, (old, old))
+    assert cache.get("url", {"id": 1}, ttl=60)[0]
+
+    cache.set("url", {"id": 3}, "x" * 100)
+    assert cache.get("url", {"id": 1}, ttl=60)[0]
+    assert not cache.get("url", {"id": 2}, ttl=60)[0]
+    assert cache.get("url", {"id": 3}, ttl=60)[0]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_client_uses_cache(tmp_path):
+    route = respx.get(EBIRD_API_URL).mock(
+        return_value=Response(200, json=[{"name": "Beijing"}])
+    )
+    ebird = EBird(token="dummy_token")
+    ebird.response_cache = ResponseCache(tmp_path)
+
+    async with ebird:
+        for _ in range(2):
+            regions = await ebird.get_regions(RegionType.SUBNATIONAL1, "CN")
+            assert regions[0]["name"] == "Beijing"
+        assert route.call_count == 1
+
+        await ebird.get_regions(RegionType.SUBNATIONAL1, "CN", refresh=True)
+        assert route.call_count == 2
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_disabled_cache(tmp_path):
+    route = respx.get(EBIRD_API_URL).mock(
+        return_value=Response(200, json=[{"name": "Beijing"}])
+    )
+    async with EBird(token="dummy_token", use_response_cache=False) as ebird:
+        await ebird.get_regions(RegionType.SUBNATIONAL1, "CN")
+        await ebird.get_regions(RegionType.SUBNATIONAL1, "CN")
+    assert route.call_count == 2
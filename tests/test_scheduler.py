@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+
+from src.utils.api_exceptions import ApiError, ServerError
+from src.utils.scheduler import AdaptiveChunkSize, AdaptiveScheduler
+
+
+@pytest.mark.asyncio
+async def test_map_keeps_order_and_window():
+    scheduler = AdaptiveScheduler(
+        initial_concurrency=3, max_concurrency=3, max_rps=None
+    )
+    running = 0
+    peak = 0
+
+    async def job(i):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001 * (i % 4))
+        running -= 1
+        return i * 2
+
+    assert await scheduler.map(job, range(20)) == [i * 2 for i in range(20)]
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrency_grows_on_success():
+    scheduler = AdaptiveScheduler(
+        initial_concurrency=1, max_concurrency=8, max_rps=None
+    )
+
+    async def job(i):
+        await asyncio.sleep(0)
+
+    await scheduler.map(job, range(30))
+    assert scheduler.concurrency > 1
+
+
+@pytest.mark.asyncio
+async def test_concurrency_shrinks_on_server_error():
+    scheduler = AdaptiveScheduler(
+        initial_concurrency=8, max_concurrency=8, max_rps=None
+    )
+
+    async def job(i):
+        raise ServerError("Server error: 503")
+
+    with pytest.raises(ServerError):
+        await scheduler.run(job, 0)
+    assert scheduler.concurrency == 4
+
+    # other client errors are not a congestion signal
+    async def bad_job(i):
+        raise ApiError("API error: 404")
+
+    with pytest.raises(ApiError):
+        await scheduler.run(bad_job, 0)
+    assert scheduler.concurrency == 4
+
+
+@pytest.mark.asyncio
+async def test_max_rps_spaces_job_starts():
+    scheduler = AdaptiveScheduler(initial_concurrency=4, max_rps=50)
+    loop = asyncio.get_running_loop()
+    starts = []
+
+    async def job(i):
+        starts.append(loop.time())
+
+    await scheduler.map(job, range(6))
+    assert starts[-1] - starts[0] >= 5 / 50 * 0.9
+
+
+def test_chunk_size_follows_rows_and_latency():
+    chunk_size = AdaptiveChunkSize(
+        100, minimum=10, maximum=400, target_latency=1.0, target_rows=1000
+    )
+    # fast and small responses, the size grows up to the maximum
+    for _ in range(10):
+        chunk_size.record(chunk_size.size, 10, 0.1)
+    assert chunk_size.size == 400
+
+    # too many rows per response
+    chunk_size.record(400, 4000, 0.1)
+    assert chunk_size.size < 400
+    # too slow
+    size = chunk_size.size
+    chunk_size.record(size, 10, 10.0)
+    assert chunk_size.size < size
+
+    for _ in range(10):
+        chunk_size.shrink()
+    assert chunk_size.size == 10
+
+
+@pytest.mark.asyncio
+async def test_cancelled_while_paced_frees_the_slot():
+    scheduler = AdaptiveScheduler(initial_concurrency=4, max_rps=1)
+
+    async def job(i):
+        return i
+
+    tasks = [asyncio.create_task(scheduler.run(job, i)) for i in range(3)]
+    await asyncio.sleep(0.01)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_map_runs_a_bounded_set_of_workers():
+    scheduler = AdaptiveScheduler(
+        initial_concurrency=4, max_concurrency=4, max_rps=None
+    )
+    peak_tasks = 0
+
+    async def job(i):
+        nonlocal peak_tasks
+        peak_tasks = max(peak_tasks, len(asyncio.all_tasks()))
+        if i % 7 == 0:
+            raise ServerError("Server error: 503")
+        await asyncio.sleep(0)
+        return i
+
+    results = await scheduler.map(job, range(2000), return_exceptions=True)
+    assert [r for r in results if not isinstance(r, Exception)] == [
+        i for i in range(2000) if i % 7
+    ]
+    assert all(isinstance(results[i], ServerError) for i in range(0, 2000, 7))
+    # the test task and the workers, not a coroutine per item
+    assert peak_tasks <= 1 + 4
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_throttled_shrinks_the_window():
+    scheduler = AdaptiveScheduler(
+        initial_concurrency=8, max_concurrency=8, max_rps=None
+    )
+    scheduler.throttled()
+    assert scheduler.concurrency == 4
+
+
+@pytest.mark.asyncio
+async def test_latency_baseline_follows_recent_jobs():
+    scheduler = AdaptiveScheduler(
+        initial_concurrency=4, max_concurrency=4, max_rps=None, latency_window=8
+    )
+
+    async def job(delay):
+        await asyncio.sleep(delay)
+
+    # cheap jobs set a low baseline, slower ones look like a spike at first
+    await scheduler.map(job, [0.001] * 8)
+    await scheduler.map(job, [0.02] * 4)
+    assert scheduler.concurrency < 4
+
+    # the cheap jobs age out of the window and the window grows again
+    await scheduler.map(job, [0.02] * 40)
+    assert scheduler.min_latency >= 0.015
+    assert scheduler.concurrency == 4
+
+
+@pytest.mark.asyncio
+async def test_latency_signal_can_be_turned_off():
+    scheduler = AdaptiveScheduler(
+        initial_concurrency=4, max_concurrency=4, max_rps=None, latency_tolerance=None
+    )
+
+    async def job(delay):
+        await asyncio.sleep(delay)
+
+    await scheduler.map(job, [0.001, 0.001, 0.03, 0.03])
+    assert scheduler.concurrency == 4
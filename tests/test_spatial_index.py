@@ -0,0 +1,44 @@
+import random
+
+from src.utils.spatial_index import SpatialIndex, haversine, parse_coordinates
+
+
+def test_haversine():
+    assert haversine(31.2, 121.5, 31.2, 121.5) == 0
+    # Shanghai - Beijing
+    assert 1060 < haversine(31.23, 121.47, 39.90, 116.41) < 1075
+
+
+def test_parse_coordinates():
+    assert parse_coordinates("31.2", 121.5) == (31.2, 121.5)
+    assert parse_coordinates("", "") is None
+    assert parse_coordinates(None, 121.5) is None
+    assert parse_coordinates(0, 0) is None
+    assert parse_coordinates(91, 0) is None
+
+
+def test_queries_match_brute_force():
+    rng = random.Random(0)
+    points = [(i, rng.uniform(20, 45), rng.uniform(100, 125)) for i in range(2000)]
+    index = SpatialIndex(points)
+    assert len(index) == 2000
+
+    for _ in range(50):
+        lat, lng = rng.uniform(18, 47), rng.uniform(98, 127)
+        expected = sorted(
+            ((key, haversine(lat, lng, p_lat, p_lng)) for key, p_lat, p_lng in points),
+            key=lambda item: item[1],
+        )
+        assert index.nearest(lat, lng, k=5) == expected[:5]
+        assert index.nearest(lat, lng, k=5, max_distance=50) == [
+            item for item in expected[:5] if item[1] <= 50
+        ]
+        assert index.within(lat, lng, 60) == [
+            item for item in expected if item[1] <= 60
+        ]
+
+
+def test_empty_index():
+    index = SpatialIndex([])
+    assert index.nearest(31, 121) == []
+    assert index.within(31, 121, 10) == []
@@ -0,0 +1,88 @@
+from src.utils.taxon import (
+    ALL_MONTHS,
+    TaxonRule,
+    compile_taxon_map,
+    convert_reports_z4_ebird,
+    convert_taxon_z4_ebird,
+    parse_months,
+)
+
+TAXON_MAP = {
+    "Carduelis carduelis": [
+        {"time": "1-4,9-12", "loc": ["XJ"], "name": "Carduelis carduelis/caniceps"},
+        {"loc": ["YN-保山市"], "name": "Carduelis yunnan"},
+        {"name": "Carduelis caniceps"},
+    ],
+    "Passer montanus": "Passer montanus saturatus",
+}
+
+
+def make_report(province, city, month):
+    return {
+        "province_name": province,
+        "city_name": city,
+        "start_time": f"2024-{month:02d}-01 06:00:00",
+        "obs": [
+            {"latinname": "Carduelis carduelis "},
+            {"latinname": "Passer montanus"},
+            {"latinname": "Pica serica"},
+        ],
+    }
+
+
+def test_parse_months():
+    assert parse_months("3") == 1 << 3
+    assert parse_months("1-2,12") == (1 << 1) | (1 << 2) | (1 << 12)
+    assert parse_months("1-12") == ALL_MONTHS
+
+
+def test_compile_taxon_map():
+    compiled = compile_taxon_map(TAXON_MAP)
+    assert compiled["Passer montanus"] == "Passer montanus saturatus"
+    first, second, last = compiled["Carduelis carduelis"]
+    assert first == TaxonRule(
+        "Carduelis carduelis/caniceps", frozenset(["新疆维吾尔自治区"]), 0b1111000011110
+    )
+    assert second.locs == frozenset(["云南省-保山市"])
+    assert last == TaxonRule("Carduelis caniceps", None, ALL_MONTHS)
+
+
+def test_convert_taxon_z4_ebird():
+    compiled = compile_taxon_map(TAXON_MAP)
+    cases = [
+        (("新疆维吾尔自治区", "", 1), "Carduelis carduelis/caniceps"),
+        (("新疆维吾尔自治区", "", 6), "Carduelis caniceps"),
+        (("云南省", "保山市", 6), "Carduelis yunnan"),
+        (("云南省", "大理白族自治州", 6), "Carduelis caniceps"),
+    ]
+    for args, expected in cases:
+        report = make_report(*args)
+        convert_taxon_z4_ebird(report, compiled)
+        assert [o["latinname"] for o in report["obs"]] == [
+            expected,
+            "Passer montanus saturatus",
+            "Pica serica",
+        ]
+
+    # a raw map is compiled on the fly
+    report = make_report("云南省", "保山市", 6)
+    convert_taxon_z4_ebird(report, TAXON_MAP)
+    assert report["obs"][0]["latinname"] == "Carduelis yunnan"
+
+
+def test_convert_reports_z4_ebird():
+    args = [
+        ("新疆维吾尔自治区", "", 1),
+        ("新疆维吾尔自治区", "", 6),
+        ("云南省", "保山市", 6),
+        ("云南省", "大理白族自治州", 6),
+        ("云南省", "保山市", 6),
+    ]
+    compiled = compile_taxon_map(TAXON_MAP)
+    expected = [make_report(*a) for a in args]
+    for report in expected:
+        convert_taxon_z4_ebird(report, compiled)
+
+    reports = [make_report(*a) for a in args]
+    convert_reports_z4_ebird(reports, compiled)
+    assert reports == expected
@@ -0,0 +1,34 @@
+from src.utils.text_search import NGramIndex, normalize_text
+
+HOTSPOTS = {
+    "L1": "#11觀音重要濕地",
+    "L2": "Universidade de Macau 澳門大學",
+    "L3": "南汇东滩 (Nanhui Dongtan)",
+    "L4": "南汇东滩--滴水湖 (Nanhui Dongtan--Dishui Lake)",
+    "L5": "滴水湖",
+}
+
+
+def test_normalize_text():
+    assert normalize_text("澳門大學") == "澳门大学"
+    assert normalize_text("Ｈｕｔｕｏ River") == "hutuoriver"
+
+
+def test_search_across_scripts():
+    index = NGramIndex(HOTSPOTS.items())
+    assert index.search("观音重要湿地")[0][0] == "L1"
+    assert index.search("澳门大学")[0][0] == "L2"
+    assert index.search("Nanhui dongtan")[0][0] in ("L3", "L4")
+    assert index.search("黄河口") == []
+
+
+def test_search_ranks_and_filters():
+    index = NGramIndex(HOTSPOTS.items())
+    # exact short name before the longer one containing it
+    assert [key for key, _ in index.search("滴水湖")] == ["L5", "L4"]
+    assert [key for key, _ in index.search("滴水湖", limit=1)] == ["L5"]
+    assert [key for key, _ in index.search("滴水湖", accept=lambda k: k != "L5")] == [
+        "L4"
+    ]
+    # single characters use the unigram postings
+    assert {key for key, _ in index.search("湖")} == {"L4", "L5"}